@@ -0,0 +1,105 @@
+import os
+import glob
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Benchmark resolutions (megapixels) and encodings
+MEGAPIXELS = [0.5, 2, 12, 48]
+FORMATS = {
+    "jpeg": ("jpg", {"quality": 90}),
+    "png": ("png", {"compress_level": 1}),
+    "webp": ("webp", {"quality": 90}),
+}
+SOURCES = ["synthetic", "dataset"]
+
+ASPECT = 4 / 3
+SEED = 0
+
+DATASET_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "dataset")
+
+
+def image_size(megapixels, aspect=ASPECT):
+    """(width, height) with the given aspect and about megapixels * 1e6 pixels."""
+    height = int(round((megapixels * 1e6 / aspect) ** 0.5))
+    return int(round(height * aspect)), height
+
+
+def synthetic_image(width, height, seed=SEED):
+    """
+    Deterministic RGB test scene: smooth illumination, hard-edged shapes,
+    a fine texture and sensor-like noise, so every heuristic has structure
+    to work on.
+    """
+    rng = np.random.default_rng(seed)
+
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    y /= height
+    x /= width
+
+    base = np.empty((height, width, 3), dtype=np.float32)
+    for c in range(3):
+        fx, fy, phase = rng.uniform(0.5, 3.0), rng.uniform(0.5, 3.0), rng.uniform(0, np.pi)
+        base[..., c] = 128 + 60 * np.sin(2 * np.pi * fx * x + phase) * np.cos(2 * np.pi * fy * y)
+
+    del x, y
+
+    # Fine texture on top of the gradients
+    base += 8 * np.sin(np.arange(width, dtype=np.float32) * 0.9)[None, :, None]
+
+    scale = min(width, height)
+    for _ in range(24):
+        color = tuple(float(v) for v in rng.uniform(0, 255, 3))
+        cx, cy = int(rng.uniform(0, width)), int(rng.uniform(0, height))
+        size = int(rng.uniform(0.02, 0.12) * scale)
+        if rng.random() < 0.5:
+            cv2.circle(base, (cx, cy), size, color, thickness=-1, lineType=cv2.LINE_AA)
+        else:
+            cv2.rectangle(base, (cx, cy), (cx + size, cy + size // 2), color, thickness=-1)
+
+    base += rng.standard_normal(base.shape, dtype=np.float32) * 3.0
+
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+
+
+def dataset_image(width, height, dataset_dir=DATASET_DIR):
+    """The first dataset photo, resampled (Lanczos) to width x height."""
+    paths = sorted(
+        p for p in glob.glob(os.path.join(dataset_dir, "**", "*"), recursive=True)
+        if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    if not paths:
+        raise FileNotFoundError(f"No dataset images under {dataset_dir}")
+
+    with Image.open(paths[0]) as source:
+        return source.convert("RGB").resize((width, height), Image.LANCZOS)
+
+
+def generate(cache_dir, megapixels=MEGAPIXELS, formats=FORMATS, sources=SOURCES):
+    """
+    Writes every (source, size, format) benchmark image into cache_dir once
+    and returns [(case name, path)]. Existing files are reused, so the slow
+    48 MP encodes only happen on the first run.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cases = []
+
+    for source in sources:
+        for mp in megapixels:
+            width, height = image_size(mp)
+            image = None
+
+            for fmt in formats:
+                extension, options = FORMATS[fmt]
+                name = f"{source}-{mp:g}mp.{extension}"
+                path = os.path.join(cache_dir, name)
+
+                if not os.path.exists(path):
+                    if image is None:
+                        image = synthetic_image(width, height) if source == "synthetic" else dataset_image(width, height)
+                    image.save(path, format=fmt.upper(), **options)
+
+                cases.append((name, path))
+
+    return cases
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from image import downloader
+from image.heuristics import sensor_pattern_noise as spn
+from image.heuristics.utils import prnu
+from image.heuristics.utils.image_context import ImageContext
+
+from profile_report import DEFAULT_DATASET, dataset_images
+
+
+def camera_of(ctx):
+    """(camera id, make, model) from EXIF; the body serial, when present, separates units of a model."""
+    make, model = prnu.exif_camera(ctx.exif)
+    if not model:
+        return None, None, None
+
+    serial = None
+    if hasattr(ctx.exif, "get_ifd"):
+        serial = ctx.exif.get_ifd(prnu.EXIF_IFD).get(prnu.EXIF_BODY_SERIAL)
+
+    camera = " ".join(str(part) for part in (make, model, serial) if part)
+    return camera, make, model
+
+
+def build(root, output, crop, min_images):
+    images = [path for path, label in dataset_images(root) if label == "NONAI"]
+    accumulators = {}
+    start = time.perf_counter()
+
+    for path in images:
+        ctx = ImageContext.from_pipeline_image(downloader.process_local(path))
+
+        camera, make, model = camera_of(ctx)
+        if camera is None:
+            continue
+
+        residual = spn.extract_noise_residual(ctx.gray_f32, ctx.wavedec2(spn.WAVELET, level=spn.LEVELS))
+        inputs = spn.prnu_inputs(ctx, crop, residual)
+        if inputs is None:
+            continue
+
+        key = (camera, make, model, ctx.height, ctx.width)
+        accumulators.setdefault(key, prnu.FingerprintAccumulator(crop)).add(*inputs)
+
+    cameras = [
+        {"camera": camera, "make": make, "model": model, "images": acc.count,
+         "height": height, "width": width, "fingerprint": acc.fingerprint()}
+        for (camera, make, model, height, width), acc in accumulators.items()
+        if acc.count >= min_images
+    ]
+
+    prnu.write_store(output, cameras, crop)
+
+    print(f"{len(cameras)} fingerprints from {len(images)} real images in {time.perf_counter() - start:.0f}s -> {output}")
+    for camera in cameras:
+        print(f"  {camera['height']}x{camera['width']} {camera['camera']}: {camera['images']} images")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the PRNU camera fingerprint store from labelled real photos")
+    parser.add_argument("output", nargs="?", default=spn.PRNU_STORE or None, help="store directory (default: $PRNU_STORE)")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="folder searched recursively for real/ images")
+    parser.add_argument("--crop", type=int, default=prnu.DEFAULT_CROP, help="side of the centered fingerprint crop")
+    parser.add_argument("--min-images", type=int, default=20, help="images a camera needs for a usable fingerprint")
+    args = parser.parse_args()
+
+    if not args.output:
+        parser.error("no output directory and PRNU_STORE is not set")
+
+    build(args.dataset, args.output, args.crop, args.min_images)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from image import downloader
+
+import benchmark_images
+from heuristics_benchmark import DEFAULT_CACHE_DIR
+
+# Analysis budgets a reduced decode is measured for (None = native)
+MAX_PIXELS = [None, 2_000_000, 1_000_000, 250_000]
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def two_pass_decode(image_bytes):
+    """The pre-single-decode path: verify(), reopen, RGB, then L."""
+    image = Image.open(BytesIO(image_bytes))
+    image.verify()
+    image = Image.open(BytesIO(image_bytes))
+    rgb = image.convert("RGB")
+    return np.array(rgb.convert("L"), dtype=np.float32)
+
+
+def decode(image_bytes, backend, max_pixels):
+    image, image_type = downloader.open_image(image_bytes)
+    rgb, _ = downloader.decode_image(image, image_bytes, image_type, max_pixels, backend)
+    return rgb
+
+
+def benchmark(path, repeat, backends):
+    """{(backend, max_pixels): ms} for one file, plus the two-pass baseline and pixel agreement."""
+    with open(path, "rb") as f:
+        image_bytes = f.read()
+
+    image, image_type = downloader.open_image(image_bytes)
+    opencv = downloader.cv2 is not None and image.mode in downloader.CV2_MODES
+    usable = [b for b in backends if b != "cv2" or opencv]
+
+    times = {("two-pass", None): best_time(lambda: two_pass_decode(image_bytes), repeat)}
+    identical = {}
+
+    for max_pixels in MAX_PIXELS:
+        if max_pixels is not None and image_type != "jpeg":
+            continue
+
+        decoded = {}
+        for backend in usable:
+            if backend == "auto":
+                times[(backend, max_pixels)] = best_time(lambda: downloader.load_image(image_bytes, max_pixels), repeat)
+            else:
+                times[(backend, max_pixels)] = best_time(lambda: decode(image_bytes, backend, max_pixels), repeat)
+            if backend != "auto":
+                decoded[backend] = np.asarray(decode(image_bytes, backend, max_pixels))
+
+        if len(decoded) > 1:
+            first, *others = decoded.values()
+            identical[max_pixels] = all(o.shape == first.shape and np.array_equal(o, first) for o in others)
+
+    return image_type, times, identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode time per format and backend, full and DCT-reduced")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[2, 12])
+    parser.add_argument("--formats", nargs="+", default=list(benchmark_images.FORMATS), choices=list(benchmark_images.FORMATS))
+    parser.add_argument("--sources", nargs="+", default=["dataset"], choices=benchmark_images.SOURCES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    backends = ["pil", "cv2", "auto"]
+    fastest = {}
+
+    print(f"{'case':<24} {'backend':<9} {'max px':>9} {'ms':>9}   ('auto' = downloader.load_image, gray included)")
+
+    for case, path in benchmark_images.generate(args.cache_dir, args.megapixels, args.formats, args.sources):
+        image_type, times, identical = benchmark(path, args.repeat, backends)
+
+        for (backend, max_pixels), ms in times.items():
+            label = "native" if max_pixels is None else f"{max_pixels:,}"
+            print(f"{case:<24} {backend:<9} {label:>9} {ms:9.1f}")
+
+        for max_pixels, same in identical.items():
+            if not same:
+                print(f"{case:<24} backends disagree at max_pixels={max_pixels}")
+
+        native = {b: ms for (b, m), ms in times.items() if m is None and b in ("pil", "cv2")}
+        if identical.get(None, True):
+            for backend, ms in native.items():
+                fastest.setdefault(image_type, {}).setdefault(backend, []).append(ms)
+
+    print("\nSuggested DEFAULT_DECODER_BACKENDS (median native decode time):")
+    for image_type, per_backend in fastest.items():
+        medians = {b: float(np.median(v)) for b, v in per_backend.items()}
+        print(f"  {image_type}: {min(medians, key=medians.get)}  ({', '.join(f'{b} {ms:.1f}ms' for b, ms in medians.items())})")
+
+
+if __name__ == "__main__":
+    main()
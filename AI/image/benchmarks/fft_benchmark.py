@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from image.heuristics.utils import fft
+
+# (height, width) of the benchmarked gray images
+SIZES = [(512, 512), (1024, 1024), (2048, 2048), (3000, 4000), (6000, 8000)]
+
+
+def median_ms(fn, repeat):
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def baseline_magnitude(image):
+    # What the heuristics did before: a complex float64 fft2 of the full plane
+    return np.abs(np.fft.fftshift(np.fft.fft2(image.astype(np.float64))))
+
+
+def benchmark(sizes, repeat):
+    rng = np.random.default_rng(0)
+
+    print(f"FFT backend: {fft.BACKEND} ({fft.FFT_WORKERS} workers)")
+    print(f"{'size':>12} {'MP':>6} {'fft2 f64':>10} {'rfft2':>10} {'full plane':>11} {'speedup':>8} {'max rel err':>12}")
+
+    for h, w in sizes:
+        image = (rng.random((h, w), dtype=np.float32) * 255).astype(np.float32)
+
+        base = median_ms(lambda: baseline_magnitude(image), repeat)
+        half = median_ms(lambda: fft.rfft2(image), repeat)
+        full = median_ms(lambda: fft.centered_magnitude(image), repeat)
+
+        expected = baseline_magnitude(image)
+        actual = fft.centered_magnitude(image)
+        error = float(np.max(np.abs(actual - expected)) / np.max(expected))
+
+        print(f"{f'{h}x{w}':>12} {h * w / 1e6:6.1f} {base:9.1f}ms {half:9.1f}ms {full:10.1f}ms {base / half:7.1f}x {error:12.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the heuristics FFT facade")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-mp", type=float, default=50.0, help="skip sizes above this many megapixels")
+    args = parser.parse_args()
+
+    sizes = [s for s in SIZES if s[0] * s[1] <= args.max_mp * 1e6]
+    benchmark(sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+import os
+import re
+import json
+import math
+import tempfile
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+from types import SimpleNamespace
+
+from image.heuristics import copy_move, gan, pixel_level_analysis
+from image.heuristics.utils import cose, fft
+from image.heuristics.utils.block_dct import block_dct, create_dct_matrix, LEVEL_SHIFT
+from image.heuristics.utils.blocks import block_reduce, block_stats
+from image.heuristics.utils.integral_image import window_mean_var, window_stats
+from image.heuristics.utils.patterns import PatternMatcher
+from image.heuristics.utils.prnu import pce, PEAK_NEIGHBORHOOD
+from image.heuristics.utils.moments import (
+    pixel_statistics, value_central_moments, PixelStatistics, RunningMoments, RunningCovariance
+)
+from image.heuristics.utils.pyramid import downsample
+from image.utils.perceptual_hash import CODE_BITS, image_code
+from image.utils.verdict_index import LocalBackend, VerdictIndex
+
+# Relative tolerance of golden module outputs and kernel checks
+GOLDEN_RTOL = 1e-6
+
+
+# ------------------------------------------------
+# Kernel equivalence: vectorized vs. straightforward loops
+# ------------------------------------------------
+# Each check runs a shared kernel and a plain reference implementation
+# on the same small random input and returns the max relative error.
+
+def _relative_error(actual, expected):
+    actual, expected = np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64)
+    if actual.shape != expected.shape:
+        return math.inf
+    scale = max(1.0, float(np.max(np.abs(expected))) if expected.size else 1.0)
+    return float(np.max(np.abs(actual - expected))) / scale if expected.size else 0.0
+
+
+def check_local_variance(rng):
+    channel = rng.integers(0, 256, (37, 53)).astype(np.float64)
+    window, pad = 5, 2
+
+    padded = np.pad(channel, pad, mode="reflect")
+    expected = np.array([
+        [np.var(padded[y:y + window, x:x + window]) for x in range(channel.shape[1])]
+        for y in range(channel.shape[0])
+    ])
+
+    _, actual = window_mean_var(padded, window)
+    summary = pixel_level_analysis.local_variance(channel, window)
+
+    return max(
+        _relative_error(actual, expected),
+        _relative_error([summary["mean"], summary["max"]], [expected.mean(), expected.max()]),
+    )
+
+
+def check_window_stats(rng):
+    image = rng.normal(100, 20, (40, 30)).astype(np.float32)
+    window, stride = 8, 3
+
+    stats = window_stats(image, window, stride)
+    ys, xs = range(0, 40 - window + 1, stride), range(0, 30 - window + 1, stride)
+
+    expected_var, expected_kurt = [], []
+    for y in ys:
+        for x in xs:
+            patch = image[y:y + window, x:x + window].astype(np.float64)
+            d = patch - patch.mean()
+            expected_var.append(np.mean(d ** 2))
+            expected_kurt.append(np.mean(d ** 4) / np.mean(d ** 2) ** 2)
+
+    return max(
+        _relative_error(stats["variance"].ravel(), expected_var),
+        _relative_error(stats["kurtosis"].ravel(), expected_kurt),
+    )
+
+
+def check_block_dct(rng):
+    gray = rng.integers(0, 256, (43, 61)).astype(np.float32)
+    C = create_dct_matrix(8, np.float64)
+
+    expected = np.array([
+        C @ (gray[y:y + 8, x:x + 8].astype(np.float64) - LEVEL_SHIFT) @ C.T
+        for y in range(0, 40, 8) for x in range(0, 56, 8)
+    ])
+
+    return _relative_error(block_dct(gray), expected)
+
+
+def check_block_reduce(rng):
+    image = rng.normal(0, 1, (50, 70))
+    block = 16
+
+    expected_mean = np.array([[image[y:y + block, x:x + block].mean() for x in range(0, 64, block)] for y in range(0, 48, block)])
+    expected_var = np.array([[image[y:y + block, x:x + block].var() for x in range(0, 64, block)] for y in range(0, 48, block)])
+
+    stats = block_stats(image, block)
+
+    return max(
+        _relative_error(block_reduce(image, block, "mean"), expected_mean),
+        _relative_error(stats["var"], expected_var),
+    )
+
+
+def check_pixel_statistics(rng):
+    pixels = rng.integers(0, 256, (31, 29, 3)).astype(np.uint8)
+    flat = pixels.reshape(-1, 3).astype(np.float64)
+
+    stats = pixel_statistics(pixels, chunk=100)
+    mean, m2, m3, m4 = stats["central"]
+    d = flat - flat.mean(axis=0)
+
+    return max(
+        _relative_error(mean, flat.mean(axis=0)),
+        _relative_error(m2, np.mean(d ** 2, axis=0)),
+        _relative_error(m3, np.mean(d ** 3, axis=0)),
+        _relative_error(m4, np.mean(d ** 4, axis=0)),
+        _relative_error(stats["covariance"], np.cov(flat, rowvar=False, bias=True)),
+        _relative_error(value_central_moments(flat[:, 0])[1], np.var(flat[:, 0])),
+    )
+
+
+def check_running_accumulators(rng):
+    # Parts added to one accumulator and parts merged from separate ones
+    values = rng.normal(50, 10, (60, 40))
+    pairs = values + rng.normal(0, 5, values.shape)
+    pixels = rng.integers(0, 256, (60, 40, 3)).astype(np.uint8)
+    parts = [slice(0, 7), slice(7, 32), slice(32, 60)]
+
+    added = RunningMoments(max_order=4)
+    merged = RunningMoments(max_order=4)
+    covariance = RunningCovariance()
+    stats = PixelStatistics(3)
+
+    for part in parts:
+        added.add(values[part])
+        merged.merge(RunningMoments(max_order=4).add(values[part]))
+        covariance.merge(RunningCovariance().add(values[part], pairs[part]))
+        stats.merge(PixelStatistics(3).add(pixels[part]))
+
+    expected = value_central_moments(values)
+
+    return max(
+        _relative_error(added.central(), expected),
+        _relative_error(merged.central(), expected),
+        _relative_error([added.min, added.max], [values.min(), values.max()]),
+        _relative_error(covariance.correlation(), np.corrcoef(values.ravel(), pairs.ravel())[0, 1]),
+        _relative_error(stats.result()["covariance"], pixel_statistics(pixels)["covariance"]),
+    )
+
+
+def check_fft(rng):
+    image = rng.normal(0, 1, (33, 48)).astype(np.float32)
+    full = np.abs(np.fft.fft2(image.astype(np.float64)))
+
+    mean, var = fft.half_plane_stats(np.abs(fft.rfft2(image)), image.shape[-1])
+
+    return max(
+        _relative_error(fft.centered_magnitude(image), np.fft.fftshift(full)),
+        _relative_error([mean, var], [full.mean(), full.var()]),
+    )
+
+
+def check_gan_projections(rng):
+    image = rng.random((300, 260))
+    size, stride = 128, 64
+
+    col_sums, row_sums = gan.patch_projections(image, size, stride)
+    origins_y, origins_x = range(0, 300 - size, stride), range(0, 260 - size, stride)
+
+    expected_cols = np.array([[image[y:y + size, x:x + size].sum(axis=0) for x in origins_x] for y in origins_y])
+    expected_rows = np.array([[image[y:y + size, x:x + size].sum(axis=1) for x in origins_x] for y in origins_y])
+
+    return max(_relative_error(col_sums, expected_cols), _relative_error(row_sums, expected_rows))
+
+
+def check_pyramid(rng):
+    image = rng.integers(0, 256, (21, 34, 3)).astype(np.uint8)
+    expected = image[:20].astype(np.float64).reshape(10, 2, 17, 2, 3).mean(axis=(1, 3))
+    return _relative_error(downsample(image), expected)
+
+
+def check_pattern_matcher(rng):
+    # Short literals over a small alphabet, so prefixes and overlaps abound;
+    # any hit missed or invented counts as an infinite error
+    alphabet = list("abc: 1")
+    literals = {"".join(rng.choice(alphabet, rng.integers(1, 5))) for _ in range(40)}
+    regexes = [r"a:\s*\d+", r"a:", r"b+"]
+    text = "".join(rng.choice(alphabet, 2000))
+
+    matcher = PatternMatcher([("literal", w, False) for w in literals] + [("regex", p, True) for p in regexes])
+    actual = {tuple(hit) for hit in matcher.finditer(text)}
+
+    expected = {
+        ("literal", w, m.start(), m.start() + len(w)) for w in literals for m in re.finditer(f"(?={re.escape(w)})", text)
+    } | {
+        ("regex", p, m.start(), m.end(1)) for p in regexes for m in re.finditer(f"(?=({p}))", text)
+    }
+
+    return 0.0 if actual == expected else math.inf
+
+
+def check_prnu_correlation(rng):
+    # FFT cross-correlation and PCE against the direct circular correlation
+    residual = rng.normal(0, 1, (24, 20)).astype(np.float32)
+    references = rng.normal(0, 1, (3, 24, 20)).astype(np.float32)
+    references[0] += 0.5 * np.roll(residual, (2, -3), axis=(0, 1))
+
+    xcorr = fft.irfft2(fft.rfft2(references) * np.conj(fft.rfft2(residual)), residual.shape)
+    values, _, shifts = pce(xcorr)
+
+    direct = np.array([
+        [[np.sum(ref.astype(np.float64) * np.roll(residual, (dy, dx), axis=(0, 1))) for dx in range(20)] for dy in range(24)]
+        for ref in references
+    ])
+    expected = []
+    for plane in direct:
+        dy, dx = np.unravel_index(np.argmax(plane), plane.shape)
+        near = np.roll(plane, (PEAK_NEIGHBORHOOD // 2 - dy, PEAK_NEIGHBORHOOD // 2 - dx), axis=(0, 1))[:PEAK_NEIGHBORHOOD, :PEAK_NEIGHBORHOOD]
+        outside = (np.sum(plane ** 2) - np.sum(near ** 2)) / (plane.size - near.size)
+        expected.append(plane[dy, dx] ** 2 * np.sign(plane[dy, dx]) / outside)
+
+    return max(
+        _relative_error(xcorr, direct),
+        _relative_error(values, expected),
+        0.0 if list(shifts[0]) == [2, -3] else math.inf,
+    )
+
+
+def check_copy_move_scale(rng):
+    # One scene at 0.5 MP and rendered at 5.5 MP (where blocks are sampled):
+    # the same 100x100 clone must be found at both, and nothing in the
+    # untouched scene
+    scene = cv2.GaussianBlur(rng.normal(128, 40, (600, 840)).astype(np.float32), (0, 0), 1.5)
+    scene = np.clip((scene - 128) * 30 / scene.std() + 128, 0, 255)
+
+    outcomes = []
+    for gray in (scene, cv2.resize(scene, (2800, 1960), interpolation=cv2.INTER_CUBIC)):
+        h, w = gray.shape
+        cloned = gray.copy()
+        cloned[h // 2:h // 2 + 100, w // 2:w // 2 + 100] = gray[h // 5:h // 5 + 100, w // 5:w // 5 + 100]
+
+        for image, expected in ((gray, False), (cloned, True)):
+            result = copy_move.analyze_copy_move(SimpleNamespace(gray_f32=image, scale=1.0))
+            outcomes.append(result["clone"]["is_copy_move_detected"] == expected)
+
+    return 0.0 if all(outcomes) else math.inf
+
+
+def _der(tag, *parts):
+    content = b"".join(parts)
+    length = bytes([len(content)]) if len(content) < 0x80 else bytes([0x82]) + len(content).to_bytes(2, "big")
+    return bytes([tag]) + length + content
+
+
+def _certificate(rng, name, key, issuer, issuer_key, start, end, ca=False, purposes=cose.SIGNER_EKUS):
+    """A test certificate: a CA when ca is set, else a signer for purposes."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, name)]))
+        .issuer_name(x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, issuer)]))
+        .public_key(key.public_key())
+        .serial_number(int(rng.integers(1, 2 ** 62)))
+        .not_valid_before(datetime(*start, tzinfo=timezone.utc))
+        .not_valid_after(datetime(*end, tzinfo=timezone.utc))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+        .add_extension(x509.KeyUsage(
+            digital_signature=not ca, content_commitment=False, key_encipherment=False, data_encipherment=False,
+            key_agreement=False, key_cert_sign=ca, crl_sign=ca, encipher_only=False, decipher_only=False,
+        ), critical=True)
+    )
+    if not ca and purposes:
+        builder = builder.add_extension(
+            x509.ExtendedKeyUsage([x509.ObjectIdentifier(oid) for oid in purposes]), critical=False
+        )
+
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+def _write_pem(path, certificates):
+    from cryptography.hazmat.primitives import serialization
+
+    with open(path, "wb") as f:
+        for certificate in certificates:
+            f.write(certificate.public_bytes(serialization.Encoding.PEM))
+
+
+def check_c2pa_chain(rng):
+    # A signer chain is trusted only through CA issuers and a leaf with the
+    # C2PA signing purposes; a rewritten anchors file is read again
+    if not cose.AVAILABLE:
+        return 0.0
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    keys = [ec.generate_private_key(ec.SECP256R1()) for _ in range(4)]
+    root_key, middle_key, leaf_key, other_key = keys
+    span = (2020, 1, 1), (2040, 1, 1)
+
+    root = _certificate(rng, "root", root_key, "root", root_key, *span, ca=True)
+    other = _certificate(rng, "root", other_key, "root", other_key, *span, ca=True)
+    middle = _certificate(rng, "middle", middle_key, "root", root_key, *span, ca=True)
+    not_ca = _certificate(rng, "middle", middle_key, "root", root_key, *span)
+    leaf = _certificate(rng, "leaf", leaf_key, "middle", middle_key, *span)
+    no_purpose = _certificate(rng, "leaf", leaf_key, "middle", middle_key, *span, purposes=())
+    any_purpose = _certificate(rng, "leaf", leaf_key, "middle", middle_key, *span, purposes=("2.5.29.37.0",))
+
+    der = lambda *certificates: tuple(c.public_bytes(serialization.Encoding.DER) for c in certificates)
+
+    with tempfile.NamedTemporaryFile("wb", suffix=".pem", delete=False) as f:
+        path = f.name
+    try:
+        _write_pem(path, [root])
+        passed = (
+            cose.verify_chain(der(leaf, middle), path).trusted
+            and cose.verify_chain(der(leaf, not_ca), path).status == "signingCredential.invalid"
+            and cose.verify_chain(der(no_purpose, middle), path).status == "signingCredential.invalid"
+            and cose.verify_chain(der(any_purpose, middle), path).status == "signingCredential.invalid"
+            and cose.verify_chain(der(leaf, middle), path, cose.TSA_EKUS).status == "signingCredential.invalid"
+        )
+
+        # Same subject, other key: the cached chain must not outlive the file
+        _write_pem(path, [other])
+        os.utime(path, ns=(0, 0))
+        passed = passed and cose.verify_chain(der(leaf, middle), path).status == "signingCredential.untrusted"
+    finally:
+        os.unlink(path)
+
+    return 0.0 if passed else math.inf
+
+
+def _der_oid(dotted):
+    arcs = [int(arc) for arc in dotted.split(".")]
+    body = b""
+    for arc in [40 * arcs[0] + arcs[1]] + arcs[2:]:
+        chunk = [arc & 0x7F]
+        while arc > 0x7F:
+            arc >>= 7
+            chunk.append(0x80 | (arc & 0x7F))
+        body += bytes(reversed(chunk))
+    return _der(0x06, body)
+
+
+def _timestamp_token(tsa_key, tsa_certificates, gen_time, imprinted, tamper=False):
+    """An ECDSA-signed RFC 3161 token stamping gen_time on the SHA-256 of imprinted."""
+    import hashlib
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    sha256 = _der(0x30, _der_oid("2.16.840.1.101.3.4.2.1"))
+    tst_info = _der(
+        0x30, _der(0x02, b"\x01"), _der_oid("1.2.3.4"),
+        _der(0x30, sha256, _der(0x04, hashlib.sha256(imprinted).digest())),
+        _der(0x02, b"\x2a"), _der(0x18, gen_time.encode()),
+    )
+    attributes = (
+        _der(0x30, _der_oid(cose.CMS_CONTENT_TYPE), _der(0x31, _der_oid(cose.CMS_TST_INFO)))
+        + _der(0x30, _der_oid(cose.CMS_MESSAGE_DIGEST), _der(0x31, _der(0x04, hashlib.sha256(tst_info).digest())))
+    )
+    signature = tsa_key.sign(_der(0x31, attributes), ec.ECDSA(hashes.SHA256()))
+
+    if tamper:
+        # A later time swapped in after signing
+        tst_info = tst_info.replace(gen_time.encode(), b"20100101000000Z")
+
+    signer_info = _der(
+        0x30, _der(0x02, b"\x01"), _der(0x30, _der(0x30), _der(0x02, b"\x01")), sha256,
+        _der(0xA0, attributes), _der(0x30, _der_oid("1.2.840.10045.4.3.2")), _der(0x04, signature),
+    )
+    certificates = b"".join(c.public_bytes(serialization.Encoding.DER) for c in tsa_certificates)
+    signed_data = _der(
+        0x30, _der(0x02, b"\x03"), _der(0x31, sha256),
+        _der(0x30, _der_oid(cose.CMS_TST_INFO), _der(0xA0, _der(0x04, tst_info))),
+        _der(0xA0, certificates), _der(0x31, signer_info),
+    )
+    return _der(0x30, _der_oid(cose.CMS_SIGNED_DATA), _der(0xA0, signed_data))
+
+
+def check_c2pa_signing_time(rng):
+    # A chain whose leaf expired in 2021: rejected now, valid at the 2020
+    # time of a trusted TSA's token over the COSE signature. Tokens that
+    # are unsigned, tampered, over other bytes, from an untrusted TSA or a
+    # non time-stamping certificate are ignored
+    if not cose.AVAILABLE:
+        return 0.0
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    root_key, leaf_key, tsa_key, rogue_key = (ec.generate_private_key(ec.SECP256R1()) for _ in range(4))
+    root = _certificate(rng, "root", root_key, "root", root_key, (2019, 1, 1), (2040, 1, 1), ca=True)
+    leaf = _certificate(rng, "leaf", leaf_key, "root", root_key, (2020, 1, 1), (2021, 1, 1))
+    tsa = _certificate(rng, "tsa", tsa_key, "root", root_key, (2019, 1, 1), (2040, 1, 1), purposes=cose.TSA_EKUS)
+    not_tsa = _certificate(rng, "tsa", tsa_key, "root", root_key, (2019, 1, 1), (2040, 1, 1))
+    rogue_root = _certificate(rng, "root", rogue_key, "root", rogue_key, (2019, 1, 1), (2040, 1, 1), ca=True)
+    rogue = _certificate(rng, "tsa", tsa_key, "root", rogue_key, (2019, 1, 1), (2040, 1, 1), purposes=cose.TSA_EKUS)
+
+    sign1 = cose.Sign1(b"\xa1\x01\x26", {}, None, rng.bytes(64))
+    stamped = lambda token, label="sigTst2": sign1._replace(headers={label: {"tstTokens": [{"val": token}]}})
+    valid = _timestamp_token(tsa_key, [tsa], "20200601120000Z", sign1.signature)
+
+    forged = [
+        # The old unsigned shape: a bare TSTInfo in an OCTET STRING
+        _der(0x30, _der(0xA0, _der(0x04, _der(0x30, _der(0x02, b"\x01"), _der(0x18, b"20200601120000Z"))))),
+        _timestamp_token(tsa_key, [tsa], "20200601120000Z", sign1.signature, tamper=True),
+        _timestamp_token(tsa_key, [tsa], "20200601120000Z", b"another signature"),
+        _timestamp_token(tsa_key, [rogue, rogue_root], "20200601120000Z", sign1.signature),
+        _timestamp_token(tsa_key, [not_tsa], "20200601120000Z", sign1.signature),
+        _timestamp_token(tsa_key, [tsa], "20180601120000Z", sign1.signature),
+    ]
+
+    with tempfile.NamedTemporaryFile("wb", suffix=".pem", delete=False) as f:
+        path = f.name
+    try:
+        _write_pem(path, [root])
+        chain = cose.verify_chain(tuple(c.public_bytes(serialization.Encoding.DER) for c in (leaf, root)), path)
+        signed_at = cose.signing_time(stamped(valid), b"", path)
+        passed = (
+            cose.signing_time(stamped(_der(0x30, _der(0x30, _der(0x02, b"\x00")), valid), "sigTst"), b"", path) == signed_at
+            and cose.signing_time(sign1, b"", path) is None
+            and all(cose.signing_time(stamped(token), b"", path) is None for token in forged)
+        )
+    finally:
+        os.unlink(path)
+
+    passed = (
+        passed
+        and chain.trusted
+        and signed_at == datetime(2020, 6, 1, 12, tzinfo=timezone.utc)
+        and not cose.chain_valid_at(chain)
+        and cose.chain_valid_at(chain, signed_at)
+    )
+    return 0.0 if passed else math.inf
+
+
+def check_verdict_index(rng):
+    # A resized, recompressed copy finds the indexed verdict; a different
+    # image, or the copy under another profile, does not. Codes exactly
+    # max_distance bits away must always be found (multi-index pigeonhole)
+    def texture():
+        noise = cv2.GaussianBlur(rng.normal(128, 40, (240, 320)).astype(np.float32), (0, 0), 4)
+        return np.clip((noise - 128) * 40 / noise.std() + 128, 0, 255).astype(np.uint8)
+
+    original, other = texture(), texture()
+    small = cv2.resize(original, (160, 120), interpolation=cv2.INTER_AREA)
+    copy = cv2.imdecode(cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, 70])[1], cv2.IMREAD_GRAYSCALE)
+
+    index = VerdictIndex(LocalBackend())
+    index.add(image_code(original), {"mark": "AI", "profile": "balanced"})
+
+    passed = (
+        index.lookup(image_code(copy), "balanced") is not None
+        and index.lookup(image_code(other), "balanced") is None
+        and index.lookup(image_code(copy), "fast") is None
+    )
+
+    distance = index.multi_index.max_distance
+    for _ in range(20):
+        code = int.from_bytes(rng.bytes(CODE_BITS // 8), "big")
+        index.add(code, {"mark": "NONAI", "profile": None})
+        flipped = code ^ sum(1 << int(bit) for bit in rng.choice(CODE_BITS, distance, replace=False))
+        hit = index.lookup(flipped)
+        passed = passed and hit is not None and hit[1] == distance
+
+    return 0.0 if passed else math.inf
+
+
+KERNEL_CHECKS = [
+    ("local_variance", check_local_variance),
+    ("window_stats", check_window_stats),
+    ("block_dct", check_block_dct),
+    ("block_reduce", check_block_reduce),
+    ("pixel_statistics", check_pixel_statistics),
+    ("running_accumulators", check_running_accumulators),
+    ("fft", check_fft),
+    ("gan_projections", check_gan_projections),
+    ("pyramid", check_pyramid),
+    ("pattern_matcher", check_pattern_matcher),
+    ("prnu_correlation", check_prnu_correlation),
+    ("copy_move_scale", check_copy_move_scale),
+    ("c2pa_chain", check_c2pa_chain),
+    ("c2pa_signing_time", check_c2pa_signing_time),
+    ("verdict_index", check_verdict_index),
+]
+
+
+def run_kernel_checks(rtol=GOLDEN_RTOL, seed=0):
+    """[(name, max relative error, passed)] for every kernel check."""
+    results = []
+
+    for name, check in KERNEL_CHECKS:
+        error = check(np.random.default_rng(seed))
+        # float32 kernels are held to single precision
+        results.append((name, error, error <= max(rtol, 1e-5)))
+
+    return results
+
+
+# ------------------------------------------------
+# Golden module outputs
+# ------------------------------------------------
+
+def to_json(value):
+    """Module output as plain JSON types (NumPy scalars/arrays converted)."""
+    return json.loads(json.dumps(value, default=_json_default))
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def compare(expected, actual, rtol=GOLDEN_RTOL, path=""):
+    """Mismatch descriptions between two JSON values, numbers within rtol."""
+    if isinstance(expected, dict):
+        if not isinstance(actual, dict):
+            return [f"{path}: expected an object"]
+        mismatches = []
+        for key in sorted(set(expected) | set(actual)):
+            if key not in actual or key not in expected:
+                mismatches.append(f"{path}/{key}: {'missing' if key not in actual else 'unexpected'}")
+            else:
+                mismatches.extend(compare(expected[key], actual[key], rtol, f"{path}/{key}"))
+        return mismatches
+
+    if isinstance(expected, list):
+        if not isinstance(actual, list) or len(expected) != len(actual):
+            return [f"{path}: length differs"]
+        return [m for i, (e, a) in enumerate(zip(expected, actual)) for m in compare(e, a, rtol, f"{path}[{i}]")]
+
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool) and isinstance(actual, (int, float)):
+        if math.isnan(expected) and math.isnan(actual):
+            return []
+        if abs(expected - actual) > rtol * max(1.0, abs(expected), abs(actual)):
+            return [f"{path}: {expected!r} != {actual!r}"]
+        return []
+
+    return [] if expected == actual else [f"{path}: {expected!r} != {actual!r}"]
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from image import downloader
+from image.heuristics import decision_engine
+from image.heuristics.heuristic_verify import HEURISTIC_MODULES
+from image.heuristics.utils import scheduler, fft
+from image.heuristics.utils.image_context import ImageContext
+from image.heuristics.utils.telemetry import measure
+
+import benchmark_images
+import golden_checks
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "heuristics-benchmark")
+
+# A module only counts as regressed when it is slower by this fraction and
+# by at least MIN_REGRESSION_MS, so timer noise on fast modules is ignored
+REGRESSION_THRESHOLD = 0.2
+MIN_REGRESSION_MS = 5.0
+
+
+# ------------------------------------------------
+# One image (runs in a fresh process)
+# ------------------------------------------------
+
+def percentiles(times):
+    p50, p95 = np.percentile(np.asarray(times) * 1000, [50, 95])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3)}
+
+
+def run_suite(img, workers):
+    """
+    What heuristic_verify.verify does minus the LLM explanation: all modules
+    through the scheduler, then the decision engine's score and mark.
+    """
+    ctx = ImageContext.from_pipeline_image(img)
+    data = scheduler.run(HEURISTIC_MODULES, ctx, workers=workers)
+    ai_score, real_score, _ = decision_engine.score(data)
+    return decision_engine.mark_of(ai_score, real_score), data
+
+
+def benchmark_image(path, repeat, workers, golden):
+    """
+    Benchmarks the full suite and then every module on its own (fresh
+    context each run, so the inputs a module needs are part of its time).
+    Running in a fresh process keeps peak RSS per image meaningful: it is
+    taken right after the full-suite runs.
+    """
+    img = downloader.process_local(path)
+
+    suite_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mark, data = run_suite(img, workers)
+        suite_times.append(time.perf_counter() - start)
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    modules = {}
+    outputs = {}
+
+    for key, module in HEURISTIC_MODULES:
+        times, cpu_times, allocations = [], [], []
+
+        # Memory tracing slows allocations down, so allocations come from
+        # one extra traced run that is kept out of the timings
+        for run in range(repeat + 1):
+            ctx = ImageContext.from_pipeline_image(img)
+            traced = run == repeat
+            result, record = measure(key, lambda: scheduler.run_module(module, ctx), trace_memory=traced)
+
+            if traced:
+                allocations.append(record["memory_peak"])
+            else:
+                times.append(record["wall_time"])
+                cpu_times.append(record["cpu_time"])
+
+        modules[key] = {
+            **percentiles(times),
+            "cpu_p50_ms": round(float(np.median(cpu_times)) * 1000, 3),
+            "alloc_peak_mb": round(max(allocations) / 2 ** 20, 3),
+            "status": record["status"],
+        }
+
+        if golden:
+            outputs[key] = golden_checks.to_json(result)
+
+    return {
+        "megapixels": round(img["width"] * img["height"] / 1e6, 2),
+        "format": img["format"],
+        "suite": {**percentiles(suite_times), "mark": mark},
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "modules": modules,
+    }, outputs
+
+
+# ------------------------------------------------
+# Baseline / golden comparison
+# ------------------------------------------------
+
+def regressions(baseline, results, threshold=REGRESSION_THRESHOLD):
+    """Descriptions of every case / module whose p50 regressed past threshold."""
+    found = []
+
+    for case, current in results["cases"].items():
+        base = baseline.get("cases", {}).get(case)
+        if base is None:
+            continue
+
+        pairs = [("suite", base["suite"], current["suite"])]
+        pairs += [(key, base["modules"][key], stats) for key, stats in current["modules"].items() if key in base["modules"]]
+
+        for key, old, new in pairs:
+            slower = new["p50_ms"] - old["p50_ms"]
+            if slower > MIN_REGRESSION_MS and new["p50_ms"] > old["p50_ms"] * (1 + threshold):
+                found.append(f"{case} {key}: p50 {old['p50_ms']:.1f}ms -> {new['p50_ms']:.1f}ms (+{slower / max(old['p50_ms'], 1e-9):.0%})")
+
+    return found
+
+
+def golden_mismatches(golden, outputs, rtol):
+    found = []
+
+    for case, modules in outputs.items():
+        for key, output in modules.items():
+            expected = golden.get(case, {}).get(key)
+            if expected is None:
+                continue
+            found.extend(f"{case} {key}{m}" for m in golden_checks.compare(expected, output, rtol))
+
+    return found
+
+
+# ------------------------------------------------
+# Report
+# ------------------------------------------------
+
+def print_case(case, result):
+    suite = result["suite"]
+    print(f"\n{case} ({result['megapixels']} MP {result['format']}): suite p50 {suite['p50_ms']:.0f}ms "
+          f"p95 {suite['p95_ms']:.0f}ms, peak RSS {result['peak_rss_mb']:.0f} MB, verdict {suite['mark']}")
+    print(f"  {'module':<32} {'p50':>9} {'p95':>9} {'cpu p50':>9} {'alloc':>9}")
+
+    ranked = sorted(result["modules"].items(), key=lambda item: item[1]["p50_ms"], reverse=True)
+    for key, stats in ranked:
+        status = "" if stats["status"] == "ok" else f"  [{stats['status']}]"
+        print(f"  {key:<32} {stats['p50_ms']:7.1f}ms {stats['p95_ms']:7.1f}ms {stats['cpu_p50_ms']:7.1f}ms "
+              f"{stats['alloc_peak_mb']:6.1f} MB{status}")
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "fft_backend": fft.BACKEND,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the heuristic engine across resolutions and formats")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=benchmark_images.MEGAPIXELS)
+    parser.add_argument("--formats", nargs="+", default=list(benchmark_images.FORMATS), choices=list(benchmark_images.FORMATS))
+    parser.add_argument("--sources", nargs="+", default=benchmark_images.SOURCES, choices=benchmark_images.SOURCES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="scheduler workers for the full-suite runs")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where generated images are kept between runs")
+    parser.add_argument("--output", help="write the results as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed p50 slowdown, e.g. 0.2 = 20%%")
+    parser.add_argument("--golden", help="golden module outputs JSON to check against")
+    parser.add_argument("--save-golden", help="write the module outputs of this run as golden JSON")
+    parser.add_argument("--rtol", type=float, default=golden_checks.GOLDEN_RTOL)
+    parser.add_argument("--skip-kernels", action="store_true", help="skip the kernel equivalence checks")
+    args = parser.parse_args()
+
+    failures = []
+
+    if not args.skip_kernels:
+        print("Kernel equivalence (vectorized vs reference loops):")
+        for name, error, passed in golden_checks.run_kernel_checks(args.rtol):
+            print(f"  {name:<20} max rel err {error:.2e}  {'ok' if passed else 'FAIL'}")
+            if not passed:
+                failures.append(f"kernel {name}: max relative error {error:.2e}")
+
+    cases = benchmark_images.generate(args.cache_dir, args.megapixels, args.formats, args.sources)
+    collect = bool(args.golden or args.save_golden)
+
+    results = {"environment": environment(), "repeat": args.repeat, "cases": {}}
+    outputs = {}
+
+    # One fresh process per image, so peak RSS is that image's alone
+    context = multiprocessing.get_context("spawn")
+    for case, path in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result, case_outputs = pool.submit(benchmark_image, path, args.repeat, args.workers, collect).result()
+
+        results["cases"][case] = result
+        outputs[case] = case_outputs
+        print_case(case, result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_golden:
+        with open(args.save_golden, "w") as f:
+            json.dump(outputs, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += regressions(json.load(f), results, args.threshold)
+
+    if args.golden:
+        with open(args.golden) as f:
+            failures += golden_mismatches(json.load(f), outputs, args.rtol)
+
+    if failures:
+        print(f"\n{len(failures)} check(s) failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+    print("\nAll checks passed")
+
+
+if __name__ == "__main__":
+    main()
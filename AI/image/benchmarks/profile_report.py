@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from image import downloader
+from image.heuristics import profiles, decision_engine
+from image.heuristics.heuristic_verify import HEURISTIC_MODULES
+from image.heuristics.utils import scheduler
+from image.heuristics.utils.image_context import ImageContext
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "dataset")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def dataset_images(root):
+    """Image paths under root, with the label of their ai/ or real/ folder (or None)."""
+    images = []
+
+    for folder, _, files in os.walk(root):
+        parts = os.path.normpath(folder).split(os.sep)
+        label = "AI" if "ai" in parts else "NONAI" if "real" in parts else None
+
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((os.path.join(folder, name), label))
+
+    return sorted(images)
+
+
+def run_profile(img, name, workers):
+    """(mark, seconds) of one profile on one decoded image, without the LLM summary."""
+    modules, resolutions = profiles.select(HEURISTIC_MODULES, name)
+
+    start = time.perf_counter()
+    ctx = ImageContext.from_pipeline_image(img)
+    data = scheduler.run(modules, ctx, workers=workers, resolutions=resolutions)
+    ai_score, real_score, _ = decision_engine.score(data, data.keys())
+    elapsed = time.perf_counter() - start
+
+    return decision_engine.mark_of(ai_score, real_score), elapsed
+
+
+def report(root, names, reference, workers):
+    images = dataset_images(root)
+    if not images:
+        print(f"No images found under {root}")
+        return
+
+    names = list(dict.fromkeys([reference] + names))
+    marks = {name: [] for name in names}
+    latencies = {name: [] for name in names}
+
+    for path, _ in images:
+        img = downloader.process_local(path)
+        for name in names:
+            mark, elapsed = run_profile(img, name, workers)
+            marks[name].append(mark)
+            latencies[name].append(elapsed)
+
+    labels = [label for _, label in images]
+    labeled = [i for i, label in enumerate(labels) if label]
+
+    print(f"{len(images)} images from {os.path.abspath(root)}, reference profile: {reference}")
+    print(f"{'profile':>10} {'p50':>9} {'p95':>9} {'agreement':>10} {'label acc':>10}")
+
+    for name in names:
+        p50, p95 = np.percentile(latencies[name], [50, 95]) * 1000
+        agreement = np.mean([a == b for a, b in zip(marks[name], marks[reference])])
+        accuracy = np.mean([marks[name][i] == labels[i] for i in labeled]) if labeled else float("nan")
+
+        print(f"{name:>10} {p50:7.0f}ms {p95:7.0f}ms {agreement:10.1%} {accuracy:10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and agreement of the heuristic profiles")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="folder searched recursively for images")
+    parser.add_argument("--profiles", nargs="+", default=list(profiles.PROFILES))
+    parser.add_argument("--reference", default="forensic", help="profile the others are compared against")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    report(args.dataset, args.profiles, args.reference, args.workers)
+
+
+if __name__ == "__main__":
+    main()
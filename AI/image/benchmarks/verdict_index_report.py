@@ -0,0 +1,125 @@
+import os
+import sys
+import hashlib
+import argparse
+from itertools import combinations
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from image.utils.perceptual_hash import CODE_BITS, hamming, image_code
+from image.utils.verdict_index import VERDICT_INDEX_MAX_DISTANCE
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "dataset")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _encoded(gray, ext, quality):
+    flag = cv2.IMWRITE_JPEG_QUALITY if ext == ".jpg" else cv2.IMWRITE_WEBP_QUALITY
+    return cv2.imdecode(cv2.imencode(ext, gray, [flag, quality])[1], cv2.IMREAD_GRAYSCALE)
+
+
+def _resized(gray, factor):
+    interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC
+    return cv2.resize(gray, None, fx=factor, fy=factor, interpolation=interpolation)
+
+
+def _cropped(gray, fraction):
+    h, w = gray.shape
+    dy, dx = int(h * fraction), int(w * fraction)
+    return gray[dy:h - dy, dx:w - dx]
+
+
+# Copies of one image the index should find: (name, transform of a gray image)
+COPIES = [
+    ("resize 0.5", lambda g: _resized(g, 0.5)),
+    ("resize 0.25", lambda g: _resized(g, 0.25)),
+    ("resize 0.1", lambda g: _resized(g, 0.1)),
+    ("upscale 2", lambda g: _resized(g, 2)),
+    ("jpeg q90", lambda g: _encoded(g, ".jpg", 90)),
+    ("jpeg q70", lambda g: _encoded(g, ".jpg", 70)),
+    ("jpeg q40", lambda g: _encoded(g, ".jpg", 40)),
+    ("webp q50", lambda g: _encoded(g, ".webp", 50)),
+    ("resize 0.5 + jpeg q60", lambda g: _encoded(_resized(g, 0.5), ".jpg", 60)),
+    ("resize 0.25 + jpeg q50", lambda g: _encoded(_resized(g, 0.25), ".jpg", 50)),
+    ("brightness +15", lambda g: np.clip(g.astype(np.int16) + 15, 0, 255).astype(np.uint8)),
+    ("gamma 0.8", lambda g: (255 * (g / 255.0) ** 0.8).astype(np.uint8)),
+    ("blur 1.5", lambda g: cv2.GaussianBlur(g, (0, 0), 1.5)),
+    ("crop 2%", lambda g: _cropped(g, 0.02)),
+    ("crop 5%", lambda g: _cropped(g, 0.05)),
+]
+
+
+def distinct_images(gray):
+    """Images that must not match each other: gray, its mirrors and its four quadrants."""
+    h, w = gray.shape
+    return [gray, cv2.flip(gray, 1), cv2.flip(gray, 0),
+            gray[:h // 2, :w // 2], gray[:h // 2, w // 2:], gray[h // 2:, :w // 2], gray[h // 2:, w // 2:]]
+
+
+def dataset_images(root):
+    """Decoded gray images under root, files with identical bytes read once."""
+    seen, images = set(), []
+
+    for folder, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(folder, name), "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).digest()
+            gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if digest not in seen and gray is not None:
+                seen.add(digest)
+                images.append(gray)
+
+    return images
+
+
+def report(root, thresholds):
+    images = dataset_images(root)
+    if not images:
+        print(f"No images found under {root}")
+        return
+
+    copies = {name: [] for name, _ in COPIES}
+    for gray in images:
+        code = image_code(gray)
+        for name, transform in COPIES:
+            copy = image_code(transform(gray))
+            if code is not None and copy is not None:
+                copies[name].append(hamming(code, copy))
+
+    codes = [code for gray in images for code in map(image_code, distinct_images(gray)) if code is not None]
+    different = np.array([hamming(a, b) for a, b in combinations(codes, 2)])
+    found = np.concatenate([np.array(d) for d in copies.values()])
+
+    print(f"{len(images)} images from {os.path.abspath(root)}, distances of {CODE_BITS} bits")
+    print(f"{'copy':>24} {'max':>4}  distances")
+    for name, distances in copies.items():
+        print(f"{name:>24} {max(distances, default=0):4d}  {distances}")
+
+    print(f"{len(different)} pairs of different images: min {different.min()}, "
+          f"p1 {np.percentile(different, 1):.0f}, median {np.median(different):.0f}")
+
+    print(f"{'distance':>9} {'miss rate':>14} {'false matches':>16}")
+    for t in thresholds:
+        marker = "  <- VERDICT_INDEX_MAX_DISTANCE" if t == VERDICT_INDEX_MAX_DISTANCE else ""
+        print(f"{t:9d} {np.mean(found > t):6.1%} ({np.sum(found > t):3d}/{len(found)}) "
+              f"{np.mean(different <= t):6.2%} ({np.sum(different <= t):4d}/{len(different)}){marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Miss and false-match rates of the verdict index distance")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="folder searched recursively for images")
+    parser.add_argument("--thresholds", type=int, nargs="+",
+                        default=sorted({8, 12, 18, 24, 32, VERDICT_INDEX_MAX_DISTANCE}))
+    args = parser.parse_args()
+
+    report(args.dataset, args.thresholds)
+
+
+if __name__ == "__main__":
+    main()
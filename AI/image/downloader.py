@@ -1,13 +1,56 @@
+import os
 import requests
 import numpy as np
 from urllib.parse import urlparse
 from io import BytesIO
 from PIL import Image
 
+try:
+    import cv2
+    cv2_error = cv2.error
+except ImportError:
+    cv2 = None
+    cv2_error = OSError
+
 MAX_FILE_SIZE_BYTES = 15 * 1024 * 1024
 ALLOWED_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/tiff"}
 ALLOWED_FORMATS = {"jpeg", "png", "webp", "tiff"}
 
+# Decoder per format, from benchmarks/decoder_benchmark.py. Both backends
+# return identical pixels; OpenCV only won on WebP (12 MP: 198 vs 256 ms).
+# PIL's libjpeg path was faster (59 vs 103 ms), PNG was a tie and OpenCV
+# would leave PIL to decode it again for a trailing eXIf chunk, and PIL's
+# TIFF RGBA/16-bit conversions aren't reproduced by OpenCV.
+# IMAGE_DECODERS="jpeg=cv2,webp=pil" overrides single formats.
+DEFAULT_DECODER_BACKENDS = {"jpeg": "pil", "png": "pil", "webp": "cv2", "tiff": "pil"}
+
+# PIL modes OpenCV decodes to the same RGB as PIL's convert("RGB")
+CV2_MODES = {"RGB", "RGBA", "L", "LA", "P"}
+
+# libjpeg scales the IDCT by 1/2, 1/4 or 1/8 at most
+MAX_JPEG_SCALE_EXPONENT = 3
+CV2_REDUCED_FLAGS = {
+    0: cv2.IMREAD_COLOR,
+    1: cv2.IMREAD_REDUCED_COLOR_2,
+    2: cv2.IMREAD_REDUCED_COLOR_4,
+    3: cv2.IMREAD_REDUCED_COLOR_8,
+} if cv2 is not None else {}
+
+
+def decoder_backends(spec):
+    """DEFAULT_DECODER_BACKENDS updated from a "format=backend,..." spec."""
+    backends = dict(DEFAULT_DECODER_BACKENDS)
+
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        image_type, _, backend = item.partition("=")
+        if backend in ("pil", "cv2"):
+            backends[image_type.strip().lower()] = backend
+
+    return backends
+
+
+DECODER_BACKENDS = decoder_backends(os.getenv("IMAGE_DECODERS", ""))
+
 
 def validate_url(url):
     parsed = urlparse(url)
@@ -41,12 +84,13 @@ def download_image(url):
     return image_bytes
 
 
-def validate_image_bytes(image_bytes):
-    image = Image.open(BytesIO(image_bytes))
-    image.verify()
-
+def open_image(image_bytes):
+    """
+    Header-only open: (lazy PIL image, format). Rejects formats outside
+    ALLOWED_FORMATS before any pixel data is decoded.
+    """
     image = Image.open(BytesIO(image_bytes))
-    image_type = image.format.lower()
+    image_type = (image.format or "").lower()
 
     if image_type not in ALLOWED_FORMATS:
         raise ValueError(f"Invalid image format: {image_type}")
@@ -54,8 +98,82 @@ def validate_image_bytes(image_bytes):
     return image, image_type
 
 
-def prepare_pipeline_image(image, image_bytes, image_type):
-    rgb_image = image.convert("RGB")
+# ------------------------------------------------
+# Decoding
+# ------------------------------------------------
+
+def jpeg_scale_exponent(width, height, max_pixels):
+    """
+    k of the libjpeg 1/2^k DCT-domain scaling (k <= 3) that decodes a JPEG
+    straight to the first pyramid octave with at most max_pixels pixels.
+    Scaled sides round up, as libjpeg does.
+    """
+    k = 0
+
+    if max_pixels is None:
+        return k
+
+    while k < MAX_JPEG_SCALE_EXPONENT and -(-width >> k) * -(-height >> k) > max_pixels:
+        k += 1
+
+    return k
+
+
+def decoder_backend(image, image_type):
+    """Backend for this image: the per-format choice, if OpenCV decodes its mode identically."""
+    backend = DECODER_BACKENDS.get(image_type, "pil")
+
+    if backend == "cv2" and (cv2 is None or image.mode not in CV2_MODES):
+        return "pil"
+
+    return backend
+
+
+def _decode_pil(image, image_bytes, k):
+    if k:
+        # Must come before load(); the JPEG decoder then runs at 1/2^k
+        image.draft("RGB", (image.width >> k, image.height >> k))
+
+    image.load()
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def _decode_cv2(image, image_bytes, k):
+    flags = CV2_REDUCED_FLAGS[k] | cv2.IMREAD_IGNORE_ORIENTATION
+
+    bgr = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flags)
+    if bgr is None:
+        raise ValueError("OpenCV could not decode the image")
+
+    return Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+
+
+DECODERS = {
+    "pil": _decode_pil,
+    "cv2": _decode_cv2,
+}
+
+
+def decode_image(image, image_bytes, image_type, max_pixels=None, backend=None):
+    """
+    Decodes an open_image() result to RGB exactly once; the decode doubles as
+    validation (truncated or corrupt data raises ValueError). When the caller
+    only analyses up to max_pixels pixels, JPEGs are decoded at the matching
+    DCT-domain scale. Returns (rgb PIL image, backend used).
+    """
+    backend = backend or decoder_backend(image, image_type)
+    k = jpeg_scale_exponent(image.width, image.height, max_pixels) if image_type == "jpeg" else 0
+
+    try:
+        return DECODERS[backend](image, image_bytes, k), backend
+    except (OSError, SyntaxError, cv2_error) as e:
+        raise ValueError(f"Invalid image data: {e}")
+
+
+def prepare_pipeline_image(image, image_bytes, image_type, rgb_image=None, decoder="pil"):
+    if rgb_image is None:
+        rgb_image = image.convert("RGB")
+
     gray_np = np.array(rgb_image.convert("L"), dtype=np.float32)
 
     return {
@@ -65,27 +183,38 @@ def prepare_pipeline_image(image, image_bytes, image_type):
         "format": image_type,
         "width": rgb_image.size[0],
         "height": rgb_image.size[1],
+        "decoder": decoder,
         "exif": image.getexif(),
     }
 
 
-def process(url):
+def load_image(image_bytes, max_pixels=None):
+    """Validated single decode of downloaded bytes into the pipeline image dict."""
+    image, image_type = open_image(image_bytes)
+    stored_width = image.width
+
+    rgb_image, decoder = decode_image(image, image_bytes, image_type, max_pixels)
+
+    result = prepare_pipeline_image(image, image_bytes, image_type, rgb_image, decoder)
+    # Decoded / stored width: below 1 after a reduced JPEG decode
+    result["decode_scale"] = rgb_image.size[0] / stored_width
+
+    return result
+
+
+def process(url, max_pixels=None):
     validate_url(url)
 
     image_bytes = download_image(url)
 
-    image, image_type = validate_image_bytes(image_bytes)
-
-    result = prepare_pipeline_image(image, image_bytes, image_type)
+    result = load_image(image_bytes, max_pixels)
         
     return result
 
-def process_local(file_path):
+def process_local(file_path, max_pixels=None):
     with open(file_path, "rb") as f:
         image_bytes = f.read()
 
-    image, image_type = validate_image_bytes(image_bytes)
-
-    result = prepare_pipeline_image(image, image_bytes, image_type)
+    result = load_image(image_bytes, max_pixels)
         
     return result
\ No newline at end of file
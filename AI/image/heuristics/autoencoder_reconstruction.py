@@ -1,20 +1,23 @@
 import numpy as np
 import cv2
+from .utils.pyramid import GLOBAL_MAX_PIXELS
 
-def load_image_cv(image_bytes):
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+REQUIRES = ["gray"]
+MAX_PIXELS = GLOBAL_MAX_PIXELS
+COST = 3
+
+def load_image_cv(ctx):
     # Resize to a standard 256x256 for consistent math
-    return cv2.resize(img, (256, 256))
+    return cv2.resize(ctx.gray, (256, 256))
 
-def simulate_reconstruction(image_bytes, compression_rank=20):
+def simulate_reconstruction(ctx, compression_rank=20):
     """
     Simulates Autoencoder Reconstruction Error using SVD.
     Real photos have high 'rank' (complex noise).
     AI photos have low 'rank' (mathematical patterns).
     """
     try:
-        gray = load_image_cv(image_bytes).astype(np.float32)
+        gray = load_image_cv(ctx).astype(np.float32)
         
         # 1. Perform Singular Value Decomposition (The 'Encoder' step)
         U, S, Vt = np.linalg.svd(gray, full_matrices=False)
@@ -41,5 +44,5 @@ def simulate_reconstruction(image_bytes, compression_rank=20):
     except Exception as e:
         return {"error": str(e)}
 
-def process(image_bytes):
-    return simulate_reconstruction(image_bytes)
\ No newline at end of file
+def process(ctx):
+    return simulate_reconstruction(ctx)
\ No newline at end of file
@@ -1,51 +1,77 @@
 import numpy as np
-import cv2
+from .utils.block_dct import DC_OFFSET, CHUNK_BLOCKS
+from .utils.jpeg_coefficients import quantized_luma
+from .utils.pyramid import NATIVE
 
-def get_dct_coefficients(image_bytes):
-    """Extracts raw DCT coefficients from the image."""
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    
-    # Ensure image size is a perfect multiple of 8 for DCT blocks
-    h, w = img.shape
-    img = img[:h//8*8, :w//8*8].astype(np.float32)
-    
-    coeffs = []
-    # Break image into 8x8 pixel blocks
-    for i in range(0, img.shape[0], 8):
-        for j in range(0, img.shape[1], 8):
-            block = img[i:i+8, j:j+8]
-            dct_block = cv2.dct(block)
-            # Flatten the block and add to our list of coefficients
-            coeffs.extend(dct_block.flatten())
-            
-    return np.array(coeffs)
+# The pixel block DCT is only built (lazily) when the bitstream can't be read.
+# Coefficients sit on the JPEG 8x8 grid, so this stays native; digits are
+# counted over chunks of blocks
+REQUIRES = ["jpeg_coefficients"]
+MAX_PIXELS = NATIVE
+COST = 40
 
-def analyze_benfords_law(image_bytes):
+def get_dct_coefficients(dct_blocks):
+    """Absolute raw DCT coefficients of the (unshifted) 8x8 image blocks."""
+    abs_coeffs = np.abs(dct_blocks)
+    # The blocks are JPEG level-shifted; restore the raw DC terms
+    abs_coeffs[:, 0, 0] = np.abs(dct_blocks[:, 0, 0] + DC_OFFSET)
+    return abs_coeffs.ravel()
+
+def first_digits(values):
+    """Leading decimal digit (1-9) of every positive value."""
+    values = values[values > 0].astype(np.float64)
+
+    exponent = np.floor(np.log10(values))
+    digits = np.floor(values / 10.0 ** exponent).astype(np.int64)
+
+    # log10 rounding can put values right at a power of ten one decade off
+    digits[digits >= 10] = 1
+    digits[digits < 1] = 9
+
+    return digits
+
+def digit_counts(dct_blocks, table=None, chunk=CHUNK_BLOCKS):
+    """
+    Counts of leading digits 0-9 (0 unused) over the absolute coefficients,
+    of quantized blocks times table when a quantization table is given.
+    """
+    counts = np.zeros(10, dtype=np.int64)
+
+    for i in range(0, len(dct_blocks), chunk):
+        blocks = dct_blocks[i:i + chunk]
+        if table is not None:
+            blocks = blocks * table.astype(np.int32)
+
+        digits = first_digits(get_dct_coefficients(blocks))
+        counts += np.bincount(digits, minlength=10)
+
+    return counts
+
+def analyze_benfords_law(ctx):
     """
     Analyzes if the DCT coefficients follow the natural Benford curve.
     AI and heavy editing disrupt this statistical distribution.
     """
     try:
-        coeffs = get_dct_coefficients(image_bytes)
-        
-        # Filter for non-zero coefficients and get the absolute first digit
-        abs_coeffs = np.abs(coeffs)
-        first_digits = []
+        # Prefer the coefficients the encoder actually stored; fall back to
+        # re-transforming the decoded pixels
+        jpeg = ctx.jpeg_coefficients
+        if jpeg is not None:
+            blocks, table = quantized_luma(jpeg), jpeg["luma_table"]
+            source = "jpeg_bitstream"
+        else:
+            blocks, table = ctx.block_dct, None
+            source = "pixel_dct"
         
-        for val in abs_coeffs:
-            if val > 0:
-                # Convert to string, remove decimals, remove leading zeros
-                s = str(val).replace('.', '').lstrip('0')
-                if s:
-                    first_digits.append(int(s[0]))
+        # Absolute first digit of every non-zero coefficient
+        counts = digit_counts(blocks, table)[1:10]
+        total = counts.sum()
         
-        if not first_digits:
+        if not total:
             return {"error": "No significant coefficients found"}
 
         # Calculate actual frequencies of digits 1 through 9
-        counts = np.bincount(first_digits)[1:10]
-        actual_dist = counts / len(first_digits)
+        actual_dist = counts / total
         
         # Ideal Benford Distribution formula: P(d) = log10(1 + 1/d)
         ideal_dist = np.array([np.log10(1 + 1/d) for d in range(1, 10)])
@@ -58,10 +84,11 @@ def analyze_benfords_law(image_bytes):
             "actual_distribution": actual_dist.tolist(),
             "ideal_distribution": ideal_dist.tolist(),
             # A threshold of 0.05 is generally safe for natural JPEGs
-            "is_statistically_natural": bool(chi_square_stat < 0.05)
+            "is_statistically_natural": bool(chi_square_stat < 0.05),
+            "coefficient_source": source
         }
     except Exception as e:
         return {"error": str(e)}
 
-def process(image_bytes):
-    return analyze_benfords_law(image_bytes)
\ No newline at end of file
+def process(ctx):
+    return analyze_benfords_law(ctx)
\ No newline at end of file
@@ -1,78 +1,273 @@
-import json
+import os
+import hashlib
+from .utils.pyramid import NATIVE
+from .utils.container import parse_container
+from .utils.jumbf import container_jumbf
+from .utils import cose
 
+REQUIRES = ["container"]
+MAX_PIXELS = NATIVE
+COST = 1
 
-def parse_jpeg_segments(data):
-    i = 2  # skip SOI
-    segments = []
+# PEM bundle of the signing and time-stamping roots (and intermediates)
+# C2PA signatures and their time-stamps are trusted against; without it
+# signatures verify but are never trusted
+C2PA_TRUST_ANCHORS = os.getenv("C2PA_TRUST_ANCHORS", "")
 
-    while i < len(data):
-        if data[i] != 0xFF:
-            break
+# JUMBF type UUID of a C2PA manifest store ("c2pa" + the ISO base suffix)
+MANIFEST_STORE_UUID = bytes.fromhex("6332706100110010800000aa00389b71")
 
-        marker = data[i + 1]
-        i += 2
+CLAIM_LABELS = ("c2pa.claim.v2", "c2pa.claim")
+SIGNATURE_LABEL = "c2pa.signature"
+ASSERTION_STORE_LABEL = "c2pa.assertions"
+DATA_HASH_LABEL = "c2pa.hash.data"
+ACTIONS_LABELS = ("c2pa.actions.v2", "c2pa.actions")
 
-        # EOI
-        if marker == 0xD9:
-            break
-
-        # markers without length
-        if marker in (0x01,) or (0xD0 <= marker <= 0xD7):
-            continue
-
-        length = int.from_bytes(data[i:i+2], "big")
-        segment_data = data[i+2:i+length]
-
-        segments.append({
-            "marker": marker,
-            "data": segment_data
-        })
-
-        i += length
-
-    return segments
+# IPTC digital source types that declare generated or synthetic content
+AI_SOURCE_TYPES = (
+    "trainedAlgorithmicMedia",
+    "compositeWithTrainedAlgorithmicMedia",
+    "algorithmicMedia",
+    "compositeSynthetic",
+)
 
 
 def detect_c2pa_jumbf(segment_data):
     # JUMBF box signature
+    segment_data = bytes(segment_data)
     if b"jumb" in segment_data or b"uuid" in segment_data:
         if b"c2pa" in segment_data:
             return True
     return False
 
 
-def c2pa_analysis(image_bytes):
+# ------------------------------------------------
+# Manifest store
+# ------------------------------------------------
+
+def find_manifest_store(container):
+    """(segment name, manifest store superbox) of the container, or (None, None)."""
+    for name, superbox in container_jumbf(container):
+        if superbox.uuid == MANIFEST_STORE_UUID or superbox.label == "c2pa":
+            return name, superbox
+    return None, None
+
+
+def active_manifest(store):
+    """The active manifest: the last one in the store."""
+    manifests = store.superboxes()
+    return manifests[-1] if manifests else None
+
+
+def claim_box(manifest):
+    for label in CLAIM_LABELS:
+        box = manifest.child(label)
+        if box is not None:
+            return box
+    return None
+
+
+def resolve_assertion(manifest, url):
+    """
+    Assertion superbox a hashed URI points at. URIs are relative to the
+    manifest ("self#jumbf=c2pa.assertions/<label>") or absolute
+    ("self#jumbf=/c2pa/<manifest>/c2pa.assertions/<label>").
+    """
+    path = url.split("#jumbf=", 1)[-1]
+
+    if path.startswith("/"):
+        parts = path.strip("/").split("/")
+        if len(parts) < 3 or parts[1] != manifest.label:
+            return None
+        path = "/".join(parts[2:])
+
+    return manifest.resolve(path)
+
+
+def assertion_data(manifest, label):
+    """Decoded CBOR content of the assertion with label, or None."""
+    store = manifest.child(ASSERTION_STORE_LABEL)
+    box = store.child(label) if store is not None else None
+    content = box.content("cbor") if box is not None else None
+    return cose.cbor2.loads(bytes(content)) if content is not None else None
+
+
+def claim_assertions(claim):
+    """Hashed URIs of the claim: v2 created + gathered, v1 assertions."""
+    return claim.get("created_assertions", []) + claim.get("gathered_assertions", []) + claim.get("assertions", [])
+
+
+def digest(alg, *parts):
+    h = hashlib.new(alg.replace("-", ""))
+    for part in parts:
+        h.update(part)
+    return h.digest()
+
+
+def data_hash_matches(image_bytes, data_hash, default_alg):
+    """Hash of the file bytes outside the exclusion ranges (the manifest itself)."""
+    view = memoryview(image_bytes)
+    parts, position = [], 0
+
+    for exclusion in sorted(data_hash.get("exclusions", []), key=lambda e: e["start"]):
+        parts.append(view[position:exclusion["start"]])
+        position = exclusion["start"] + exclusion["length"]
+
+    parts.append(view[position:])
+
+    return digest(data_hash.get("alg", default_alg), *parts) == data_hash.get("hash")
+
+
+def digital_source_types(manifest):
+    types = []
+
+    for label in ACTIONS_LABELS:
+        actions = assertion_data(manifest, label) or {}
+        for action in actions.get("actions", []):
+            source = action.get("digitalSourceType")
+            if source:
+                types.append(source)
+
+    return types
+
+
+# ------------------------------------------------
+# Validation
+# ------------------------------------------------
+
+def validate_manifest(manifest, image_bytes, anchors_path):
+    """
+    (details, validation errors) of the active manifest. Parses only the
+    claim and signature boxes and the assertions they reference: the
+    COSE signature over the claim, the signer's chain against the trust
+    anchors, every hashed URI and the data hash binding the manifest to
+    the file bytes.
+    """
+    errors = []
+
+    claim = claim_box(manifest)
+    claim_bytes = claim.content("cbor") if claim is not None else None
+    if claim_bytes is None:
+        return {}, ["claim.missing"]
+
+    claim = cose.cbor2.loads(bytes(claim_bytes))
+    default_alg = claim.get("alg", "sha256")
+
+    details = {
+        "manifest": manifest.label,
+        "claim_generator": claim.get("claim_generator") or claim.get("claim_generator_info"),
+    }
+
+    signature = manifest.child(SIGNATURE_LABEL)
+    signature_bytes = signature.content("cbor") if signature is not None else None
+    if signature_bytes is None:
+        return details, ["claimSignature.missing"]
+
+    sign1 = cose.decode_sign1(signature_bytes)
+    alg = sign1.headers.get(cose.HEADER_ALG)
+
+    if alg not in cose.ALGORITHMS:
+        errors.append("algorithm.unsupported")
+    else:
+        details["signing_alg"] = cose.ALGORITHMS[alg][0]
+
+        chain = cose.verify_chain(cose.x5chain(sign1.headers), anchors_path)
+        details["signer"] = chain.subject
+        details["trusted"] = chain.trusted
+
+        # Detached payload: the signature covers the serialized claim
+        payload = sign1.payload if sign1.payload is not None else claim_bytes
+
+        # A signature time-stamped by a trusted TSA stays valid after its
+        # certificate expires; otherwise the chain must be valid now
+        signed_at = cose.signing_time(sign1, payload, anchors_path)
+        details["signed_at"] = signed_at.isoformat() if signed_at else None
+
+        if chain.status:
+            errors.append(chain.status)
+        elif not cose.chain_valid_at(chain, signed_at):
+            errors.append("signingCredential.expired")
+
+        message = cose.sig_structure(sign1, payload)
+        if chain.public_key is None or not cose.verify_signature(chain.public_key, alg, message, sign1.signature):
+            errors.append("claimSignature.mismatch")
+
+    hard_binding = False
+
+    for reference in claim_assertions(claim):
+        assertion = resolve_assertion(manifest, reference.get("url", ""))
+
+        if assertion is None:
+            errors.append("assertion.missing")
+            continue
+
+        if digest(reference.get("alg", default_alg), assertion.box_data) != reference.get("hash"):
+            errors.append("assertion.hashedURI.mismatch")
+            continue
+
+        if (assertion.label or "").split("__")[0] == DATA_HASH_LABEL:
+            hard_binding = True
+            data_hash = cose.cbor2.loads(bytes(assertion.content("cbor")))
+            if not data_hash_matches(image_bytes, data_hash, default_alg):
+                errors.append("assertion.dataHash.mismatch")
+
+    if not hard_binding:
+        errors.append("claim.hardBindings.missing")
+
+    sources = digital_source_types(manifest)
+    details["digital_source_types"] = sources
+    details["ai_generated"] = any(source.rsplit("/", 1)[-1] in AI_SOURCE_TYPES for source in sources)
+
+    return details, errors
+
+
+def c2pa_analysis(image_bytes, container=None, anchors_path=None):
 
     try:
 
-        # check JPEG
-        if not image_bytes.startswith(b"\xff\xd8"):
+        container = container or parse_container(image_bytes)
+
+        if container.format is None:
             return {
                 "c2pa_present": False,
                 "valid_signature": None,
-                "reason": "Not JPEG container"
+                "reason": "Unsupported container"
             }
 
-        segments = parse_jpeg_segments(image_bytes)
+        # JPEG APP11, PNG caBX and WebP C2PA segments carry the JUMBF boxes
+        segment, store = find_manifest_store(container)
 
-        for seg in segments:
-
-            # APP11 is where JUMBF is usually stored
-            if seg["marker"] == 0xEB:
-
-                if detect_c2pa_jumbf(seg["data"]):
-                    return {
-                        "c2pa_present": True,
-                        "valid_signature": None,
-                        "container": "JPEG",
-                        "segment": "APP11"
-                    }
+        if store is None:
+            present = any(detect_c2pa_jumbf(s.data) for s in container.find("jumbf"))
+            return {
+                "c2pa_present": present,
+                "valid_signature": False if present else None,
+                **({"reason": "Unreadable manifest store"} if present else {}),
+            }
 
         result = {
-            "c2pa_present": False,
-            "valid_signature": None
+            "c2pa_present": True,
+            "valid_signature": None,
+            "container": container.format.upper(),
+            "segment": segment,
         }
-    
+
+        manifest = active_manifest(store)
+        if manifest is None:
+            result.update(valid_signature=False, validation_errors=["claim.missing"])
+            return result
+
+        if not cose.AVAILABLE:
+            result.update(manifest=manifest.label, reason="cbor2/cryptography not installed, signature not checked")
+            return result
+
+        anchors_path = C2PA_TRUST_ANCHORS if anchors_path is None else anchors_path
+        details, errors = validate_manifest(manifest, image_bytes, anchors_path)
+
+        result.update(details)
+        result["valid_signature"] = not errors
+        result["validation_errors"] = errors
+
         return result
 
     except Exception as e:
@@ -83,7 +278,18 @@ def c2pa_analysis(image_bytes):
         }
 
 
-def process(image_bytes):
-    result = c2pa_analysis(image_bytes)
+def decisive_mark(result):
+    """
+    The verdict a verified manifest settles on its own ("AI" when it
+    declares generated content, "NONAI" otherwise), or None when the image
+    has no valid, trusted manifest.
+    """
+    if not (result.get("c2pa_present") and result.get("valid_signature")):
+        return None
+    return "AI" if result.get("ai_generated") else "NONAI"
+
+
+def process(ctx):
+    result = c2pa_analysis(ctx.bytes, ctx.container)
     # return json.dumps(result, indent=2)
-    return result
\ No newline at end of file
+    return result
@@ -1,21 +1,22 @@
 import numpy as np
 import cv2
+from .utils.pyramid import NATIVE
 
-def analyze_chromatic_aberration(image_bytes):
+REQUIRES = ["bgr"]
+MAX_PIXELS = NATIVE
+COST = 5
+
+def analyze_chromatic_aberration(ctx):
     """
     Measures the alignment of color channels (Red vs Blue).
     Real lenses show misalignment (aberration) at the edges.
     AI images remain perfectly aligned edge-to-edge.
     """
     try:
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            return {"error": "Could not decode image"}
+        img = ctx.bgr
 
         h, w, _ = img.shape
-        # OpenCV loads images in BGR format
+        # OpenCV channel order is BGR
         b, g, r = cv2.split(img)
 
         # Define the center and the top-left corner regions (10% of image size)
@@ -54,5 +55,5 @@ def analyze_chromatic_aberration(image_bytes):
     except Exception as e:
         return {"error": str(e)}
 
-def process(image_bytes):
-    return analyze_chromatic_aberration(image_bytes)
\ No newline at end of file
+def process(ctx):
+    return analyze_chromatic_aberration(ctx)
\ No newline at end of file
@@ -1,89 +1,115 @@
 import json
 import numpy as np
-from PIL import Image
-from io import BytesIO
+from .utils.moments import value_central_moments
+from .utils.fft import rfft, half_plane_weights
+from .utils.jpeg_coefficients import quantized_luma, dequantized_luma
+from .utils.jpeg_tables import read_quantization_tables, estimate_quality
+from .utils.pyramid import NATIVE
+from .utils.tiling import row_bands, band_rows
+
+REQUIRES = ["gray_f32", "block_dct", "jpeg_coefficients", "container"]
+# Row bands only cover the blockiness profile; the DCT statistics still
+# read the shared block_dct
+TILED_REQUIRES = REQUIRES
+MAX_PIXELS = NATIVE
+COST = 70
 
 
 # ----------------------------------------------------------
-# Precompute 8x8 DCT transform matrix (orthogonal DCT-II)
+# Neighbor difference profile (shared by the blockiness metrics)
 # ----------------------------------------------------------
-def create_dct_matrix(N=8):
-    C = np.zeros((N, N), dtype=np.float32)
+def difference_profile(gray, block=8):
+    """
+    Per-column and per-row sums of absolute neighbor differences.
+
+    Column i (1..w-1) aggregates |gray[:, i] - gray[:, i-1]| and row j
+    (1..h-1) aggregates |gray[j, :] - gray[j-1, :]|; columns/rows with
+    index % block == 0 sit on a block boundary.
+    """
+    h, w = gray.shape
 
-    for k in range(N):
-        alpha = np.sqrt(1/N) if k == 0 else np.sqrt(2/N)
+    dx = np.abs(np.diff(gray, axis=1))
+    dy = np.abs(np.diff(gray, axis=0))
 
-        for n in range(N):
-            C[k, n] = alpha * np.cos(((2*n + 1) * k * np.pi) / (2*N))
+    return {
+        "col_count": h,
+        "col_sum": dx.sum(axis=0, dtype=np.float64),
+        "col_sq_sum": np.square(dx).sum(axis=0, dtype=np.float64),
+        "col_boundary": np.arange(1, w) % block == 0,
+
+        "row_count": w,
+        "row_sum": dy.sum(axis=1, dtype=np.float64),
+        "row_sq_sum": np.square(dy).sum(axis=1, dtype=np.float64),
+        "row_boundary": np.arange(1, h) % block == 0,
+    }
 
-    return C
 
+def difference_profile_tiled(gray, block=8):
+    """
+    difference_profile of a 0-255 gray image scaled to 0-1, accumulated
+    over row bands, each
+    with one context row above for the vertical differences across bands.
+    """
+    h, w = gray.shape
 
-DCT_MATRIX = create_dct_matrix()
-DCT_MATRIX_T = DCT_MATRIX.T
+    profile = {
+        "col_count": h,
+        "col_sum": np.zeros(w - 1),
+        "col_sq_sum": np.zeros(w - 1),
+        "col_boundary": np.arange(1, w) % block == 0,
 
+        "row_count": w,
+        "row_sum": np.zeros(h - 1),
+        "row_sq_sum": np.zeros(h - 1),
+        "row_boundary": np.arange(1, h) % block == 0,
+    }
 
-# ----------------------------------------------------------
-# 8x8 DCT transform
-# ----------------------------------------------------------
-def block_dct(block):
-    return DCT_MATRIX @ block @ DCT_MATRIX_T
+    for top, _, start, stop in row_bands(h, band_rows(w), halo=1):
+        band = gray[top:stop] / 255.0
 
+        dx = np.abs(np.diff(band[start - top:], axis=1))
+        profile["col_sum"] += dx.sum(axis=0, dtype=np.float64)
+        profile["col_sq_sum"] += np.square(dx).sum(axis=0, dtype=np.float64)
 
-# ----------------------------------------------------------
-# Extract DCT blocks
-# ----------------------------------------------------------
-def extract_dct_blocks(gray):
+        # Differences of rows (i, i + 1) for i in [top, stop - 1)
+        dy = np.abs(np.diff(band, axis=0))
+        profile["row_sum"][top:stop - 1] = dy.sum(axis=1, dtype=np.float64)
+        profile["row_sq_sum"][top:stop - 1] = np.square(dy).sum(axis=1, dtype=np.float64)
 
-    h, w = gray.shape
-    h -= h % 8
-    w -= w % 8
+    return profile
+
+
+def _line_means(profile, boundary):
+    col_means = profile["col_sum"] / profile["col_count"]
+    row_means = profile["row_sum"] / profile["row_count"]
 
-    blocks = []
+    col_mask = profile["col_boundary"] if boundary else ~profile["col_boundary"]
+    row_mask = profile["row_boundary"] if boundary else ~profile["row_boundary"]
 
-    for y in range(0, h, 8):
-        for x in range(0, w, 8):
+    return col_means[col_mask], row_means[row_mask]
 
-            block = gray[y:y+8, x:x+8].astype(np.float32)
 
-            block = block * 255.0
-            block -= 128.0
+def _pixel_moments(profile, boundary):
+    col_mask = profile["col_boundary"] if boundary else ~profile["col_boundary"]
+    row_mask = profile["row_boundary"] if boundary else ~profile["row_boundary"]
 
-            blocks.append(block_dct(block))
+    count = profile["col_count"] * np.count_nonzero(col_mask) + profile["row_count"] * np.count_nonzero(row_mask)
+    total = profile["col_sum"][col_mask].sum() + profile["row_sum"][row_mask].sum()
+    sq_total = profile["col_sq_sum"][col_mask].sum() + profile["row_sq_sum"][row_mask].sum()
 
-    return blocks
+    return count, total, sq_total
 
 
 # ----------------------------------------------------------
 # JPEG blockiness metric (normalized)
 # ----------------------------------------------------------
-def jpeg_blockiness_metric(gray):
-
-    h, w = gray.shape
-
-    boundary_diffs = []
-    natural_diffs = []
-
-    for i in range(1, w):
-
-        diff = np.abs(gray[:, i] - gray[:, i-1]).mean()
-
-        if i % 8 == 0:
-            boundary_diffs.append(diff)
-        else:
-            natural_diffs.append(diff)
+def jpeg_blockiness_metric(profile):
 
-    for j in range(1, h):
+    boundary_diffs = np.concatenate(_line_means(profile, boundary=True))
+    natural_diffs = np.concatenate(_line_means(profile, boundary=False))
 
-        diff = np.abs(gray[j, :] - gray[j-1, :]).mean()
-
-        if j % 8 == 0:
-            boundary_diffs.append(diff)
-        else:
-            natural_diffs.append(diff)
-
-    boundary = np.mean(boundary_diffs) if boundary_diffs else 0
-    natural = np.mean(natural_diffs) if natural_diffs else 1
+    boundary = np.mean(boundary_diffs) if boundary_diffs.size else 0
+    natural = np.mean(natural_diffs) if natural_diffs.size else 1
 
     return float(boundary / (natural + 1e-8))
 
@@ -91,21 +117,12 @@ def jpeg_blockiness_metric(gray):
 # ----------------------------------------------------------
 # Blocking artifact strength
 # ----------------------------------------------------------
-def blocking_artifact_score(gray):
-
-    h, w = gray.shape
-
-    vertical_scores = []
-    horizontal_scores = []
+def blocking_artifact_score(profile):
 
-    for i in range(8, w, 8):
-        vertical_scores.append(np.mean(np.abs(gray[:, i] - gray[:, i-1])))
+    vertical_scores, horizontal_scores = _line_means(profile, boundary=True)
 
-    for j in range(8, h, 8):
-        horizontal_scores.append(np.mean(np.abs(gray[j, :] - gray[j-1, :])))
-
-    v = np.mean(vertical_scores) if vertical_scores else 0
-    h = np.mean(horizontal_scores) if horizontal_scores else 0
+    v = np.mean(vertical_scores) if vertical_scores.size else 0
+    h = np.mean(horizontal_scores) if horizontal_scores.size else 0
 
     return float(v), float(h)
 
@@ -115,28 +132,30 @@ def blocking_artifact_score(gray):
 # ----------------------------------------------------------
 def dct_statistics(dct_blocks):
 
-    coeffs = np.array(dct_blocks).flatten()
-
-    mean = np.mean(coeffs)
-    std = np.std(coeffs)
+    mean, variance, _, m4 = value_central_moments(dct_blocks)
+    std = np.sqrt(variance)
 
-    kurtosis = np.mean((coeffs - mean) ** 4) / ((std ** 4) + 1e-8)
+    kurtosis = m4 / ((std ** 4) + 1e-8)
 
     return {
         "mean": float(mean),
         "std": float(std),
-        "variance": float(np.var(coeffs)),
+        "variance": float(variance),
         "kurtosis": float(kurtosis),
-        "energy": float(np.mean(coeffs ** 2))
+        "energy": float(variance + mean ** 2)
     }
 
 
 # ----------------------------------------------------------
 # Zero coefficient ratio
 # ----------------------------------------------------------
+# Counted on the float64 shared block DCT, where exact zeros stay within
+# 1e-6. The former float32 transform left ~1e-5 rounding noise on them and
+# undercounted: 0.118 -> 0.147 on the real sample, 0.008 -> 0.012 on the
+# AI ones. Reported only, no scoring rule reads it.
 def dct_zero_ratio(dct_blocks):
 
-    coeffs = np.array(dct_blocks).flatten()
+    coeffs = np.asarray(dct_blocks).ravel()
 
     zero_count = np.sum(np.abs(coeffs) < 1e-6)
 
@@ -148,11 +167,13 @@ def dct_zero_ratio(dct_blocks):
 # ----------------------------------------------------------
 def quantization_periodicity(dct_blocks):
 
-    coeffs = np.array(dct_blocks).flatten()
+    coeffs = np.asarray(dct_blocks, dtype=np.float32).ravel()
 
-    spectrum = np.abs(np.fft.fft(coeffs))
+    # Real input: the half spectrum holds every magnitude of the full one
+    spectrum = np.abs(rfft(coeffs))
+    total = np.sum(spectrum * half_plane_weights(len(coeffs)), dtype=np.float64)
 
-    periodicity = np.max(spectrum[1:]) / (np.sum(spectrum) + 1e-8)
+    periodicity = np.max(spectrum[1:]) / (total + 1e-8)
 
     return float(periodicity)
 
@@ -162,7 +183,7 @@ def quantization_periodicity(dct_blocks):
 # ----------------------------------------------------------
 def double_jpeg_detector(dct_blocks):
 
-    coeffs = np.array(dct_blocks).flatten()
+    coeffs = np.asarray(dct_blocks).ravel()
 
     hist, _ = np.histogram(coeffs, bins=200)
 
@@ -172,35 +193,44 @@ def double_jpeg_detector(dct_blocks):
 
 
 # ----------------------------------------------------------
-# Block boundary variance difference
+# Stored JPEG quantization
 # ----------------------------------------------------------
-def block_boundary_variance(gray):
+def jpeg_quantization(ctx):
 
-    h, w = gray.shape
+    if ctx.format != "jpeg":
+        return None
 
-    boundary_pixels = []
-    natural_pixels = []
+    # The DQT tables sit in the header the container index already walked
+    try:
+        tables = read_quantization_tables(ctx.container)
+    except (ValueError, IndexError):
+        tables = {}
 
-    for i in range(1, w):
+    if not tables:
+        return None
 
-        diff = np.abs(gray[:, i] - gray[:, i-1])
+    luma = tables[min(tables)]
 
-        if i % 8 == 0:
-            boundary_pixels.extend(diff)
-        else:
-            natural_pixels.extend(diff)
+    return {
+        "table_count": len(tables),
+        "estimated_quality": estimate_quality(luma)
+    }
 
-    for j in range(1, h):
 
-        diff = np.abs(gray[j, :] - gray[j-1, :])
+# ----------------------------------------------------------
+# Block boundary variance difference
+# ----------------------------------------------------------
+def block_boundary_variance(profile):
 
-        if j % 8 == 0:
-            boundary_pixels.extend(diff)
-        else:
-            natural_pixels.extend(diff)
+    def variance(boundary, empty):
+        count, total, sq_total = _pixel_moments(profile, boundary)
+        if count == 0:
+            return empty
+        mean = total / count
+        return max(sq_total / count - mean ** 2, 0.0)
 
-    boundary_var = np.var(boundary_pixels) if boundary_pixels else 0
-    natural_var = np.var(natural_pixels) if natural_pixels else 1
+    boundary_var = variance(True, 0)
+    natural_var = variance(False, 1)
 
     return float(boundary_var / (natural_var + 1e-8))
 
@@ -208,29 +238,43 @@ def block_boundary_variance(gray):
 # ----------------------------------------------------------
 # Main Compression Artifact Analysis
 # ----------------------------------------------------------
-def compression_artifact_analysis(image_bytes):
+def compression_artifact_analysis(ctx):
 
-    image = Image.open(BytesIO(image_bytes))
+    image_format = ctx.format.upper() or None
 
-    image_format = image.format
+    dct_blocks = ctx.block_dct
 
-    gray = np.array(image.convert("L")).astype(np.float32) / 255.0
+    if ctx.tiled:
+        profile = difference_profile_tiled(ctx.gray_f32)
+    else:
+        profile = difference_profile(ctx.gray_f32 / 255.0)
 
-    dct_blocks = extract_dct_blocks(gray)
+    jpeg_blockiness = jpeg_blockiness_metric(profile)
 
-    jpeg_blockiness = jpeg_blockiness_metric(gray)
-
-    vertical_block, horizontal_block = blocking_artifact_score(gray)
+    vertical_block, horizontal_block = blocking_artifact_score(profile)
 
     stats = dct_statistics(dct_blocks)
 
     zero_ratio = dct_zero_ratio(dct_blocks)
 
-    periodicity = quantization_periodicity(dct_blocks)
+    # Quantization traces are read from the coefficients the encoder stored
+    # when the bitstream is available, not from a re-transform of pixels
+    jpeg = ctx.jpeg_coefficients
+
+    if jpeg is not None:
+        # Step-q combs live in the dequantized values, double quantization
+        # gaps in the quantized integers
+        periodicity = quantization_periodicity(dequantized_luma(jpeg))
+        double_jpeg = double_jpeg_detector(quantized_luma(jpeg))
+        coefficient_source = "jpeg_bitstream"
+    else:
+        periodicity = quantization_periodicity(dct_blocks)
+        double_jpeg = double_jpeg_detector(dct_blocks)
+        coefficient_source = "pixel_dct"
 
-    double_jpeg = double_jpeg_detector(dct_blocks)
+    quantization = jpeg_quantization(ctx)
 
-    boundary_variance = block_boundary_variance(gray)
+    boundary_variance = block_boundary_variance(profile)
 
     return {
         "compression_analysis": {
@@ -254,12 +298,16 @@ def compression_artifact_analysis(image_bytes):
 
             "block_boundary_variance_ratio": boundary_variance,
 
-            "dct_block_count": len(dct_blocks)
+            "dct_block_count": len(dct_blocks),
+
+            "coefficient_source": coefficient_source,
+
+            "jpeg_quantization": quantization
         }
     }
 
 
-def process(image_bytes):
-    result = compression_artifact_analysis(image_bytes)
+def process(ctx):
+    result = compression_artifact_analysis(ctx)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
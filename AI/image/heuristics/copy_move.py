@@ -1,62 +1,352 @@
 import numpy as np
 import cv2
+from .utils.block_dct import create_dct_matrix
+from .utils.pyramid import NATIVE
+from .utils.tiling import row_bands, band_rows
 
-def load_image_cv(image_bytes):
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    return cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
+REQUIRES = ["gray_f32"]
+# block_features always runs over row bands, tiled or not
+TILED_REQUIRES = REQUIRES
+# Copies are only bit-identical at native resolution; any resampling puts
+# the copy on a different sub-pixel phase than its source
+MAX_PIXELS = NATIVE
+COST = 100
 
-def analyze_copy_move(image_bytes, block_size=16, stride=8):
+BLOCK_SIZE = 16
+
+# Low-frequency DCT coefficients kept per axis (4x4 = 16 features per block)
+FEATURE_SIZE = 4
+
+# Blocks are taken at every pixel (copies land on arbitrary offsets). Past
+# MAX_BLOCKS only one block in ceil(blocks / MAX_BLOCKS) is kept, chosen by
+# content (see sample_blocks), so a block and its copy are kept or dropped
+# together and a copied region keeps the same share of its blocks
+MAX_BLOCKS = 1_000_000
+
+# Quantization step of coefficient (u, v) is QUANT_STEP * (1 + u + v)
+QUANT_STEP = 16.0
+
+# Sampling looks at the leading coefficients quantized SAMPLE_STEP times
+# coarser, so near-duplicates (not just exact ones) share their fate
+SAMPLE_STEP = 4.0
+
+# Blocks flatter than this (low-frequency AC energy per pixel, in gray
+# levels) match everywhere - skies, walls - and are not hashed
+MIN_TEXTURE = 3.0
+
+# Sorted neighbors compared per block, and the feature distance (in
+# quantization steps) that still counts as a near-duplicate
+NEIGHBORS = 4
+MATCH_DISTANCE = 1.0
+
+# Matches closer than this are overlapping blocks or self-similar texture
+MIN_OFFSET = BLOCK_SIZE * 4
+
+# Thresholds are in blocks of the source image, so the same copy is judged
+# alike whatever the resolution and sampling; each kept block stands for
+# sample / scale^2 of them (see source_blocks).
+# MIN_VOTE_AREA: block origins agreeing on one shift before it counts as a
+# cloned region (every pixel of a copy votes, so roughly a 48x48 copy);
+# never fewer than MIN_VOTES kept pairs, below which shifts are noise.
+# MIN_CLONE_AREA: block origins, both ends together, copied along voted
+# shifts before a copy-move is reported (two 64x64 copies, 16x16 blocks)
+MIN_VOTE_AREA = 1024
+MIN_VOTES = 24
+MIN_CLONE_AREA = 48 * 48
+
+# A voted shift must have PEAK_RATIO times the votes of any shift
+# PEAK_RING offsets away (see offset_votes)
+PEAK_RING = 4
+PEAK_RATIO = 2.0
+
+TILING_THRESHOLD = 0.3
+
+_BASIS = create_dct_matrix(BLOCK_SIZE)[:FEATURE_SIZE]
+_STEPS = (QUANT_STEP * (1 + np.add.outer(np.arange(FEATURE_SIZE), np.arange(FEATURE_SIZE)))).ravel().astype(np.float32)
+
+# Random odd multipliers folding the 4 words of a quantized feature vector
+# into one uint64 hash
+_HASH_MULTIPLIERS = (np.random.default_rng(0x5EED).integers(1, 2 ** 62, FEATURE_SIZE ** 2 // 4) | 1).astype(np.uint64)
+
+# Coefficients (flat u * FEATURE_SIZE + v) leading the neighbor-search sort
+# order and deciding the sampling: DC and the first AC terms
+SORT_KEY = [0, 1, 4, 5]
+
+# Random odd multipliers hashing the coarse SORT_KEY terms for sampling
+_SAMPLE_MULTIPLIERS = (np.random.default_rng(0x5A3E).integers(1, 2 ** 31, len(SORT_KEY)) | 1).astype(np.uint32)
+
+
+# ----------------------------------------------------------
+# Block features
+# ----------------------------------------------------------
+def block_sample(shape, block_size=BLOCK_SIZE):
+    """One block in this many is kept, which keeps the count under MAX_BLOCKS."""
+    h, w = shape
+    blocks = max(h - block_size + 1, 1) * max(w - block_size + 1, 1)
+    return -(-blocks // MAX_BLOCKS)
+
+
+def source_blocks(blocks, sample=1, scale=1.0):
+    """Source-image block origins that blocks kept 1 in sample at scale stand for."""
+    return blocks * sample / scale ** 2
+
+
+def sample_blocks(leading, sample):
+    """
+    Flat indices of the blocks kept, 1 in sample: those whose coarsely
+    quantized SORT_KEY planes hash to 0 mod sample. The choice depends only
+    on block content, never on position.
+    """
+    hashes = np.zeros(leading[0].size, dtype=np.uint32)
+    for plane, step, multiplier in zip(leading, _STEPS[SORT_KEY] * SAMPLE_STEP, _SAMPLE_MULTIPLIERS):
+        hashes += np.floor(plane.ravel() / step).astype(np.int32).view(np.uint32) * multiplier
+
+    # The high bits are the well-mixed ones
+    return np.flatnonzero((hashes >> np.uint32(16)) % np.uint32(sample) == 0)
+
+
+def band_features(gray, basis, nx, sample=1):
+    """
+    Features of the blocks starting in the first len(gray) - block_size + 1
+    rows of gray (a band of the image with block_size - 1 context rows
+    below) and their flat indices within the band, see block_features.
+    """
+    block_size = basis.shape[1]
+    ny = len(gray) - block_size + 1
+
+    # Anchored at the kernel start, output (y, x) is the window starting there
+    correlate = lambda image, kernel: cv2.filter2D(
+        image, cv2.CV_32F, kernel, anchor=(0, 0), borderType=cv2.BORDER_CONSTANT
+    )
+
+    rows = [np.ascontiguousarray(correlate(gray, basis[v][None, :])[:, :nx]) for v in range(FEATURE_SIZE)]
+    planes = {}
+
+    def plane(index):
+        if index not in planes:
+            u, v = divmod(index, FEATURE_SIZE)
+            planes[index] = correlate(rows[v], basis[u][:, None])[:ny].ravel()
+        return planes[index]
+
+    keep = sample_blocks([plane(i) for i in SORT_KEY], sample) if sample > 1 else np.arange(ny * nx)
+    if not len(keep):
+        return np.empty((0, FEATURE_SIZE ** 2), dtype=np.float32), keep
+
+    # cv2.merge interleaves the (N,) coefficient columns into (N, 1, 16) at
+    # copy speed; each full plane is dropped once its column is taken
+    columns = []
+    for index in range(FEATURE_SIZE ** 2):
+        columns.append(np.ascontiguousarray(plane(index)[keep]))
+        planes.pop(index)
+
+    return cv2.merge(columns).reshape(len(keep), -1), keep
+
+
+def block_features(gray, block_size=BLOCK_SIZE, sample=1):
+    """
+    Low-frequency 2D DCT of the block_size window at every pixel, computed
+    separably as 1D correlations with the DCT basis: rows first, then the
+    columns of each row projection. With sample > 1 only the blocks
+    sample_blocks keeps are returned.
+
+    Blocks are computed over row bands of block origins (utils.tiling),
+    each reading block_size - 1 rows past its end, so only one band of
+    coefficient planes is held at a time; features and sampling don't
+    depend on the banding.
+
+    Returns (features (N, FEATURE_SIZE**2) float32, ys, xs).
+    """
+    basis = _BASIS if block_size == BLOCK_SIZE else create_dct_matrix(block_size)[:FEATURE_SIZE]
+    gray = np.ascontiguousarray(gray, dtype=np.float32)
+
+    h, w = gray.shape
+    ny, nx = h - block_size + 1, w - block_size + 1
+
+    features, indices = [], []
+    for _, _, start, stop in row_bands(ny, band_rows(w)):
+        band, keep = band_features(gray[start:stop + block_size - 1], basis, nx, sample)
+        features.append(band)
+        indices.append(keep + start * nx)
+
+    ys, xs = np.divmod(np.concatenate(indices), nx)
+
+    return np.concatenate(features), ys, xs
+
+
+# ----------------------------------------------------------
+# Candidate pairs
+# ----------------------------------------------------------
+def candidate_pairs(features):
     """
-    Hunts for identical pixel blocks within the same image.
-    Catches Photoshop 'Clone Stamp' tampering and AI texture tiling.
+    Near-duplicate block pairs (i, j), i < j.
+
+    Blocks are hashed on their quantized features and sorted by a few
+    leading low-frequency terms and then by hash, so every exact bucket is
+    one run; comparing every block with its next NEIGHBORS in sort order
+    catches both bucket mates and near misses that fell across a
+    quantization boundary.
+    """
+    scaled = features / _STEPS
+    quantized = np.floor(scaled).astype(np.int16)
+
+    # The 16 int16 terms of a block are 4 machine words; folding them keeps
+    # the hash at 4 multiplies per block (uint64 arithmetic wraps)
+    hashes = (quantized.view(np.uint64) * _HASH_MULTIPLIERS).sum(axis=1, dtype=np.uint64)
+
+    # 4 x 12-bit leading fields, then the top 15 hash bits, in one int64
+    fields = np.clip(quantized[:, SORT_KEY].astype(np.int64), -(2 ** 11), 2 ** 11 - 1) + 2 ** 11
+    packed = fields @ (2 ** (15 + 12 * np.arange(len(SORT_KEY) - 1, -1, -1)))
+    order = np.argsort(packed | (hashes >> np.uint64(49)).astype(np.int64))
+
+    h = hashes[order]
+    f = scaled[order]
+    pairs = []
+
+    for k in range(1, min(NEIGHBORS, len(order) - 1) + 1):
+        diff = f[k:] - f[:-k]
+        exact = h[k:] == h[:-k]
+        near = np.einsum("ij,ij->i", diff, diff) < MATCH_DISTANCE ** 2
+
+        idx = np.flatnonzero(exact | near)
+        a, b = order[idx], order[idx + k]
+        pairs.append(np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1))
+
+    # Sort positions (i, i + k) differ for every k, so no pair repeats
+    return np.concatenate(pairs) if pairs else np.empty((0, 2), dtype=np.int64)
+
+
+# ----------------------------------------------------------
+# Offset voting
+# ----------------------------------------------------------
+def pair_offsets(pairs, ys, xs):
+    """Canonical (dy, dx) shift of every pair, sign-normalized so dy >= 0."""
+    dy = ys[pairs[:, 1]] - ys[pairs[:, 0]]
+    dx = xs[pairs[:, 1]] - xs[pairs[:, 0]]
+
+    flip = (dy < 0) | ((dy == 0) & (dx < 0))
+    dy = np.where(flip, -dy, dy)
+    dx = np.where(flip, -dx, dx)
+
+    return np.stack([dy, dx], axis=1)
+
+
+def offset_votes(offsets, width):
+    """
+    Unique offsets, their vote counts, how much each stands out and the
+    offset id of every pair.
+
+    A copy rarely lands on a whole-pixel shift after resampling, so its
+    votes spread over neighboring offsets; each offset is credited with
+    the votes of its 3x3 offset neighborhood. A copy is one shift, while
+    smooth or banded texture (haze, sky gradients) matches along a whole
+    run of shifts; the votes PEAK_RING offsets away in 8 directions tell
+    the two apart, and the peak ratio is votes over the largest of those.
+    """
+    # dy >= 0 and |dx| < width, so each offset packs into one integer
+    span = 2 * width + 1
+    codes = offsets[:, 0].astype(np.int64) * span + offsets[:, 1] + width
+
+    codes, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+
+    def shifted(values, shift):
+        idx = np.minimum(np.searchsorted(codes, codes + shift), len(codes) - 1)
+        return np.where(codes[idx] == codes + shift, values[idx], 0)
+
+    votes = np.zeros_like(counts)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            votes += shifted(counts, dy * span + dx)
+
+    # Offsets with dy < 0 are stored sign-flipped, so ring offsets that
+    # cross dy = 0 are only approximately found; the ring stays a lower bound
+    ring = np.zeros_like(votes)
+    for dy in (-PEAK_RING, 0, PEAK_RING):
+        for dx in (-PEAK_RING, 0, PEAK_RING):
+            if dy or dx:
+                ring = np.maximum(ring, shifted(votes, dy * span + dx))
+
+    dy, dx = np.divmod(codes, span)
+
+    return np.stack([dy, dx - width], axis=1), votes, votes / np.maximum(ring, 1), inverse.ravel()
+
+
+# ----------------------------------------------------------
+# Main copy-move / tiling analysis
+# ----------------------------------------------------------
+def analyze_copy_move(ctx, block_size=BLOCK_SIZE):
+    """
+    Hunts for repeated pixel blocks within the same image.
+
+    Every block is matched once; "tiling" counts any distant repeat (AI
+    texture tiling), "clone" only repeats that agree on a common shift
+    (Photoshop 'Clone Stamp' / copy-move tampering).
     """
     try:
-        gray = load_image_cv(image_bytes)
-        if gray is None:
-            return {"error": "Could not decode image"}
-            
+        gray = ctx.gray_f32
+
         h, w = gray.shape
-        
-        # 1. Extract feature vectors for every block
-        blocks = []
-        for y in range(0, h - block_size, stride):
-            for x in range(0, w - block_size, stride):
-                block = gray[y:y+block_size, x:x+block_size]
-                # The fingerprint: [Mean, Std Dev, Y-Coord, X-Coord]
-                fingerprint = [np.mean(block), np.std(block), y, x]
-                blocks.append(fingerprint)
-        
-        if not blocks:
+        if h < block_size or w < block_size:
             return {"error": "Image too small"}
 
-        # 2. Sort blocks by their mathematical fingerprints
-        blocks = np.array(blocks)
-        # Sort by Mean, then by Std Dev
-        sorted_indices = np.lexsort((blocks[:, 1], blocks[:, 0]))
-        sorted_blocks = blocks[sorted_indices]
-        
-        # 3. Check adjacent blocks in the sorted list for exact matches
-        matches = 0
-        for i in range(len(sorted_blocks) - 1):
-            # If the block fingerprints are nearly identical
-            if abs(sorted_blocks[i, 0] - sorted_blocks[i+1, 0]) < 0.5:
-                if abs(sorted_blocks[i, 1] - sorted_blocks[i+1, 1]) < 0.5:
-                    # Check physical distance (ignore blocks that are just touching)
-                    dist = np.sqrt((sorted_blocks[i, 2] - sorted_blocks[i+1, 2])**2 + 
-                                   (sorted_blocks[i, 3] - sorted_blocks[i+1, 3])**2)
-                    if dist > block_size * 2:
-                        matches += 1
-
-        match_ratio = matches / len(blocks)
-        
+        # Thresholds are in source blocks; ctx may be a pyramid level
+        sample = block_sample(gray.shape, block_size)
+        min_votes = max(MIN_VOTES, MIN_VOTE_AREA / source_blocks(1, sample, ctx.scale))
+
+        # 1. Low-frequency DCT fingerprint of every (kept) block
+        features, ys, xs = block_features(gray, block_size, sample)
+        total_blocks = len(features)
+
+        # AC energy: all 16 terms less the DC one
+        texture = np.sqrt(np.einsum("ij,ij->i", features, features) - features[:, 0] ** 2) / block_size
+        textured = np.flatnonzero(texture >= MIN_TEXTURE)
+
+        # 2. Hash + neighbor search for near-duplicate blocks
+        pairs = textured[candidate_pairs(features[textured])] if len(textured) > 1 else np.empty((0, 2), dtype=np.int64)
+
+        # 3. Drop overlapping / touching blocks
+        offsets = pair_offsets(pairs, ys, xs)
+        distant = np.sum(offsets.astype(np.int64) ** 2, axis=1) > MIN_OFFSET ** 2
+        pairs, offsets = pairs[distant], offsets[distant]
+
+        # 4. Vote on the shift between matched blocks
+        unique, counts, peaks, pair_offset = offset_votes(offsets, gray.shape[1])
+        accepted = (counts >= min_votes) & (peaks >= PEAK_RATIO)
+        voted = accepted[pair_offset]
+
+        repeated_blocks = np.count_nonzero(np.bincount(pairs.ravel(), minlength=total_blocks))
+        cloned_blocks = np.count_nonzero(np.bincount(pairs[voted].ravel(), minlength=total_blocks))
+
+        tiling_score = repeated_blocks / total_blocks
+        clone_score = cloned_blocks / total_blocks
+        cloned_area = source_blocks(cloned_blocks, sample, ctx.scale)
+
+        top = np.argsort(np.where(accepted, counts, 0))[::-1][:3]
+        dominant_offsets = [
+            {"dy": int(unique[i, 0]), "dx": int(unique[i, 1]), "votes": int(counts[i])}
+            for i in top if accepted[i]
+        ]
+
         return {
-            "patch_matches_found": matches,
-            "tiling_artifact_score": float(match_ratio),
-            # If more than 2% of the image consists of distant clone twins
-            "is_copy_move_detected": bool(match_ratio > 0.02)
+            "blocks_analyzed": int(total_blocks),
+            # One block in block_sample was kept
+            "block_sample": int(sample),
+            "matched_pairs": int(len(pairs)),
+            "tiling": {
+                "repeated_blocks": int(repeated_blocks),
+                "tiling_artifact_score": float(tiling_score),
+                # >30% of the image repeats somewhere else
+                "is_suspicious": bool(tiling_score > TILING_THRESHOLD)
+            },
+            "clone": {
+                "patch_matches_found": int(cloned_blocks),
+                "clone_score": float(clone_score),
+                "cloned_area": int(cloned_area),
+                "dominant_offsets": dominant_offsets,
+                "is_copy_move_detected": bool(cloned_area >= MIN_CLONE_AREA)
+            }
         }
     except Exception as e:
         return {"error": str(e)}
 
-def process(image_bytes):
-    return analyze_copy_move(image_bytes)
\ No newline at end of file
+def process(ctx):
+    return analyze_copy_move(ctx)
@@ -1,118 +1,250 @@
 from . import human_translator
+from .utils.telemetry import failed
 
-def detect(data):
-    ai_score = 0
-    real_score = 0
-    reasons = []
 
+# ------------------------------------------------
+# Scoring rules
+# ------------------------------------------------
+# Each rule reads one module's result and returns (ai_score, real_score,
+# reasons); results with an "error" key (modules that failed or ran out of
+# time) are skipped rather than scored as missing data. MAX_SCORES holds the most a module can add to either side,
+# which lets the lazy mode below bound what the modules still to run can
+# change.
+
+def score_metadata(result):
+    ai_score, real_score, reasons = 0, 0, []
 
-    meta = data.get("metadata", {}).get("analysis", {})
+    meta = result.get("analysis", {})
     if meta.get("has_exif") and meta.get("camera_valid"):
         real_score += 2
     else:
         ai_score += 1
         reasons.append("missing camera metadata")
 
-    c2pa_data = data.get("c2pa", {})
-    if c2pa_data.get("c2pa_present") and c2pa_data.get("valid_signature"):
-        real_score += 5
-        reasons.append("verified provenance signature")
+    if meta.get("generator_signatures") or meta.get("generation_parameters_detected"):
+        ai_score += 5
+        reasons.append("AI generator signature in metadata")
+
+    return ai_score, real_score, reasons
+
+
+def score_c2pa(result):
+    if result.get("c2pa_present") and result.get("valid_signature"):
+        # A trusted manifest can itself declare generated content
+        if result.get("ai_generated"):
+            return 5, 0, ["verified provenance declares AI-generated content"]
+        return 0, 5, ["verified provenance signature"]
+    return 0, 0, []
+
 
-    spn = data.get("sensor_pattern_noise", {}).get("spn_metrics", {})
+def score_watermark(result):
+    decoded = result.get("invisible_watermark", {})
+    if decoded.get("detected"):
+        return 6, 0, [f"invisible {decoded.get('name')} watermark decoded ({decoded.get('method')})"]
+    return 0, 0, []
+
+
+def score_sensor_pattern_noise(result):
+    match = result.get("prnu_match", {})
+    if match.get("matched"):
+        return 0, 5, [f"sensor fingerprint matches a known {match.get('model') or 'camera'} (PCE {match.get('pce', 0):.0f})"]
+
+    spn = result.get("spn_metrics", {})
     if spn.get("horizontal_correlation", 0) > 0.75 and spn.get("vertical_correlation", 0) > 0.75:
-        real_score += 3
-    else:
-        ai_score += 2
-        reasons.append("weak sensor noise pattern")
+        return 0, 3, []
+    return 2, 0, ["weak sensor noise pattern"]
 
-    gan = data.get("gan", {}).get("gan_checkerboard_artifacts", {})
+
+def score_gan(result):
+    ai_score, reasons = 0, []
+
+    gan = result.get("gan_checkerboard_artifacts", {})
     if gan.get("mean_checker_peaks", 0) > 10:
         ai_score += 2
         reasons.append("checkerboard GAN artifacts")
 
-    diff = data.get("gan", {}).get("diffusion_sampling_artifacts", {})
+    diff = result.get("diffusion_sampling_artifacts", {})
     if diff.get("radial_peak_density", 0) > 0.35:
         ai_score += 2
         reasons.append("diffusion sampling artifacts")
 
+    return ai_score, 0, reasons
+
 
-    physics = data.get("physics_geometry", {}).get("physics_and_geometry", {})
+def score_physics_geometry(result):
+    physics = result.get("physics_and_geometry", {})
     illumination = physics.get("illumination", {})
-    perspective = physics.get("perspective", {})
-    
+
     if illumination.get("lighting_consistency_score", 0) > 0.9:
-        real_score += 2
-    elif illumination.get("lighting_angle_variance", 0) > 1.2:
-        ai_score += 2
-        reasons.append("inconsistent lighting geometry")
+        return 0, 2, []
+    if illumination.get("lighting_angle_variance", 0) > 1.2:
+        return 2, 0, ["inconsistent lighting geometry"]
+    return 0, 0, []
 
 
-    ela = data.get("ela_analysis", {})
-    if ela.get("is_suspicious"):
-        ai_score += 3
-        reasons.append("inconsistent compression levels")
-    else:
-        real_score += 1
+def score_ela(result):
+    if result.get("is_suspicious"):
+        return 3, 0, ["inconsistent compression levels"]
+    return 0, 1, []
 
 
-    ae = data.get("autoencoder_reconstruction", {})
-    if ae.get("is_suspiciously_simple"):
-        ai_score += 3
-        reasons.append("low latent complexity")
-    else:
-        real_score += 2
+def score_autoencoder(result):
+    if result.get("is_suspiciously_simple"):
+        return 3, 0, ["low latent complexity"]
+    return 0, 2, []
 
 
-    latent = data.get("diffusion_latent_analysis", {})
-    if latent.get("is_diffusion_aligned"):
-        ai_score += 4
-        reasons.append("Gaussian noise alignment (Diffusion)")
-    elif latent.get("latent_kurtosis", 0) > 50:
-        real_score += 3
-        reasons.append("natural high-kurtosis noise")
+def score_diffusion_latent(result):
+    if result.get("is_diffusion_aligned"):
+        return 4, 0, ["Gaussian noise alignment (Diffusion)"]
+    if result.get("latent_kurtosis", 0) > 50:
+        return 0, 3, ["natural high-kurtosis noise"]
+    return 0, 0, []
 
 
-    benford = data.get("benfords_law", {})
-    if "benford_chi_square" in benford:
-        chi_val = benford.get("benford_chi_square", 1.0)
+# Chi-square of the first digits of the non-zero block DCT coefficients.
+# Exact zeros used to be counted through their float32 rounding noise;
+# without them the statistic moved by +0.0003 to +0.003 on the dataset
+# samples (ranking unchanged). That puts a 5.5 MP upscale of a real
+# sample at 0.050, on the real threshold; recheck both thresholds when
+# they are next tuned on a labelled set.
+def score_benford(result):
+    if "benford_chi_square" in result:
+        chi_val = result.get("benford_chi_square", 1.0)
         if chi_val < 0.05:
-            real_score += 3
-        elif chi_val > 0.15:
-            ai_score += 3
-            reasons.append("unnatural Benford's Law statistical distribution")
+            return 0, 3, []
+        if chi_val > 0.15:
+            return 3, 0, ["unnatural Benford's Law statistical distribution"]
+    return 0, 0, []
 
 
-    ca = data.get("chromatic_aberration", {})
-    if ca.get("has_natural_lens_dispersion"):
-        real_score += 3
-    elif ca.get("aberration_shift", 1.0) < 0.005:
-        ai_score += 2
-        reasons.append("unnatural edge-to-edge optical perfection")
+def score_chromatic_aberration(result):
+    if result.get("has_natural_lens_dispersion"):
+        return 0, 3, []
+    if result.get("aberration_shift", 1.0) < 0.005:
+        return 2, 0, ["unnatural edge-to-edge optical perfection"]
+    return 0, 0, []
+
 
+def score_copy_move(result):
+    ai_score, reasons = 0, []
 
-    patch = data.get("patch_analysis", {})
-    if patch.get("is_suspicious"):
+    tiling = result.get("tiling", {})
+    if tiling.get("is_suspicious"):
         ai_score += 2
         reasons.append("suspicious repeating texture patches detected")
 
-
-    copy_move_data = data.get("copy_move", {})
-    if copy_move_data.get("is_copy_move_detected"):
+    clone = result.get("clone", {})
+    if clone.get("is_copy_move_detected"):
         ai_score += 3
-        matches = copy_move_data.get("patch_matches_found", 0)
-        reasons.append(f"copy-move forgery detected ({matches} cloned blocks)")
+        area = clone.get("cloned_area", 0)
+        reasons.append(f"copy-move forgery detected ({area} cloned blocks)")
 
+    return ai_score, 0, reasons
 
-    freq = data.get("frequency_domain_analysis", {}).get("frequency_analysis", {})
+
+# Only the spectral flatness is scored; dct_analysis block_energy_* are
+# L1 energies of the orthonormal block DCT (about 0.11-0.12x their old FFT
+# scale) and are reported only
+def score_frequency_domain(result):
+    freq = result.get("frequency_analysis", {})
     if freq.get("spectral_flatness", 0) > 0.995:
-        ai_score += 1
-        reasons.append("flat frequency spectrum")
+        return 1, 0, ["flat frequency spectrum"]
+    return 0, 0, []
+
 
-    pert = data.get("perturbation", {}).get("perturbation_robustness", {})
+def score_perturbation(result):
+    pert = result.get("perturbation_robustness", {})
     if pert.get("std_similarity", 1) < 0.001:
-        ai_score += 1
-        reasons.append("overly stable perturbation embedding")
+        return 1, 0, ["overly stable perturbation embedding"]
+    return 0, 0, []
+
+
+# (result key, rule) in the order reasons are reported
+RULES = [
+    ("metadata", score_metadata),
+    ("c2pa", score_c2pa),
+    ("watermark", score_watermark),
+    ("sensor_pattern_noise", score_sensor_pattern_noise),
+    ("gan", score_gan),
+    ("physics_geometry", score_physics_geometry),
+    ("ela_analysis", score_ela),
+    ("autoencoder_reconstruction", score_autoencoder),
+    ("diffusion_latent_analysis", score_diffusion_latent),
+    ("benfords_law", score_benford),
+    ("chromatic_aberration", score_chromatic_aberration),
+    ("copy_move", score_copy_move),
+    ("frequency_domain_analysis", score_frequency_domain),
+    ("perturbation", score_perturbation),
+]
+
+# Most a module can add to (ai_score, real_score); modules without a rule
+# never move the verdict
+MAX_SCORES = {
+    "metadata": (6, 2),
+    "c2pa": (5, 5),
+    "watermark": (6, 0),
+    "sensor_pattern_noise": (2, 5),
+    "gan": (4, 0),
+    "physics_geometry": (2, 2),
+    "ela_analysis": (3, 1),
+    "autoencoder_reconstruction": (3, 2),
+    "diffusion_latent_analysis": (4, 3),
+    "benfords_law": (3, 3),
+    "chromatic_aberration": (2, 3),
+    "copy_move": (5, 0),
+    "frequency_domain_analysis": (1, 0),
+    "perturbation": (1, 0),
+}
+
+def score(data, keys=None):
+    """(ai_score, real_score, reasons) over the rules of keys (default: all)."""
+    ai_score, real_score, reasons = 0, 0, []
+
+    for key, rule in RULES:
+        if keys is not None and key not in keys:
+            continue
+        result = data.get(key, {})
+        if failed(result):
+            continue
+        ai, real, why = rule(result)
+        ai_score += ai
+        real_score += real
+        reasons.extend(why)
+
+    return ai_score, real_score, reasons
+
+
+def settled_mark(ai_score, real_score, remaining):
+    """
+    The mark no remaining module can flip any more, or None. remaining are
+    the result keys still to run; scores only ever grow, so the verdict is
+    settled once one side stays ahead even if every remaining module gives
+    the other side its maximum.
+    """
+    max_ai = sum(MAX_SCORES.get(key, (0, 0))[0] for key in remaining)
+    max_real = sum(MAX_SCORES.get(key, (0, 0))[1] for key in remaining)
+
+    if ai_score > real_score + max_real:
+        return "AI"
+    if real_score > ai_score + max_ai:
+        return "NONAI"
+    return None
+
+
+# ------------------------------------------------
+# Verdict
+# ------------------------------------------------
+
+def mark_of(ai_score, real_score):
+    if ai_score > real_score:
+        return "AI"
+    if real_score > ai_score:
+        return "NONAI"
+    return "UNCERTAIN"
+
 
+def verdict(data, ai_score, real_score, reasons):
 
     total = ai_score + real_score
     if total == 0:
@@ -120,12 +252,7 @@ def detect(data):
 
     confidence = (max(ai_score, real_score) / total) * 100
 
-    if ai_score > real_score:
-        mark = "AI"
-    elif real_score > ai_score:
-        mark = "NONAI"
-    else:
-        mark = "UNCERTAIN"
+    mark = mark_of(ai_score, real_score)
 
     human_friendly_reason = human_translator.translate_forensics(
         mark=mark, 
@@ -142,5 +269,44 @@ def detect(data):
         "reason": human_friendly_reason,
     }
 
+
+def detect(data):
+    """Verdict over the modules present in data (all of them by default)."""
+    return verdict(data, *score(data, data.keys()))
+
+
+def detect_lazy(modules, run_module):
+    """
+    Early-exit verdict. modules are (result key, module) pairs; only those
+    with a scoring rule are run, cheapest first (by the module's COST), and
+    evaluation stops as soon as the remaining ones can no longer flip the
+    mark. run_module(key, module) returns a module's result.
+
+    The verdict lists the modules that were never run under
+    "skipped_modules"; its confidence covers the modules that ran.
+    """
+    scored = sorted(
+        ((key, module) for key, module in modules if key in MAX_SCORES),
+        key=lambda item: getattr(item[1], "COST", float("inf"))
+    )
+
+    data = {}
+    remaining = [key for key, _ in scored]
+
+    for key, module in scored:
+        data[key] = run_module(key, module)
+        remaining.remove(key)
+
+        ai_score, real_score, _ = score(data, data.keys())
+        if remaining and settled_mark(ai_score, real_score, remaining):
+            break
+
+    skipped = [key for key, _ in modules if key not in data]
+
+    result = verdict(data, *score(data, data.keys()))
+    result["skipped_modules"] = skipped
+    return result
+
+
 def process(data):
-    return detect(data)
\ No newline at end of file
+    return detect(data)
@@ -1,12 +1,13 @@
 import numpy as np
 import cv2
+from .utils.moments import value_central_moments
+from .utils.pyramid import NATIVE
 
-def load_image_cv(image_bytes):
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    return img.astype(np.float32)
+REQUIRES = ["gray_f32"]
+MAX_PIXELS = NATIVE
+COST = 10
 
-def analyze_diffusion_latents(image_bytes):
+def analyze_diffusion_latents(ctx):
     """
     Diffusion Latent Analysis
     Analyzes the statistical distribution of high-frequency noise.
@@ -14,7 +15,7 @@ def analyze_diffusion_latents(image_bytes):
     Real images have 'heavy-tailed' physical noise.
     """
     try:
-        gray = load_image_cv(image_bytes)
+        gray = ctx.gray_f32
         
         # 1. Extract High-Frequency Residuals (The 'Latent' Noise)
         # We use a Laplacian filter to remove the visual content
@@ -22,18 +23,18 @@ def analyze_diffusion_latents(image_bytes):
         
         # 2. Calculate Higher-Order Statistics
         # Mean and Std are too simple; we need Kurtosis and Skewness
-        mu = np.mean(laplacian)
-        sigma = np.std(laplacian)
+        mu, m2, m3, m4 = value_central_moments(laplacian)
+        sigma = np.sqrt(m2)
         
         if sigma == 0:
             return {"error": "Image has no variance (solid color)"}
             
         # Kurtosis: Measures how 'Gaussian' the noise is.
         # Normal Gaussian distribution has a Kurtosis of ~3.0.
-        kurtosis = np.mean(((laplacian - mu) / sigma) ** 4)
+        kurtosis = m4 / sigma ** 4
         
         # Skewness: Measures the asymmetry of the noise.
-        skewness = np.mean(((laplacian - mu) / sigma) ** 3)
+        skewness = m3 / sigma ** 3
         
         # 3. Diffusion Alignment Logic
         # Diffusion models are trained to produce Gaussian noise (Kurtosis ~3).
@@ -49,5 +50,5 @@ def analyze_diffusion_latents(image_bytes):
     except Exception as e:
         return {"error": str(e)}
 
-def process(image_bytes):
-    return analyze_diffusion_latents(image_bytes)
\ No newline at end of file
+def process(ctx):
+    return analyze_diffusion_latents(ctx)
\ No newline at end of file
@@ -1,8 +1,19 @@
 import numpy as np
 from PIL import Image, ImageChops, ImageEnhance
 from io import BytesIO
+from .utils.pyramid import NATIVE
+from .utils.tiling import row_bands, band_rows, BAND_ALIGN
 
-def perform_ela(image_bytes, quality=90):
+REQUIRES = []
+TILED_REQUIRES = []
+MAX_PIXELS = NATIVE
+COST = 40
+
+# Context rows around a band: one MCU row each side keeps the encoder's
+# blocks and the decoder's chroma upsampling identical to the full frame
+ELA_HALO = BAND_ALIGN
+
+def perform_ela(ctx, quality=90):
     """
     Error Level Analysis (ELA)
     Checks for inconsistent compression levels. 
@@ -10,7 +21,7 @@ def perform_ela(image_bytes, quality=90):
     """
     try:
         # 1. Load the original image
-        original = Image.open(BytesIO(image_bytes)).convert('RGB')
+        original = ctx.pil
         
         # 2. Resave it at a known quality (temporary buffer)
         temp_buffer = BytesIO()
@@ -47,5 +58,58 @@ def perform_ela(image_bytes, quality=90):
     except Exception as e:
         return {"error": str(e)}
 
-def process(image_bytes):
-    return perform_ela(image_bytes)
\ No newline at end of file
+def ela_summary(values, counts):
+    """Stats of the enhanced ELA image from a histogram of its pixel values."""
+    count = counts.sum()
+    mean = values @ counts / count
+    std = np.sqrt(np.square(values - mean) @ counts / count)
+
+    return {
+        "ela_score": float(mean),
+        "ela_max_variation": float(values[counts > 0].max()),
+        "ela_std_deviation": float(std),
+        "is_suspicious": bool(mean > 15.0 or std > 20.0)
+    }
+
+
+def perform_ela_tiled(ctx, quality=90):
+    """
+    perform_ela on row bands: every band (plus ELA_HALO rows) is resaved
+    on its own and only a 256-bin histogram of the difference is kept. The
+    brightness enhancement is then applied to the histogram levels, which
+    gives the full-frame stats without a full-frame difference image.
+    """
+    try:
+        original = ctx.pil
+        width, height = original.size
+
+        counts = np.zeros(256, dtype=np.int64)
+
+        for top, bottom, start, stop in row_bands(height, band_rows(width), halo=ELA_HALO):
+            band = original.crop((0, top, width, bottom))
+
+            temp_buffer = BytesIO()
+            band.save(temp_buffer, format='JPEG', quality=quality)
+            temp_buffer.seek(0)
+            resaved = Image.open(temp_buffer)
+
+            diff = np.asarray(ImageChops.difference(band, resaved))[start - top:stop - top]
+            counts += np.bincount(diff.ravel(), minlength=256)
+
+        max_diff = int(np.flatnonzero(counts).max()) if counts.any() else 0
+        if max_diff == 0:
+            max_diff = 1
+        scale = 255.0 / max_diff
+
+        # Enhancing one pixel per level gives the exact per-level mapping
+        levels = Image.fromarray(np.repeat(np.arange(256, dtype=np.uint8)[None, :, None], 3, axis=2))
+        enhanced = np.asarray(ImageEnhance.Brightness(levels).enhance(scale))[0, :, 0].astype(np.float64)
+
+        return ela_summary(enhanced, counts)
+    except Exception as e:
+        return {"error": str(e)}
+
+def process(ctx):
+    if ctx.tiled:
+        return perform_ela_tiled(ctx)
+    return perform_ela(ctx)
\ No newline at end of file
@@ -1,17 +1,18 @@
 import json
 import numpy as np
-import pywt
-from PIL import Image
-from io import BytesIO
+from .utils.block_dct import DC_OFFSET, CHUNK_BLOCKS
+from .utils.fft import centered_magnitude
+from .utils.moments import RunningMoments
+from .utils.pyramid import NATIVE, GLOBAL_MAX_PIXELS
+from .utils.tiling import row_bands, band_rows
 
-
-# ------------------------------------------------
-# Image Loader
-# ------------------------------------------------
-
-def load_image(image_bytes):
-    img = Image.open(BytesIO(image_bytes)).convert("L")
-    return np.array(img, dtype=np.float32)
+# The 8x8 DCT grid and the noise residual are read at native resolution,
+# in chunks and row bands; the spectrum and wavelet statistics are global
+# and read the SPECTRUM_MAX_PIXELS pyramid level instead
+REQUIRES = ["gray_f32", "block_dct"]
+MAX_PIXELS = NATIVE
+SPECTRUM_MAX_PIXELS = GLOBAL_MAX_PIXELS
+COST = 80
 
 
 # ------------------------------------------------
@@ -19,9 +20,7 @@ def load_image(image_bytes):
 # ------------------------------------------------
 
 def compute_fft(image):
-    fft = np.fft.fft2(image)
-    fft_shift = np.fft.fftshift(fft)
-    spectrum = np.log1p(np.abs(fft_shift))
+    spectrum = np.log1p(centered_magnitude(image))
     return spectrum
 
 
@@ -137,9 +136,9 @@ def axis_energy_imbalance(spec):
 # Wavelet Texture Analysis
 # ------------------------------------------------
 
-def wavelet_analysis(image):
+def wavelet_analysis(coeffs):
 
-    LL, (LH, HL, HH) = pywt.dwt2(image, "haar")
+    LL, (LH, HL, HH) = coeffs
 
     e_ll = np.sum(np.abs(LL))
     e_lh = np.sum(np.abs(LH))
@@ -160,27 +159,19 @@ def wavelet_analysis(image):
 # DCT Block Grid Analysis
 # ------------------------------------------------
 
-def dct_grid_analysis(image):
-
-    h, w = image.shape
-
-    h -= h % 8
-    w -= w % 8
-
-    image = image[:h, :w]
-
-    energies = []
+def dct_grid_analysis(dct_blocks, chunk=CHUNK_BLOCKS):
 
-    for i in range(0, h, 8):
-        for j in range(0, w, 8):
+    # L1 energy per block; the shared blocks are JPEG level-shifted, so swap
+    # in the raw DC magnitude. The orthonormal DCT puts these at about 0.11-0.12x
+    # the per-block FFT magnitude sums reported before (measured on the
+    # dataset samples); no scoring rule reads them
+    energies = np.empty(len(dct_blocks))
 
-            block = image[i:i+8, j:j+8]
-
-            dct = np.fft.fft2(block)
-
-            energies.append(np.sum(np.abs(dct)))
-
-    energies = np.array(energies)
+    for i in range(0, len(dct_blocks), chunk):
+        blocks = dct_blocks[i:i + chunk]
+        dc = blocks[:, 0, 0]
+        energies[i:i + chunk] = np.abs(blocks).sum(axis=(1, 2), dtype=np.float64)
+        energies[i:i + chunk] += np.abs(dc + DC_OFFSET) - np.abs(dc)
 
     return {
         "block_energy_mean": float(np.mean(energies)),
@@ -194,19 +185,30 @@ def dct_grid_analysis(image):
 
 def noise_analysis(image):
 
-    blur = (
-        image[:-2,1:-1] +
-        image[2:,1:-1] +
-        image[1:-1,:-2] +
-        image[1:-1,2:]
-    ) / 4
+    h, w = image.shape
+    residuals = RunningMoments()
+
+    # Row bands with one context row on each side for the 4-neighbor blur
+    for top, bottom, start, stop in row_bands(h, band_rows(w), halo=1):
+        band = image[top:bottom]
+
+        blur = (
+            band[:-2,1:-1] +
+            band[2:,1:-1] +
+            band[1:-1,:-2] +
+            band[1:-1,2:]
+        ) / 4
 
-    residual = image[1:-1,1:-1] - blur
+        # Residual row r is band row r + 1; centers are rows 1..h-2
+        centers = slice(max(start, 1) - top - 1, min(stop, h - 1) - top - 1)
+        residuals.add((band[1:-1,1:-1] - blur)[centers])
+
+    mean, variance = residuals.central()[:2]
 
     return {
-        "noise_mean": float(np.mean(residual)),
-        "noise_std": float(np.std(residual)),
-        "noise_variance": float(np.var(residual))
+        "noise_mean": float(mean),
+        "noise_std": float(np.sqrt(variance)),
+        "noise_variance": float(variance)
     }
 
 
@@ -214,11 +216,14 @@ def noise_analysis(image):
 # Main Forensic Pipeline
 # ------------------------------------------------
 
-def forensic_analysis(image_bytes):
+def forensic_analysis(ctx):
+
+    img = ctx.gray_f32
 
-    img = load_image(image_bytes)
+    # Global statistics on the capped pyramid level (this one when smaller)
+    coarse = ctx.level_for(SPECTRUM_MAX_PIXELS)
 
-    spec = compute_fft(img)
+    spec = coarse.spectrum
 
     radial = radial_profile(spec)
 
@@ -243,9 +248,9 @@ def forensic_analysis(image_bytes):
             "radial_power_spectrum_sample": radial[:40].tolist()
         },
 
-        "wavelet_analysis": wavelet_analysis(img),
+        "wavelet_analysis": wavelet_analysis(coarse.dwt2("haar")),
 
-        "dct_analysis": dct_grid_analysis(img),
+        "dct_analysis": dct_grid_analysis(ctx.block_dct),
 
         "noise_analysis": noise_analysis(img)
     }
@@ -253,7 +258,7 @@ def forensic_analysis(image_bytes):
     return result
 
 
-def process(image_bytes):
-    result = forensic_analysis(image_bytes)
+def process(ctx):
+    result = forensic_analysis(ctx)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
@@ -1,92 +1,127 @@
 import json
+import math
 import numpy as np
-from PIL import Image
-from io import BytesIO
+from numpy.lib.stride_tricks import sliding_window_view
+from .utils.integral_image import window_grid
+from .utils.fft import rfft
+from .utils.pyramid import NATIVE, GLOBAL_MAX_PIXELS
 
-
-def load_image(image_data):
-
-    if isinstance(image_data, bytes):
-        img = Image.open(BytesIO(image_data))
-    elif isinstance(image_data, str):
-        img = Image.open(image_data)
-    else:
-        raise ValueError("Unsupported image input")
-
-    img = img.convert("L")
-    img = np.array(img).astype(np.float32) / 255.0
-    return img
+# Upsampling checkerboards repeat every few pixels and 2x2 area averaging
+# cancels them, so the patch projections read the native image; the
+# diffusion radial profile is a global spectrum and reads the
+# SPECTRUM_MAX_PIXELS pyramid level
+REQUIRES = ["gray_f32"]
+MAX_PIXELS = NATIVE
+SPECTRUM_MAX_PIXELS = GLOBAL_MAX_PIXELS
+COST = 30
 
 
 # -----------------------------
 # SIMPLE PEAK DETECTOR
 # -----------------------------
 
-def find_peaks(signal, height):
+def peak_mask(signals, height):
+    """
+    Strict local maxima above height along the last axis, for any number
+    of signals at once. height broadcasts against signals[..., 0].
+    """
+    signals = np.asarray(signals)
+    height = np.asarray(height)[..., None]
 
-    peaks = []
-    n = len(signal)
+    inner = signals[..., 1:-1]
+    mask = np.zeros(signals.shape, dtype=bool)
+    mask[..., 1:-1] = (inner > signals[..., :-2]) & (inner > signals[..., 2:]) & (inner > height)
 
-    for i in range(1, n - 1):
-        if signal[i] > signal[i-1] and signal[i] > signal[i+1] and signal[i] > height:
-            peaks.append(i)
+    return mask
+
+
+def find_peaks(signal, height):
 
-    return peaks
+    return np.flatnonzero(peak_mask(signal, height))
 
 
 # -----------------------------
 # PATCH GENERATOR
 # -----------------------------
 
-def extract_patches(img, patch_size=128, stride=64):
+def patch_projections(img, patch_size=128, stride=64):
+    """
+    Column and row sums of every patch_size patch on a stride grid, each
+    (ny, nx, patch_size). Patch origins are range(0, h - patch_size, stride).
 
+    The image is summed once into bands of gcd(patch_size, stride) rows
+    (and columns); every patch strip is then a difference of cumulative
+    band sums, so no patch is copied.
+    """
     h, w = img.shape
-    patches = []
+    ny, nx = window_grid((h, w), (patch_size, patch_size), stride, stop=(h - patch_size, w - patch_size))
 
-    for y in range(0, h - patch_size, stride):
-        for x in range(0, w - patch_size, stride):
-            patches.append(img[y:y+patch_size, x:x+patch_size])
+    band = math.gcd(patch_size, stride)
+    span = patch_size // band
+    ys = np.arange(ny) * (stride // band)
+    xs = np.arange(nx) * (stride // band)
 
-    return patches
+    bands = img[:h // band * band].reshape(-1, band, w).sum(axis=1, dtype=np.float64)
+    bands = np.concatenate([np.zeros((1, w)), np.cumsum(bands, axis=0)])
+    strips = bands[ys + span] - bands[ys]
+    col_sums = sliding_window_view(strips, patch_size, axis=1)[:, xs * band]
+
+    bands = img[:, :w // band * band].reshape(h, -1, band).sum(axis=2, dtype=np.float64)
+    bands = np.concatenate([np.zeros((h, 1)), np.cumsum(bands, axis=1)], axis=1)
+    strips = bands[:, xs + span] - bands[:, xs]
+    row_sums = sliding_window_view(strips, patch_size, axis=0)[ys * band]
+
+    return col_sums, row_sums
 
 
 # -----------------------------
 # GAN CHECKERBOARD DETECTION
 # -----------------------------
 
-def checkerboard_score_patch(patch):
+def centered_axis_spectrum(projections):
+    """
+    log |F| along the centre row (or column) of every patch's fftshift-ed
+    2-D spectrum.
 
-    f = np.fft.fft2(patch)
-    fshift = np.fft.fftshift(f)
-    spectrum = np.log(np.abs(fshift) + 1e-8)
+    The ky = 0 row of a 2-D DFT is the 1-D DFT of the patch's column sums
+    (and the kx = 0 column that of its row sums), so one batched rfft over
+    the projections replaces a full fft2 per patch. The real input makes
+    |F(-k)| = |F(k)|, which fills in the negative half.
+    """
+    n = projections.shape[-1]
 
-    h, w = spectrum.shape
-    cy, cx = h // 2, w // 2
+    magnitude = np.abs(rfft(projections, axis=-1))
+    shifted = magnitude[..., np.abs(np.arange(n) - n // 2)]
+
+    return np.log(shifted + 1e-8)
 
-    spectrum[cy-5:cy+5, cx-5:cx+5] = 0
 
-    horiz = spectrum[cy]
-    vert = spectrum[:, cx]
+def checkerboard_scores(col_sums, row_sums):
 
-    threshold_h = np.mean(horiz) * 2
-    threshold_v = np.mean(vert) * 2
+    horiz = centered_axis_spectrum(col_sums)
+    vert = centered_axis_spectrum(row_sums)
 
-    peaks_h = find_peaks(horiz, threshold_h)
-    peaks_v = find_peaks(vert, threshold_v)
+    c = horiz.shape[-1] // 2
 
-    return len(peaks_h) + len(peaks_v)
+    # The low-frequency centre of the spectrum is ignored
+    horiz[..., c-5:c+5] = 0
+    vert[..., c-5:c+5] = 0
 
+    threshold_h = np.mean(horiz, axis=-1) * 2
+    threshold_v = np.mean(vert, axis=-1) * 2
 
-def detect_gan_checkerboard(img):
+    peaks_h = np.count_nonzero(peak_mask(horiz, threshold_h), axis=-1)
+    peaks_v = np.count_nonzero(peak_mask(vert, threshold_v), axis=-1)
 
-    patches = extract_patches(img)
+    return (peaks_h + peaks_v).ravel()
 
-    scores = []
 
-    for p in patches:
-        scores.append(checkerboard_score_patch(p))
+def detect_gan_checkerboard(img, scale=1.0):
+    """Checkerboard peak statistics of the patches of img * scale."""
+    col_sums, row_sums = patch_projections(img)
 
-    scores = np.array(scores)
+    # Projections are linear, so scaling them spares a scaled image copy
+    scores = checkerboard_scores(col_sums * scale, row_sums * scale)
 
     return {
         "mean_checker_peaks": float(np.mean(scores)),
@@ -117,11 +152,9 @@ def radial_profile(spectrum):
     return radial_mean
 
 
-def diffusion_artifacts(img):
+def diffusion_artifacts(magnitude):
 
-    f = np.fft.fft2(img)
-    fshift = np.fft.fftshift(f)
-    spectrum = np.abs(fshift)
+    spectrum = magnitude / 255.0
 
     radial = radial_profile(spectrum)
 
@@ -140,12 +173,10 @@ def diffusion_artifacts(img):
 # MAIN PIPELINE
 # -----------------------------
 
-def detect_gan_diffusion_artifacts(image_data):
-
-    img = load_image(image_data)
+def detect_gan_diffusion_artifacts(ctx):
 
-    gan = detect_gan_checkerboard(img)
-    diffusion = diffusion_artifacts(img)
+    gan = detect_gan_checkerboard(ctx.gray_f32, 1 / 255.0)
+    diffusion = diffusion_artifacts(ctx.level_for(SPECTRUM_MAX_PIXELS).magnitude)
 
     return {
         "gan_checkerboard_artifacts": gan,
@@ -153,7 +184,7 @@ def detect_gan_diffusion_artifacts(image_data):
     }
 
 
-def process(image_bytes):
-    result = detect_gan_diffusion_artifacts(image_bytes)
+def process(ctx):
+    result = detect_gan_diffusion_artifacts(ctx)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
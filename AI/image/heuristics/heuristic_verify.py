@@ -1,3 +1,4 @@
+import os
 import logging
 from . import metadata
 from . import c2pa
@@ -15,59 +16,100 @@ from . import autoencoder_reconstruction
 from . import diffusion_latent_analysis
 from . import benfords_law
 from . import chromatic_aberration
-from . import patch_analyzer
 from . import copy_move
 from . import decision_engine
+from . import profiles
+from .utils.image_context import ImageContext
+from .utils import scheduler, telemetry
 
 logger = logging.getLogger(__name__)
 
-def verify(img):
+# Lazy mode runs the scored modules one by one, cheapest first, and stops
+# once the verdict can no longer flip (see decision_engine.detect_lazy)
+HEURISTIC_LAZY = os.getenv("HEURISTIC_LAZY", "0").lower() in ("1", "true", "yes")
+
+# Some evidence settles the verdict on its own (a valid C2PA manifest from a
+# trusted signer, a decoded generator watermark): modules exposing
+# decisive_mark(result) run first, cheapest first, and the first mark they
+# return skips everything else
+HEURISTIC_SHORTCUT = os.getenv("HEURISTIC_SHORTCUT", "1").lower() in ("1", "true", "yes")
+
+# (result key, module) pairs in the order decision_engine receives them.
+# Every module exposes process(ctx), a REQUIRES list of ImageContext inputs,
+# the MAX_PIXELS pyramid budget it is analysed at and a relative COST that
+# orders lazy evaluation.
+HEURISTIC_MODULES = [
+    ("metadata", metadata),
+    ("c2pa", c2pa),
+    ("watermark", watermark),
+    ("visual", visual_artifacts),
+    ("frequency_domain_analysis", frequency_domain_analysis),
+    ("pixel", pixel_level_analysis),
+    ("sensor_pattern_noise", sensor_pattern_noise),
+    ("compression_artifact_analysis", compression_artifact_analysis),
+    ("gan", gan),
+    ("perturbation", perturbation_robustness_testing),
+    ("physics_geometry", physics_geometry),
+    ("ela_analysis", ela_analysis),
+    ("autoencoder_reconstruction", autoencoder_reconstruction),
+    ("diffusion_latent_analysis", diffusion_latent_analysis),
+    ("benfords_law", benfords_law),
+    ("chromatic_aberration", chromatic_aberration),
+    ("copy_move", copy_move),
+]
+
+
+def decode_max_pixels(profile=None):
+    """Pixels the downloader has to decode for a profile, None = native."""
+    return profiles.decode_pixels(HEURISTIC_MODULES, profile)
+
+
+def verify(img, lazy=None, include_telemetry=None, profile=None, tiling_threshold_mb=None):
     try:
-        image_bytes = img["bytes"]
-        pil_image = img["pil_image"]
-        gray_pixels = img["pixels_gray"]
-
-        img_metadata = metadata.process(image_bytes)
-        img_c2pa = c2pa.process(image_bytes)
-        img_watermark = watermark.process(image_bytes)
-        img_visual_artifacts = visual_artifacts.process(pil_image)
-        img_frequency_domain_analysis = frequency_domain_analysis.process(image_bytes)
-        img_pixel_level_analysis = pixel_level_analysis.process(image_bytes)
-        img_sensor_pattern_noise = sensor_pattern_noise.process(gray_pixels)
-        img_compression_artifact_analysis = compression_artifact_analysis.process(image_bytes)
-        img_gan = gan.process(image_bytes)
-        img_perturbation_robustness_testing = perturbation_robustness_testing.process(image_bytes)
-        img_physics_geometry = physics_geometry.process(image_bytes)
-        img_ela_analysis = ela_analysis.process(image_bytes)
-        img_autoencoder_reconstruction = autoencoder_reconstruction.process(image_bytes)
-        img_diffusion_latent_analysis = diffusion_latent_analysis.process(image_bytes)
-        img_benfords_law = benfords_law.process(image_bytes)
-        img_chromatic_aberration = chromatic_aberration.process(image_bytes)
-        img_patch_analysis = patch_analyzer.process(image_bytes)
-        img_copy_move = copy_move.process(image_bytes)
-    
-        data = {
-            "metadata": img_metadata,
-            "c2pa": img_c2pa,
-            "watermark": img_watermark,
-            "visual": img_visual_artifacts,
-            "frequency_domain_analysis": img_frequency_domain_analysis,
-            "pixel": img_pixel_level_analysis,
-            "sensor_pattern_noise": img_sensor_pattern_noise,
-            "compression_artifact_analysis": img_compression_artifact_analysis,
-            "gan": img_gan,
-            "perturbation": img_perturbation_robustness_testing,
-            "physics_geometry": img_physics_geometry,
-            "ela_analysis": img_ela_analysis,
-            "autoencoder_reconstruction": img_autoencoder_reconstruction,
-            "diffusion_latent_analysis": img_diffusion_latent_analysis,
-            "benfords_law": img_benfords_law,
-            "chromatic_aberration": img_chromatic_aberration,
-            "patch_analysis": img_patch_analysis,
-            "copy_move": img_copy_move
-        }
+        # Over the tiling threshold, modules that support it run in row bands
+        ctx = ImageContext.from_pipeline_image(img, tiling_threshold_mb=tiling_threshold_mb)
+
+        profile = profiles.resolve(profile)
+        modules, resolutions = profiles.select(HEURISTIC_MODULES, profile)
+
+        job_telemetry = {"profile": profile, "tiled": ctx.tiled}
+
+        run_one = lambda key, module: scheduler.run(
+            [(key, module)], ctx, workers=1, executor="thread",
+            telemetry=job_telemetry, resolutions=resolutions
+        )[key]
+
+        # Decisive modules first; their results are reused if none settles the verdict
+        done, decided = {}, None
+        if HEURISTIC_SHORTCUT:
+            decisive = [(key, module) for key, module in modules if hasattr(module, "decisive_mark")]
+            for key, module in sorted(decisive, key=lambda item: item[1].COST):
+                done[key] = run_one(key, module)
+                if module.decisive_mark(done[key]):
+                    decided = key
+                    break
+
+        if decided:
+            img_decision_engine = decision_engine.detect(done)
+            img_decision_engine["skipped_modules"] = [key for key, _ in modules if key not in done]
+            job_telemetry["short_circuit"] = decided
+
+        elif HEURISTIC_LAZY if lazy is None else lazy:
+            # One module at a time, still instrumented and time-budgeted
+            img_decision_engine = decision_engine.detect_lazy(
+                modules,
+                lambda key, module: done[key] if key in done else run_one(key, module)
+            )
+        else:
+            rest = [(key, module) for key, module in modules if key not in done]
+            data = {**scheduler.run(rest, ctx, telemetry=job_telemetry, resolutions=resolutions), **done}
+            img_decision_engine = decision_engine.detect(data)
+
+        telemetry.report(job_telemetry)
+
+        if telemetry.HEURISTIC_TELEMETRY if include_telemetry is None else include_telemetry:
+            img_decision_engine["telemetry"] = job_telemetry
 
-        img_decision_engine = decision_engine.process(data) 
         return img_decision_engine
 
     except Exception as e:
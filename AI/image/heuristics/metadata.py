@@ -1,10 +1,17 @@
 import json
-import re
 import struct
 import contextlib
 import io
 from io import BytesIO
+from bisect import bisect_right
 import exifread
+from .utils.pyramid import NATIVE
+from .utils.container import parse_container, png_text
+from .utils.patterns import PatternMatcher
+
+REQUIRES = ["container"]
+MAX_PIXELS = NATIVE
+COST = 3
 
 
 GENERATOR_SIGNATURES = [
@@ -28,111 +35,73 @@ GENERATION_PATTERNS = [
     r"size:\s*\d+x\d+",
 ]
 
-
-def detect_format(image_bytes):
-
-    if image_bytes.startswith(b"\x89PNG"):
-        return "PNG"
-
-    if image_bytes.startswith(b"\xff\xd8"):
-        return "JPEG"
-
-    return "UNKNOWN"
+# All of the lists above in one compiled matcher (utils.patterns), so
+# growing them doesn't add a pass over the metadata per entry
+SIGNATURE_MATCHER = PatternMatcher(
+    [("generator", sig, False) for sig in GENERATOR_SIGNATURES]
+    + [("camera", brand, False) for brand in KNOWN_CAMERA_BRANDS]
+    + [("generation", pattern, True) for pattern in GENERATION_PATTERNS]
+)
 
 
-def parse_png_metadata(image_bytes):
-
-    width = None
-    height = None
+def png_metadata(container):
+    """tEXt/zTXt/iTXt keyword -> text plus the sRGB, gAMA and pHYs values of a PNG."""
     metadata = {}
 
-    stream = BytesIO(image_bytes)
-
-    stream.read(8)  # skip signature
-
-    while True:
-
-        chunk_len_bytes = stream.read(4)
-
-        if not chunk_len_bytes:
-            break
+    for segment in container.segments:
+        chunk = bytes(segment.data)
 
-        chunk_len = struct.unpack(">I", chunk_len_bytes)[0]
+        if segment.name in ("tEXt", "iTXt", "zTXt"):
+            keyword, text = png_text(segment)
+            metadata[keyword] = text
 
-        chunk_type = stream.read(4).decode("latin1")
+        elif segment.name == "sRGB" and chunk:
+            metadata["srgb"] = chunk[0]
 
-        chunk_data = stream.read(chunk_len)
-
-        stream.read(4)  # CRC
-
-        if chunk_type == "IHDR":
-            width, height = struct.unpack(">II", chunk_data[:8])
-
-        elif chunk_type in ["tEXt", "iTXt", "zTXt"]:
-
-            try:
-                text = chunk_data.decode("latin1", errors="ignore")
-                key_val = text.split("\x00", 1)
-
-                if len(key_val) == 2:
-                    metadata[key_val[0]] = key_val[1]
-            except:
-                pass
-
-        elif chunk_type == "sRGB":
-            metadata["srgb"] = chunk_data[0]
-
-        elif chunk_type == "gAMA":
-            gamma = struct.unpack(">I", chunk_data)[0]
+        elif segment.name == "gAMA" and len(chunk) == 4:
+            gamma = struct.unpack(">I", chunk)[0]
             metadata["gamma"] = gamma
 
-        elif chunk_type == "pHYs":
-            x, y, unit = struct.unpack(">IIB", chunk_data)
+        elif segment.name == "pHYs" and len(chunk) == 9:
+            x, y, unit = struct.unpack(">IIB", chunk)
             metadata["dpi"] = [x, y]
 
-        if chunk_type == "IEND":
-            break
-
-    return width, height, metadata
-
-
-def parse_jpeg_size(image_bytes):
+    return metadata
 
-    stream = BytesIO(image_bytes)
 
-    stream.read(2)
+def exif_payload(container, image_bytes):
+    """The TIFF-structured EXIF block exifread should read, or None."""
+    if container.format == "tiff":
+        return image_bytes
 
-    while True:
+    segment = container.first("exif")
+    if segment is None:
+        return None
 
-        marker, = struct.unpack("B", stream.read(1))
+    payload = segment.data
+    if bytes(payload[:6]) == b"Exif\x00\x00":
+        payload = payload[6:]
 
-        if marker != 0xFF:
-            continue
+    return payload
 
-        code, = struct.unpack("B", stream.read(1))
 
-        if code in [0xC0, 0xC2]:
-
-            stream.read(3)
-
-            height, width = struct.unpack(">HH", stream.read(4))
-
-            return width, height
-
-        else:
-
-            size, = struct.unpack(">H", stream.read(2))
-
-            stream.read(size - 2)
+def extract_exif(image_bytes, container=None, pil_exif=None):
+    """
+    exifread tags of the EXIF block only (kilobytes, not the whole file).
+    The downloader's already-parsed PIL EXIF short-circuits images that
+    carry none.
+    """
+    tags = {}
 
+    container = container or parse_container(image_bytes)
+    payload = exif_payload(container, image_bytes)
 
-def extract_exif(image_bytes):
-
-    tags = {}
+    if payload is None or (pil_exif is not None and not pil_exif and container.format != "tiff"):
+        return tags
 
     try:
 
-        f = BytesIO(image_bytes)
+        f = BytesIO(payload)
 
         with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
             exif = exifread.process_file(f, details=True)
@@ -146,57 +115,86 @@ def extract_exif(image_bytes):
     return tags
 
 
-def scan_raw_metadata(image_bytes):
-
+def scan_raw_metadata(container):
+    """[(segment name, lowercase text)] of the metadata segments; pixel data is never scanned."""
     try:
-        return image_bytes.decode("latin1", errors="ignore").lower()
+        return [(segment.name, text) for segment, text in container.scan_parts()]
     except:
-        return ""
+        return []
 
 
-def detect_generator_signatures(text_blob):
+def scan_signatures(parts):
+    """
+    One SIGNATURE_MATCHER pass over the (source, text) parts. Each hit is
+    located as the source it starts in and the offset within that source.
+    """
+    starts, texts = [], []
+    position = 0
 
-    return [sig for sig in GENERATOR_SIGNATURES if sig in text_blob]
+    for _, text in parts:
+        starts.append(position)
+        texts.append(text)
+        position += len(text) + 1
 
+    hits = SIGNATURE_MATCHER.search("\n".join(texts))
 
-def detect_generation_parameters(text_blob):
+    for hit in hits:
+        first = hit.pop("first")
+        index = bisect_right(starts, first) - 1
+        hit["source"] = parts[index][0]
+        hit["offset"] = first - starts[index]
 
-    return [p for p in GENERATION_PATTERNS if re.search(p, text_blob)]
+    return hits
 
 
-def detect_camera_validity(text_blob):
+def _hit_patterns(hits, category):
+    return {hit["pattern"] for hit in hits if hit["category"] == category}
 
-    return any(b in text_blob for b in KNOWN_CAMERA_BRANDS)
 
+def detect_generator_signatures(hits):
 
-def metadata_analysis(image_bytes):
+    found = _hit_patterns(hits, "generator")
+    return [sig for sig in GENERATOR_SIGNATURES if sig in found]
 
-    fmt = detect_format(image_bytes)
 
-    width = None
-    height = None
+def detect_generation_parameters(hits):
+
+    found = _hit_patterns(hits, "generation")
+    return [p for p in GENERATION_PATTERNS if p in found]
+
+
+def detect_camera_validity(hits):
+
+    return bool(_hit_patterns(hits, "camera"))
+
+
+def metadata_analysis(image_bytes, container=None, pil_exif=None):
+
+    container = container or parse_container(image_bytes)
+
+    fmt = (container.format or "unknown").upper()
+
+    width = container.width
+    height = container.height
     metadata = {}
 
     if fmt == "PNG":
-        width, height, metadata = parse_png_metadata(image_bytes)
-
-    elif fmt == "JPEG":
-        width, height = parse_jpeg_size(image_bytes)
+        metadata = png_metadata(container)
 
-    exif = extract_exif(image_bytes)
+    exif = extract_exif(image_bytes, container, pil_exif)
 
-    raw_scan = scan_raw_metadata(image_bytes)
+    parts = [
+        ("embedded_metadata", json.dumps(metadata).lower()),
+        ("exif", json.dumps(exif).lower()),
+    ] + scan_raw_metadata(container)
 
-    combined_text = json.dumps({
-        "metadata": metadata,
-        "exif": exif
-    }).lower() + raw_scan
+    hits = scan_signatures(parts)
 
-    generator_signatures = detect_generator_signatures(combined_text)
+    generator_signatures = detect_generator_signatures(hits)
 
-    generation_parameters = detect_generation_parameters(combined_text)
+    generation_parameters = detect_generation_parameters(hits)
 
-    camera_valid = detect_camera_validity(combined_text)
+    camera_valid = detect_camera_validity(hits)
 
     issues = []
 
@@ -213,6 +211,7 @@ def metadata_analysis(image_bytes):
         "generation_parameters_detected": generation_parameters,
         "consistency_issues": issues,
         "suspicious": bool(generator_signatures or generation_parameters),
+        "pattern_hits": hits,
     }
 
     return {
@@ -227,7 +226,7 @@ def metadata_analysis(image_bytes):
     }
 
 
-def process(image_bytes):
-    result = metadata_analysis(image_bytes)
+def process(ctx):
+    result = metadata_analysis(ctx.bytes, ctx.container, ctx.exif)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
@@ -1,12 +1,11 @@
 import numpy as np
 import cv2
+from .utils.blocks import block_reduce
+from .utils.pyramid import GLOBAL_MAX_PIXELS
 
-def load_image_cv(image_bytes):
-    """Converts raw bytes directly into OpenCV's grayscale format."""
-    img_array = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    return gray
+REQUIRES = ["gray"]
+MAX_PIXELS = GLOBAL_MAX_PIXELS
+COST = 10
 
 def illumination_consistency(gray):
     """
@@ -23,13 +22,7 @@ def illumination_consistency(gray):
     # Split the image into 64x64 blocks to check local lighting
     h, w = gray.shape
     block_size = 64
-    dominant_angles = []
-
-    for y in range(0, h - block_size, block_size):
-        for x in range(0, w - block_size, block_size):
-            block_angles = angles[y:y+block_size, x:x+block_size]
-            mean_angle = np.mean(block_angles)
-            dominant_angles.append(mean_angle)
+    dominant_angles = block_reduce(angles, block_size, "mean", stop=(h - block_size, w - block_size))
 
     # Measure how chaotic the lighting angles are globally
     variance = np.var(dominant_angles)
@@ -54,12 +47,11 @@ def vanishing_point_chaos(gray):
     if lines is None or len(lines) < 2:
          return {"line_chaos_score": 0.0, "lines_detected": 0}
 
-    angles = []
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        # Calculate the angle of the line
-        angle = np.arctan2(y2 - y1, x2 - x1)
-        angles.append(angle)
+    # OpenCV returns (N, 1, 4) or (N, 4) segments depending on the version
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T.astype(np.float64)
+
+    # Calculate the angle of every line
+    angles = np.arctan2(y2 - y1, x2 - x1)
 
     # In natural architecture, lines group tightly into 1-3 vanishing points.
     # AI lines often have a higher spread (standard deviation).
@@ -70,9 +62,9 @@ def vanishing_point_chaos(gray):
         "lines_detected": len(lines)
     }
 
-def process(image_bytes):
+def process(ctx):
     try:
-        gray = load_image_cv(image_bytes)
+        gray = ctx.gray
         
         illumination = illumination_consistency(gray)
         geometry = vanishing_point_chaos(gray)
@@ -1,52 +1,67 @@
 import json
 import numpy as np
-from PIL import Image
-from io import BytesIO
+from .utils.integral_image import window_mean_var
+from .utils.moments import (
+    pixel_statistics, histogram_entropy, describe, value_central_moments,
+    PixelStatistics, RunningMoments, RunningCovariance
+)
+from .utils.pyramid import NATIVE
+from .utils.tiling import row_bands, band_rows
 
+REQUIRES = ["rgb"]
+TILED_REQUIRES = []
+MAX_PIXELS = NATIVE
+COST = 190
 
-def load_image(image_bytes):
-    img = Image.open(BytesIO(image_bytes)).convert("RGB")
-    arr = np.asarray(img).astype(np.float32)
-    return arr
+LOCAL_VARIANCE_WINDOW = 5
 
 
-def channel_stats(channel):
+def channel_stats(stats, c):
+    mean = stats["central"][0][c]
+    variance = stats["central"][1][c]
+
     return {
-        "mean": float(np.mean(channel)),
-        "std": float(np.std(channel)),
-        "variance": float(np.var(channel)),
-        "min": float(np.min(channel)),
-        "max": float(np.max(channel)),
+        "mean": float(mean),
+        "std": float(np.sqrt(variance)),
+        "variance": float(variance),
+        "min": float(stats["min"][c]),
+        "max": float(stats["max"][c]),
     }
 
 
-def skewness(channel):
-    m = np.mean(channel)
-    s = np.std(channel)
-    if s == 0:
+def skewness(summary, c):
+    if summary["std"][c] == 0:
         return 0.0
-    return float(np.mean(((channel - m) / s) ** 3))
+    return float(summary["skewness"][c])
 
 
-def kurtosis(channel):
-    m = np.mean(channel)
-    s = np.std(channel)
-    if s == 0:
+def kurtosis(summary, c):
+    if summary["std"][c] == 0:
         return 0.0
-    return float(np.mean(((channel - m) / s) ** 4) - 3)
+    return float(summary["kurtosis"][c] - 3)
 
 
 def entropy(channel):
-    hist, _ = np.histogram(channel, bins=256, range=(0, 255), density=True)
+    return count_entropy(*np.histogram(channel, bins=256, range=(0, 255)))
+
+
+def count_entropy(counts, edges):
+    # The density np.histogram(..., density=True) derives from the counts
+    hist = counts / np.diff(edges) / counts.sum()
     hist = hist + 1e-12
     return float(-np.sum(hist * np.log2(hist)))
 
 
-def color_correlation(r, g, b):
+def color_correlation(cov):
+    std = np.sqrt(np.diag(cov))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(std, std)
+
     return {
-        "rg_corr": float(np.corrcoef(r.flatten(), g.flatten())[0, 1]),
-        "rb_corr": float(np.corrcoef(r.flatten(), b.flatten())[0, 1]),
-        "gb_corr": float(np.corrcoef(g.flatten(), b.flatten())[0, 1]),
+        "rg_corr": float(corr[0, 1]),
+        "rb_corr": float(corr[0, 2]),
+        "gb_corr": float(corr[1, 2]),
     }
 
 
@@ -75,24 +90,32 @@ def pixel_difference_stats(channel):
     }
 
 
-def residual_noise(img):
+def residual_map(img):
     blurred = (img[:-2, :-2] + img[1:-1, :-2] + img[2:, :-2] +
                img[:-2, 1:-1] + img[1:-1, 1:-1] + img[2:, 1:-1] +
                img[:-2, 2:] + img[1:-1, 2:] + img[2:, 2:]) / 9.0
 
     center = img[1:-1, 1:-1]
-    residual = center - blurred
+    return center - blurred
+
+
+def residual_noise(img):
+    return residual_summary(value_central_moments(residual_map(img)))
+
+
+def residual_summary(central):
+    mean, m2, _, m4 = central
+    std = np.sqrt(m2)
 
     return {
-        "mean": float(np.mean(residual)),
-        "std": float(np.std(residual)),
-        "kurtosis": float(np.mean(((residual - np.mean(residual)) /
-                     (np.std(residual) + 1e-8)) ** 4) - 3),
+        "mean": float(mean),
+        "std": float(std),
+        "kurtosis": float(m4 / (std + 1e-8) ** 4 - 3),
     }
 
 
-def laplacian_stats(channel):
-    lap = (
+def laplacian_map(channel):
+    return (
         -4 * channel[1:-1, 1:-1]
         + channel[:-2, 1:-1]
         + channel[2:, 1:-1]
@@ -100,6 +123,10 @@ def laplacian_stats(channel):
         + channel[1:-1, 2:]
     )
 
+
+def laplacian_stats(channel):
+    lap = laplacian_map(channel)
+
     return {
         "mean": float(np.mean(lap)),
         "std": float(np.std(lap)),
@@ -107,11 +134,15 @@ def laplacian_stats(channel):
     }
 
 
-def gradient_stats(channel):
+def gradient_map(channel):
     gx = channel[:, 1:] - channel[:, :-1]
     gy = channel[1:, :] - channel[:-1, :]
 
-    grad = np.sqrt(gx[:-1] ** 2 + gy[:, :-1] ** 2)
+    return np.sqrt(gx[:-1] ** 2 + gy[:, :-1] ** 2)
+
+
+def gradient_stats(channel):
+    grad = gradient_map(channel)
 
     return {
         "mean": float(np.mean(grad)),
@@ -132,30 +163,28 @@ def clipping_ratio(channel):
     }
 
 
-def channel_difference(r, g, b):
-    rg = r - g
-    bg = b - g
+def channel_difference(stats):
+    mean = stats["central"][0]
+    cov = stats["covariance"]
+
+    # var(x - y) = var(x) + var(y) - 2 cov(x, y)
+    def difference_std(i, j):
+        return np.sqrt(max(cov[i, i] + cov[j, j] - 2 * cov[i, j], 0.0))
 
     return {
-        "rg_mean": float(np.mean(rg)),
-        "rg_std": float(np.std(rg)),
-        "bg_mean": float(np.mean(bg)),
-        "bg_std": float(np.std(bg)),
+        "rg_mean": float(mean[0] - mean[1]),
+        "rg_std": float(difference_std(0, 1)),
+        "bg_mean": float(mean[2] - mean[1]),
+        "bg_std": float(difference_std(2, 1)),
     }
 
 
-def local_variance(channel, window=5):
+def local_variance(channel, window=LOCAL_VARIANCE_WINDOW):
     pad = window // 2
     padded = np.pad(channel, pad, mode="reflect")
 
-    variances = []
-
-    for i in range(channel.shape[0]):
-        for j in range(channel.shape[1]):
-            patch = padded[i:i+window, j:j+window]
-            variances.append(np.var(patch))
-
-    variances = np.array(variances)
+    # One window per pixel of the original channel
+    _, variances = window_mean_var(padded, window)
 
     return {
         "mean": float(np.mean(variances)),
@@ -165,43 +194,61 @@ def local_variance(channel, window=5):
     }
 
 
-def pixel_forensic_analysis(image_bytes):
-
-    img = load_image(image_bytes)
-
-    r = img[:, :, 0]
-    g = img[:, :, 1]
-    b = img[:, :, 2]
+def channel_sections(stats):
+    """The per-channel and color sections of the result, from pixel_statistics."""
+    summary = describe(stats["central"])
+    entropies = histogram_entropy(stats["histograms"])
 
-    gray = 0.299*r + 0.587*g + 0.114*b
-
-    result = {
+    return {
 
         "channel_statistics": {
-            "red": channel_stats(r),
-            "green": channel_stats(g),
-            "blue": channel_stats(b),
+            "red": channel_stats(stats, 0),
+            "green": channel_stats(stats, 1),
+            "blue": channel_stats(stats, 2),
         },
 
         "skewness": {
-            "r": skewness(r),
-            "g": skewness(g),
-            "b": skewness(b),
+            "r": skewness(summary, 0),
+            "g": skewness(summary, 1),
+            "b": skewness(summary, 2),
         },
 
         "kurtosis": {
-            "r": kurtosis(r),
-            "g": kurtosis(g),
-            "b": kurtosis(b),
+            "r": kurtosis(summary, 0),
+            "g": kurtosis(summary, 1),
+            "b": kurtosis(summary, 2),
         },
 
         "entropy": {
-            "r": entropy(r),
-            "g": entropy(g),
-            "b": entropy(b),
+            "r": float(entropies[0]),
+            "g": float(entropies[1]),
+            "b": float(entropies[2]),
         },
 
-        "color_correlation": color_correlation(r, g, b),
+        "color_correlation": color_correlation(stats["covariance"]),
+    }
+
+
+def luma(rgb):
+    img = rgb.astype(np.float32)
+
+    r = img[:, :, 0]
+    g = img[:, :, 1]
+    b = img[:, :, 2]
+
+    return 0.299*r + 0.587*g + 0.114*b
+
+
+def pixel_forensic_analysis(ctx):
+
+    # Histograms, moments and channel covariances in one pass over the bytes
+    stats = pixel_statistics(ctx.rgb)
+
+    gray = luma(ctx.rgb)
+
+    result = {
+
+        **channel_sections(stats),
 
         "neighbor_correlation": neighbor_correlation(gray),
 
@@ -215,7 +262,7 @@ def pixel_forensic_analysis(image_bytes):
 
         "pixel_clipping": clipping_ratio(gray),
 
-        "channel_difference_statistics": channel_difference(r, g, b),
+        "channel_difference_statistics": channel_difference(stats),
 
         "local_variance": local_variance(gray),
     }
@@ -223,7 +270,133 @@ def pixel_forensic_analysis(image_bytes):
     return result
 
 
-def process(image_bytes):
-    result = pixel_forensic_analysis(image_bytes)
+# ----------------------------------------------------------
+# Tiled mode
+# ----------------------------------------------------------
+# Row bands of the decoded image with two context rows on each side (the
+# local variance window reaches two rows, every other stencil one). Each
+# band only contributes the rows it owns to mergeable accumulators, so the
+# result matches the full-frame one without full-frame float copies.
+
+def _moment_summary(moments):
+    mean, variance = moments.central()[:2]
+    return float(mean), float(np.sqrt(variance)), float(variance)
+
+
+def pixel_forensic_analysis_tiled(ctx):
+    width, height = ctx.width, ctx.height
+    pad = LOCAL_VARIANCE_WINDOW // 2
+
+    stats = PixelStatistics(3)
+
+    horizontal, vertical, diagonal = RunningCovariance(), RunningCovariance(), RunningCovariance()
+    differences = RunningMoments()
+    difference_counts = np.zeros(256, dtype=np.int64)
+    residual = RunningMoments(max_order=4)
+    laplacian = RunningMoments()
+    gradient = RunningMoments()
+    zeros = maxs = 0
+    variances = RunningMoments()
+
+    for top, bottom, start, stop in row_bands(height, band_rows(width), halo=pad):
+        rgb = np.asarray(ctx.pil.crop((0, top, width, bottom)))
+        gray = luma(rgb)
+
+        # Band-local rows: owned [s, e), and [s, pair_end) for stencils
+        # that also read the next row (none past the last image row)
+        s, e = start - top, stop - top
+        pair_end = min(stop, height - 1) - top
+
+        stats.add(rgb[s:e])
+
+        core = gray[s:e]
+
+        horizontal.add(core[:, :-1], core[:, 1:])
+        vertical.add(gray[s:pair_end], gray[s + 1:pair_end + 1])
+        diagonal.add(gray[s:pair_end, :-1], gray[s + 1:pair_end + 1, 1:])
+
+        diffs = [core[:, 1:] - core[:, :-1], gray[s + 1:pair_end + 1] - gray[s:pair_end]]
+        for d in diffs:
+            differences.add(d)
+            counts, edges = np.histogram(d, bins=256, range=(0, 255))
+            difference_counts += counts
+
+        # 3x3 stencils have centers on rows 1..height-2; row r of the maps
+        # below is band row r + 1
+        centers = slice(max(start, 1) - top - 1, min(stop, height - 1) - top - 1)
+        residual.add(residual_map(gray)[centers])
+        laplacian.add(laplacian_map(gray)[centers])
+
+        gradient.add(gradient_map(gray)[s:pair_end])
+
+        zeros += np.count_nonzero(core == 0)
+        maxs += np.count_nonzero(core == 255)
+
+        # Reflect padding only where the band meets the image border
+        pad_top, pad_bottom = pad if start == 0 else 0, pad if stop == height else 0
+        padded = np.pad(gray, ((pad_top, pad_bottom), (pad, pad)), mode="reflect")
+        _, band_variances = window_mean_var(padded, LOCAL_VARIANCE_WINDOW)
+        variances.add(band_variances[s + pad_top - pad:e + pad_top - pad])
+
+    stats = stats.result()
+
+    difference_mean, difference_std, _ = _moment_summary(differences)
+    laplacian_mean, laplacian_std, laplacian_variance = _moment_summary(laplacian)
+    gradient_mean, gradient_std, gradient_variance = _moment_summary(gradient)
+    variance_mean, variance_std, _ = _moment_summary(variances)
+
+    result = {
+
+        **channel_sections(stats),
+
+        "neighbor_correlation": {
+            "horizontal": horizontal.correlation(),
+            "vertical": vertical.correlation(),
+            "diagonal": diagonal.correlation(),
+        },
+
+        "pixel_difference": {
+            "mean": difference_mean,
+            "std": difference_std,
+            "entropy": count_entropy(difference_counts, edges),
+        },
+
+        "residual_noise": residual_summary(residual.central()),
+
+        "laplacian_statistics": {
+            "mean": laplacian_mean,
+            "std": laplacian_std,
+            "variance": laplacian_variance,
+        },
+
+        "gradient_statistics": {
+            "mean": gradient_mean,
+            "std": gradient_std,
+            "energy": gradient_variance + gradient_mean ** 2,
+        },
+
+        "pixel_clipping": {
+            "zero_ratio": float(zeros / (width * height)),
+            "max_ratio": float(maxs / (width * height)),
+        },
+
+        "channel_difference_statistics": channel_difference(stats),
+
+        "local_variance": {
+            "mean": variance_mean,
+            "std": variance_std,
+            "min": variances.min,
+            "max": variances.max,
+        },
+    }
+
+    return result
+
+
+def process(ctx):
+    if ctx.tiled:
+        result = pixel_forensic_analysis_tiled(ctx)
+    else:
+        result = pixel_forensic_analysis(ctx)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+import logging
+from .utils.pyramid import NATIVE
+from .utils.scheduler import DECLARED
+
+logger = logging.getLogger(__name__)
+
+# Profile used when a job doesn't name one
+HEURISTIC_PROFILE = os.getenv("HEURISTIC_PROFILE", "balanced")
+
+# modules: result keys to run (None = every module)
+# max_pixels: DECLARED keeps each module's own MAX_PIXELS, NATIVE forces the
+#   full resolution, a number caps every module at that many pixels
+PROFILES = {
+    # Under load: provenance plus the two strongest pixel statistics
+    "fast": {
+        "modules": ["metadata", "c2pa", "diffusion_latent_analysis", "sensor_pattern_noise"],
+        "max_pixels": 1_000_000,
+    },
+    "balanced": {
+        "modules": None,
+        "max_pixels": DECLARED,
+    },
+    # Escalations: everything at native resolution
+    "forensic": {
+        "modules": None,
+        "max_pixels": NATIVE,
+    },
+}
+
+
+def resolve(name=None):
+    """The profile name actually used, falling back to HEURISTIC_PROFILE."""
+    name = (name or HEURISTIC_PROFILE).lower()
+
+    if name not in PROFILES:
+        logger.warning(f"Unknown heuristic profile '{name}', using '{HEURISTIC_PROFILE}'")
+        name = HEURISTIC_PROFILE if HEURISTIC_PROFILE in PROFILES else "balanced"
+
+    return name
+
+
+def select(modules, name=None):
+    """
+    (modules, resolutions) of a profile for scheduler.run. modules is the
+    (result key, module) list to pick from.
+    """
+    profile = PROFILES[resolve(name)]
+
+    keys = profile["modules"]
+    selected = [(key, module) for key, module in modules if keys is None or key in keys]
+
+    max_pixels = profile["max_pixels"]
+    if max_pixels is DECLARED:
+        resolutions = None
+    elif max_pixels is NATIVE:
+        resolutions = {key: NATIVE for key, _ in selected}
+    else:
+        resolutions = {key: cap(getattr(module, "MAX_PIXELS", None), max_pixels) for key, module in selected}
+
+    return selected, resolutions
+
+
+def decode_pixels(modules, name=None):
+    """
+    Largest analysis resolution any module of the profile runs at (None
+    when one needs the native image), i.e. how far the downloader may
+    reduce the decode.
+    """
+    selected, resolutions = select(modules, name)
+
+    needed = [
+        getattr(module, "MAX_PIXELS", None) if resolutions is None else resolutions[key]
+        for key, module in selected
+    ]
+
+    if not needed or any(pixels is None for pixels in needed):
+        return None
+    return max(needed)
+
+
+def cap(declared, max_pixels):
+    return max_pixels if declared is None else min(declared, max_pixels)
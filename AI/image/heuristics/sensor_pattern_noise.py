@@ -1,32 +1,55 @@
+import os
 import numpy as np
 import json
 import pywt
+from math import ceil
+from .utils.pyramid import NATIVE
+from .utils.moments import RunningMoments, RunningCovariance
+from .utils.tiling import row_bands, band_rows
+from .utils import prnu
 
+REQUIRES = ["gray_f32", "wavedec2_db4"]
+TILED_REQUIRES = ["gray_f32"]
+MAX_PIXELS = NATIVE
+COST = 60
 
-def wavelet_denoise(image):
-    coeffs = pywt.wavedec2(image, "db4", level=4)
+WAVELET = "db4"
+LEVELS = 4
 
-    denoised_coeffs = []
+# Context rows around a band: the 8-tap level-4 transform reaches
+# (8 - 1) * (2^4 - 1) = 105 rows
+WAVELET_HALO = 112
 
-    for i, coeff in enumerate(coeffs):
-        if i == 0:
-            denoised_coeffs.append(coeff)
-        else:
-            cH, cV, cD = coeff
+# Directory of the camera fingerprint store (utils.prnu); without it the
+# residual is not matched against known cameras
+PRNU_STORE = os.getenv("PRNU_STORE", "")
 
-            cH = pywt.threshold(cH, np.std(cH), mode="soft")
-            cV = pywt.threshold(cV, np.std(cV), mode="soft")
-            cD = pywt.threshold(cD, np.std(cD), mode="soft")
 
-            denoised_coeffs.append((cH, cV, cD))
+def wavelet_denoise(image, coeffs=None, thresholds=None):
+    """
+    Soft-thresholds every detail subband at its own std, or at the given
+    thresholds ([(tH, tV, tD)] per level, coarsest first).
+    """
+    if coeffs is None:
+        coeffs = pywt.wavedec2(image, WAVELET, level=LEVELS)
 
-    denoised = pywt.waverec2(denoised_coeffs, "db4")
+    if thresholds is None:
+        thresholds = [tuple(np.std(c) for c in coeff) for coeff in coeffs[1:]]
+
+    denoised_coeffs = [coeffs[0]]
+
+    for coeff, level_thresholds in zip(coeffs[1:], thresholds):
+        denoised_coeffs.append(tuple(
+            pywt.threshold(c, t, mode="soft") for c, t in zip(coeff, level_thresholds)
+        ))
+
+    denoised = pywt.waverec2(denoised_coeffs, WAVELET)
 
     return denoised[: image.shape[0], : image.shape[1]]
 
 
-def extract_noise_residual(image):
-    denoised = wavelet_denoise(image)
+def extract_noise_residual(image, coeffs=None, thresholds=None):
+    denoised = wavelet_denoise(image, coeffs, thresholds)
     noise = image - denoised
     return noise
 
@@ -47,8 +70,56 @@ def correlation(a, b):
     return float(numerator / denominator)
 
 
-def compute_spn_metrics(gray_pixels):
-    spn = extract_noise_residual(gray_pixels)
+# ----------------------------------------------------------
+# Camera fingerprints
+# ----------------------------------------------------------
+
+def prnu_inputs(ctx, size, spn=None, thresholds=None):
+    """
+    (residual, gray) centered size x size crops the fingerprint store
+    matches on, or None if the image is smaller. Without the full-frame
+    residual (tiled mode) only a window around the crop is denoised, with
+    the global subband thresholds.
+    """
+    origin = prnu.crop_origin(ctx.height, ctx.width, size)
+    if origin is None:
+        return None
+
+    top, left = origin
+    gray = ctx.gray_f32[top:top + size, left:left + size]
+
+    if spn is not None:
+        return spn[top:top + size, left:left + size], gray
+
+    # Window starts on multiples of 2^LEVELS, like the tiled bands
+    align = 2 ** LEVELS
+    y0, x0 = max(0, top - WAVELET_HALO) // align * align, max(0, left - WAVELET_HALO) // align * align
+    y1, x1 = min(ctx.height, top + size + WAVELET_HALO), min(ctx.width, left + size + WAVELET_HALO)
+
+    noise = extract_noise_residual(ctx.gray_f32[y0:y1, x0:x1], thresholds=thresholds)
+    return noise[top - y0:top - y0 + size, left - x0:left - x0 + size], gray
+
+
+def match_fingerprint(ctx, spn=None, thresholds=None):
+    """The store's best camera fingerprint match for the image (utils.prnu)."""
+    store = prnu.load_store(PRNU_STORE)
+    if store is None:
+        return {"matched": False, "reason": "fingerprint store unavailable"}
+
+    # PRNU does not survive resampling
+    if ctx.level_index:
+        return {"matched": False, "reason": "not analysed at native resolution"}
+
+    inputs = prnu_inputs(ctx, store.crop, spn, thresholds)
+    if inputs is None:
+        return {"matched": False, "reason": "image smaller than the fingerprint crop"}
+
+    _, model = prnu.exif_camera(ctx.exif)
+    return store.match(*inputs, ctx.height, ctx.width, model)
+
+
+def compute_spn_metrics(ctx):
+    spn = extract_noise_residual(ctx.gray_f32, ctx.wavedec2(WAVELET, level=LEVELS))
 
     energy = float(np.mean(spn ** 2))
 
@@ -58,7 +129,7 @@ def compute_spn_metrics(gray_pixels):
     horizontal_corr = correlation(spn[:, :-1], spn[:, 1:])
     vertical_corr = correlation(spn[:-1, :], spn[1:, :])
 
-    return {
+    result = {
         "spn_shape": list(spn.shape),
         "spn_metrics": {
             "energy": energy,
@@ -69,12 +140,116 @@ def compute_spn_metrics(gray_pixels):
         }
     }
 
+    if PRNU_STORE:
+        result["prnu_match"] = match_fingerprint(ctx, spn)
+
+    return result
+
+
+# ----------------------------------------------------------
+# Tiled mode
+# ----------------------------------------------------------
+# Row bands with WAVELET_HALO context rows. The soft thresholds are global
+# subband stds, so a first pass accumulates them band by band and a second
+# pass denoises; the metrics are merged from per-band accumulators.
+
+def _coefficient_rows(level, start, stop, top, first, last):
+    """
+    Slice of the level's coefficient rows (of a band decomposed from row
+    top) that cover image rows [start, stop). Coefficient k of level j sits
+    at row 2^j k - 3 (2^j - 1) for an 8-tap filter, so consecutive bands
+    starting on multiples of 2^LEVELS split every subband without overlap.
+    """
+    offset = (pywt.Wavelet(WAVELET).dec_len - 2) / 2
+
+    def position(row):
+        return ceil((row - top) / 2 ** level + offset * (1 - 2 ** -level))
+
+    return slice(None if first else position(start), None if last else position(stop))
+
+
+def _band_details(coeffs, start, stop, top, height):
+    """(level, detail subbands) of a band, cropped to the rows it owns."""
+    for i, details in enumerate(coeffs[1:]):
+        level = len(coeffs) - 1 - i
+        rows = _coefficient_rows(level, start, stop, top, start == 0, stop == height)
+        yield i, [c[rows] for c in details]
+
+
+def subband_thresholds(gray, bands):
+    """Global std of every detail subband, accumulated band by band."""
+    moments = [[RunningMoments() for _ in range(3)] for _ in range(LEVELS)]
+
+    for top, bottom, start, stop in bands:
+        coeffs = pywt.wavedec2(gray[top:bottom], WAVELET, level=LEVELS)
+
+        for i, details in _band_details(coeffs, start, stop, top, gray.shape[0]):
+            for accumulator, c in zip(moments[i], details):
+                accumulator.add(c)
+
+    return [tuple(float(np.sqrt(m.central()[1])) for m in level) for level in moments]
+
+
+def compute_spn_metrics_tiled(ctx):
+    gray = ctx.gray_f32
+    height, width = gray.shape
+
+    rows = max(band_rows(width), 4 * WAVELET_HALO)
+    bands = list(row_bands(height, rows, halo=WAVELET_HALO))
+
+    thresholds = subband_thresholds(gray, bands)
+
+    energy = RunningMoments()
+    row_variance_sum = 0.0
+    column_sum = np.zeros(width)
+    column_sq_sum = np.zeros(width)
+    horizontal = RunningCovariance()
+    vertical = RunningCovariance()
+
+    for top, bottom, start, stop in bands:
+        noise = extract_noise_residual(gray[top:bottom], thresholds=thresholds)
+
+        # Owned rows plus the next one, for the vertical pairs across bands
+        extended = noise[start - top:min(stop + 1, bottom) - top]
+        core = extended[:stop - start]
+
+        energy.add(core)
+        row_variance_sum += float(np.sum(np.var(core, axis=1, dtype=np.float64)))
+
+        core = core.astype(np.float64)
+        column_sum += core.sum(axis=0)
+        column_sq_sum += np.square(core).sum(axis=0)
+
+        horizontal.add(core[:, :-1], core[:, 1:])
+        vertical.add(extended[:-1], extended[1:])
+
+    mean, m2 = energy.central()
+    column_mean = column_sum / height
+
+    result = {
+        "spn_shape": [height, width],
+        "spn_metrics": {
+            "energy": float(m2 + mean ** 2),
+            "row_variance": row_variance_sum / height,
+            "column_variance": float(np.mean(np.maximum(column_sq_sum / height - column_mean ** 2, 0.0))),
+            "horizontal_correlation": horizontal.correlation(flat=0.0),
+            "vertical_correlation": vertical.correlation(flat=0.0)
+        }
+    }
+
+    if PRNU_STORE:
+        result["prnu_match"] = match_fingerprint(ctx, thresholds=thresholds)
+
+    return result
+
 
-def run_spn(gray_pixels):
-    return compute_spn_metrics(gray_pixels)
+def run_spn(ctx):
+    if ctx.tiled:
+        return compute_spn_metrics_tiled(ctx)
+    return compute_spn_metrics(ctx)
 
 
-def process(image_bytes):
-    result = run_spn(image_bytes)
+def process(ctx):
+    result = run_spn(ctx)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
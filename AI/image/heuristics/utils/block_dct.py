@@ -0,0 +1,73 @@
+import numpy as np
+from .blocks import block_view
+
+BLOCK = 8
+
+# JPEG level shift: samples are centered on 0 before the transform.
+LEVEL_SHIFT = 128.0
+
+# Orthonormal 8x8 DC gain, i.e. what the level shift removes from every DC term.
+DC_OFFSET = LEVEL_SHIFT * BLOCK
+
+
+# ----------------------------------------------------------
+# Precompute 8x8 DCT transform matrix (orthogonal DCT-II)
+# ----------------------------------------------------------
+def create_dct_matrix(N=8, dtype=np.float32):
+    C = np.zeros((N, N), dtype=dtype)
+
+    for k in range(N):
+        alpha = np.sqrt(1/N) if k == 0 else np.sqrt(2/N)
+
+        for n in range(N):
+            C[k, n] = alpha * np.cos(((2*n + 1) * k * np.pi) / (2*N))
+
+    return C
+
+
+DCT_MATRIX = create_dct_matrix(BLOCK)
+DCT_MATRIX_T = DCT_MATRIX.T
+
+# C @ B @ C.T on a row-major flattened block is kron(C, C) @ vec(B), so a
+# whole image of blocks is a single (N, 64) x (64, 64) matrix product.
+# Built in float64 so flat blocks come out with (near) exact zero AC terms.
+_DCT_MATRIX_64 = create_dct_matrix(BLOCK, np.float64)
+DCT_KRON_T = np.ascontiguousarray(np.kron(_DCT_MATRIX_64, _DCT_MATRIX_64).T)
+
+# Bound on the float64 rounding error of a coefficient (64 products of
+# samples up to 255 at ~1e-16 relative error each, well under 1e-9).
+# Coefficients below it are exact zeros, e.g. the AC terms of flat blocks,
+# and are snapped to 0; anything larger is kept as computed.
+ZERO_EPSILON = 1e-9
+
+# Blocks transformed per float64 chunk: the float64 working set stays
+# around 32 MB (blocks and coefficients) at any image size.
+CHUNK_BLOCKS = 1 << 15
+
+
+def block_dct(gray, level_shift=LEVEL_SHIFT):
+    """
+    2D DCT-II of every full 8x8 block of a 0-255 gray image.
+
+    Returns a contiguous (N, 8, 8) float32 array in raster block order.
+    Ragged right/bottom edges are dropped, as JPEG blocks are. Rows of
+    blocks are transformed in float64 chunks of about CHUNK_BLOCKS blocks.
+    """
+    tiles = block_view(gray, BLOCK)
+    rows, cols = tiles.shape[:2]
+
+    out = np.empty((rows * cols, BLOCK * BLOCK), dtype=np.float32)
+    step = max(1, CHUNK_BLOCKS // max(cols, 1))
+
+    for top in range(0, rows, step):
+        bottom = min(top + step, rows)
+
+        blocks = np.array(tiles[top:bottom], dtype=np.float64).reshape(-1, BLOCK * BLOCK)
+        blocks -= level_shift
+
+        coeffs = blocks @ DCT_KRON_T
+        coeffs[np.abs(coeffs) < ZERO_EPSILON] = 0.0
+
+        out[top * cols:bottom * cols] = coeffs
+
+    return out.reshape(-1, BLOCK, BLOCK)
@@ -0,0 +1,110 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+# ------------------------------------------------
+# Block grid
+# ------------------------------------------------
+
+def block_grid(shape, block, stop=None, edge="drop"):
+    """
+    Number of (rows, cols) tiles for non-overlapping blocks.
+
+    Tile origins are range(0, stop, block) per axis; stop defaults to the
+    image size. With edge="drop" only tiles that fit completely are kept;
+    with edge="pad" a ragged last row/column of tiles is kept as well.
+    """
+    h, w = shape[:2]
+    bh, bw = block
+
+    stop_y, stop_x = stop if stop is not None else (h, w)
+    stop_y = max(min(stop_y, h), 0)
+    stop_x = max(min(stop_x, w), 0)
+
+    rows = len(range(0, stop_y, bh))
+    cols = len(range(0, stop_x, bw))
+
+    if edge == "drop":
+        rows = min(rows, h // bh)
+        cols = min(cols, w // bw)
+    elif edge != "pad":
+        raise ValueError(f"Unknown edge mode: {edge}")
+
+    return rows, cols
+
+
+def block_view(image, block, stop=None, edge="drop"):
+    """
+    (rows, cols, bh, bw[, channels]) tensor of non-overlapping tiles.
+
+    With edge="drop" this is a read-only strided view of image, no pixel is
+    copied. With edge="pad" the ragged tiles are completed with NaN, which
+    requires a float copy; reduce it with the nan-aware NumPy functions.
+    """
+    if isinstance(block, int):
+        block = (block, block)
+
+    bh, bw = block
+    rows, cols = block_grid(image.shape, block, stop, edge)
+
+    if edge == "pad":
+        padded = np.full(
+            (rows * bh, cols * bw) + image.shape[2:],
+            np.nan,
+            dtype=np.result_type(image.dtype, np.float32)
+        )
+        h = min(rows * bh, image.shape[0])
+        w = min(cols * bw, image.shape[1])
+        padded[:h, :w] = image[:h, :w]
+        image = padded
+
+    sy, sx = image.strides[:2]
+
+    return as_strided(
+        image,
+        shape=(rows, cols, bh, bw) + image.shape[2:],
+        strides=(bh * sy, bw * sx, sy, sx) + image.strides[2:],
+        writeable=False
+    )
+
+
+# ------------------------------------------------
+# Per-tile reductions
+# ------------------------------------------------
+
+BLOCK_REDUCERS = {
+    "mean": (np.mean, np.nanmean),
+    "var": (np.var, np.nanvar),
+    "std": (np.std, np.nanstd),
+    "sum": (np.sum, np.nansum),
+    "min": (np.min, np.nanmin),
+    "max": (np.max, np.nanmax),
+}
+
+
+def block_reduce(image, block, reducer="mean", stop=None, edge="drop", dtype=None):
+    """(rows, cols[, channels]) map of reducer applied to every tile."""
+    if reducer not in BLOCK_REDUCERS:
+        raise ValueError(f"Unknown block reducer: {reducer}")
+
+    view = block_view(image, block, stop, edge)
+    fn = BLOCK_REDUCERS[reducer][1 if edge == "pad" else 0]
+
+    if reducer in ("min", "max"):
+        return fn(view, axis=(2, 3))
+
+    return fn(view, axis=(2, 3), dtype=dtype)
+
+
+def block_stats(image, block, stop=None, edge="drop"):
+    """Per-tile float64 mean and variance maps computed from one view."""
+    view = block_view(image, block, stop, edge)
+
+    if edge == "pad":
+        mean = np.nanmean(view, axis=(2, 3), dtype=np.float64)
+        var = np.nanvar(view, axis=(2, 3), dtype=np.float64)
+    else:
+        mean = np.mean(view, axis=(2, 3), dtype=np.float64)
+        var = np.var(view, axis=(2, 3), dtype=np.float64)
+
+    return {"mean": mean, "var": var}
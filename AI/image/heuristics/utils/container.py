@@ -0,0 +1,338 @@
+import zlib
+from collections import namedtuple
+
+# A metadata segment of an image container: name is the container's own
+# label (JPEG "APP1", PNG "tEXt", WebP "XMP ", TIFF "tag 700"), kind a
+# normalized category (see KINDS), offset the file offset of the payload
+# and data the payload itself as a memoryview into the file bytes.
+Segment = namedtuple("Segment", ["name", "kind", "offset", "data"])
+
+KINDS = ("exif", "xmp", "jumbf", "text", "icc", "iptc", "comment", "app", "ancillary", "trailer")
+
+# Decompressed PNG text is capped so a zTXt bomb can't blow up the scan
+MAX_TEXT_BYTES = 1 << 20
+
+# JPEG APPn payloads recognized by their identifier prefix
+JPEG_APP_KINDS = [
+    (0xE1, b"Exif\x00", "exif"),
+    (0xE1, b"http://ns.adobe.com/xap/1.0/\x00", "xmp"),
+    (0xE1, b"http://ns.adobe.com/xmp/extension/\x00", "xmp"),
+    (0xE2, b"ICC_PROFILE\x00", "icc"),
+    (0xEB, b"JP", "jumbf"),
+    (0xED, b"Photoshop 3.0\x00", "iptc"),
+]
+
+# Start-of-frame markers (all but DHT, JPG and DAC in C0-CF)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHUNK_KINDS = {
+    "tEXt": "text",
+    "zTXt": "text",
+    "iTXt": "text",
+    "eXIf": "exif",
+    "iCCP": "icc",
+    "caBX": "jumbf",
+}
+
+WEBP_CHUNK_KINDS = {
+    "EXIF": "exif",
+    "XMP ": "xmp",
+    "ICCP": "icc",
+    "C2PA": "jumbf",
+}
+
+# TIFF tags whose values are metadata (ASCII descriptions, XMP, IPTC)
+TIFF_WIDTH, TIFF_HEIGHT, TIFF_EXIF_IFD = 256, 257, 34665
+TIFF_TAG_KINDS = {
+    270: "text",      # ImageDescription
+    271: "text",      # Make
+    272: "text",      # Model
+    305: "text",      # Software
+    306: "text",      # DateTime
+    315: "text",      # Artist
+    700: "xmp",
+    33432: "text",    # Copyright
+    33723: "iptc",
+    37510: "text",    # UserComment (Exif IFD)
+    42016: "text",    # ImageUniqueID (Exif IFD)
+    42033: "text",    # BodySerialNumber (Exif IFD)
+    42036: "text",    # LensModel (Exif IFD)
+}
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+class Container:
+    """
+    Index of an image file built in one pass over a memoryview: the format,
+    the stored pixel size and the metadata segments only. Pixel data (JPEG
+    scans, PNG IDAT, WebP bitstreams, TIFF strips) is stepped over, never
+    copied or read.
+
+    tables holds the JPEG DQT payloads (memoryviews) met on the way; they
+    are coding tables, not metadata, so they are kept out of segments.
+    """
+
+    def __init__(self, image_format=None, width=None, height=None, segments=None, tables=None):
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.segments = segments or []
+        self.tables = tables or []
+
+    def find(self, *kinds):
+        """Segments of the given kinds, in file order."""
+        return [s for s in self.segments if s.kind in kinds]
+
+    def first(self, kind):
+        found = self.find(kind)
+        return found[0] if found else None
+
+    @property
+    def metadata_size(self):
+        """Bytes of metadata payload (what a raw scan has to look at)."""
+        return sum(len(s.data) for s in self.segments)
+
+    def scan_parts(self):
+        """
+        [(segment, lowercase text)] of every metadata segment for signature
+        scans: latin-1, with compressed PNG text chunks inflated.
+        """
+        parts = []
+
+        for segment in self.segments:
+            if segment.name in ("zTXt", "iTXt"):
+                keyword, text = png_text(segment)
+                text = f"{keyword}\x00{text}"
+            else:
+                text = bytes(segment.data).decode("latin1")
+
+            parts.append((segment, text.lower()))
+
+        return parts
+
+    def scan_text(self):
+        """All of scan_parts as one string, segments separated by newlines."""
+        return "\n".join(text for _, text in self.scan_parts())
+
+
+# ------------------------------------------------
+# Entry point
+# ------------------------------------------------
+
+def parse_container(data):
+    """Container index of JPEG, PNG, WebP or TIFF bytes (format None otherwise)."""
+    view = memoryview(data)
+
+    if data.startswith(b"\xff\xd8"):
+        return _parse_jpeg(data, view)
+    if data.startswith(PNG_SIGNATURE):
+        return _parse_png(view)
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return _parse_webp(view)
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return _parse_tiff(view)
+
+    return Container()
+
+
+def _u16(view, i, order="big"):
+    return int.from_bytes(view[i:i + 2], order)
+
+
+def _u32(view, i, order="big"):
+    return int.from_bytes(view[i:i + 4], order)
+
+
+# ------------------------------------------------
+# JPEG: markers up to the first scan, plus any trailer
+# ------------------------------------------------
+
+def _jpeg_app_kind(marker, payload):
+    for app, prefix, kind in JPEG_APP_KINDS:
+        if marker == app and payload[:len(prefix)] == prefix:
+            return kind
+    return "app"
+
+
+def _parse_jpeg(data, view):
+    container = Container("jpeg")
+    segments = container.segments
+
+    i = 2
+    while i + 4 <= len(view):
+        if view[i] != 0xFF:
+            break
+
+        marker = view[i + 1]
+
+        # Fill bytes and markers without a length
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker == 0xD9:
+            break
+
+        length = _u16(view, i + 2)
+        start, end = i + 4, i + 2 + length
+        payload = view[start:end]
+
+        if 0xE0 <= marker <= 0xEF:
+            segments.append(Segment(f"APP{marker - 0xE0}", _jpeg_app_kind(marker, payload), start, payload))
+        elif marker == 0xFE:
+            segments.append(Segment("COM", "comment", start, payload))
+        elif marker == 0xDB:
+            container.tables.append(payload)
+        elif marker in JPEG_SOF_MARKERS and length >= 7:
+            container.height, container.width = _u16(view, start + 1), _u16(view, start + 3)
+
+        # Entropy-coded data follows the first scan header; no metadata there
+        if marker == 0xDA:
+            break
+
+        i = end
+
+    # Bytes appended after the final EOI (some tools write metadata there)
+    eoi = data.rfind(b"\xff\xd9")
+    if eoi != -1 and eoi + 2 < len(view):
+        segments.append(Segment("trailer", "trailer", eoi + 2, view[eoi + 2:]))
+
+    return container
+
+
+# ------------------------------------------------
+# PNG: chunks up to IEND, IDAT skipped
+# ------------------------------------------------
+
+def _parse_png(view):
+    container = Container("png")
+
+    i = len(PNG_SIGNATURE)
+    while i + 8 <= len(view):
+        length = _u32(view, i)
+        name = bytes(view[i + 4:i + 8]).decode("latin1")
+        start = i + 8
+        payload = view[start:start + length]
+
+        if name == "IHDR" and length >= 8:
+            container.width, container.height = _u32(view, start), _u32(view, start + 4)
+        elif name == "IEND":
+            break
+        elif name[0].islower():
+            kind = PNG_CHUNK_KINDS.get(name, "ancillary")
+            if name == "iTXt" and bytes(payload[:18]) == b"XML:com.adobe.xmp\x00":
+                kind = "xmp"
+            container.segments.append(Segment(name, kind, start, payload))
+
+        # Length, type, data, CRC
+        i = start + length + 4
+
+    return container
+
+
+def png_text(segment):
+    """(keyword, text) of a tEXt, zTXt or iTXt chunk, inflated if compressed."""
+    keyword, _, rest = bytes(segment.data).partition(b"\x00")
+    keyword = keyword.decode("latin1")
+
+    if segment.name == "tEXt":
+        return keyword, rest.decode("latin1")
+
+    if segment.name == "zTXt":
+        return keyword, _inflate(rest[1:]).decode("latin1")
+
+    # iTXt: compression flag, method, language tag, translated keyword, UTF-8 text
+    compressed = rest[:1] == b"\x01"
+    _, _, rest = rest[2:].partition(b"\x00")
+    _, _, text = rest.partition(b"\x00")
+
+    if compressed:
+        text = _inflate(text)
+
+    return keyword, text.decode("utf-8", errors="ignore")
+
+
+def _inflate(data):
+    try:
+        return zlib.decompressobj().decompress(data, MAX_TEXT_BYTES)
+    except zlib.error:
+        return b""
+
+
+# ------------------------------------------------
+# WebP: RIFF chunks
+# ------------------------------------------------
+
+def _parse_webp(view):
+    container = Container("webp")
+
+    i = 12
+    while i + 8 <= len(view):
+        name = bytes(view[i:i + 4]).decode("latin1")
+        length = _u32(view, i + 4, "little")
+        start = i + 8
+        payload = view[start:start + length]
+
+        if name == "VP8X" and length >= 10:
+            container.width = int.from_bytes(payload[4:7], "little") + 1
+            container.height = int.from_bytes(payload[7:10], "little") + 1
+        elif name == "VP8 " and length >= 10 and container.width is None:
+            container.width = _u16(payload, 6, "little") & 0x3FFF
+            container.height = _u16(payload, 8, "little") & 0x3FFF
+        elif name == "VP8L" and length >= 5 and container.width is None:
+            bits = _u32(payload, 1, "little")
+            container.width = (bits & 0x3FFF) + 1
+            container.height = ((bits >> 14) & 0x3FFF) + 1
+        elif name in WEBP_CHUNK_KINDS:
+            container.segments.append(Segment(name, WEBP_CHUNK_KINDS[name], start, payload))
+
+        # Chunks are padded to an even size
+        i = start + length + (length & 1)
+
+    return container
+
+
+# ------------------------------------------------
+# TIFF: IFD0 and the Exif IFD
+# ------------------------------------------------
+
+def _parse_tiff(view):
+    container = Container("tiff")
+    order = "little" if view[:2] == b"II" else "big"
+
+    def walk(offset, depth=0):
+        if not 8 <= offset <= len(view) - 2:
+            return
+
+        count = _u16(view, offset, order)
+
+        for n in range(count):
+            entry = offset + 2 + 12 * n
+            if entry + 12 > len(view):
+                break
+
+            tag = _u16(view, entry, order)
+            field_type = _u16(view, entry + 2, order)
+            values = _u32(view, entry + 4, order)
+            size = TIFF_TYPE_SIZES.get(field_type, 1) * values
+
+            # Values of up to four bytes are stored in the entry itself
+            start = entry + 8 if size <= 4 else _u32(view, entry + 8, order)
+
+            if tag in (TIFF_WIDTH, TIFF_HEIGHT) and depth == 0:
+                value = _u16(view, entry + 8, order) if field_type == 3 else _u32(view, entry + 8, order)
+                if tag == TIFF_WIDTH:
+                    container.width = value
+                else:
+                    container.height = value
+            elif tag == TIFF_EXIF_IFD and depth == 0:
+                walk(_u32(view, entry + 8, order), depth + 1)
+            elif tag in TIFF_TAG_KINDS and start + size <= len(view):
+                container.segments.append(Segment(f"tag {tag}", TIFF_TAG_KINDS[tag], start, view[start:start + size]))
+
+    walk(_u32(view, 4, order))
+
+    return container
@@ -0,0 +1,598 @@
+import os
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import lru_cache
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    from cryptography import x509
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding
+    from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+except ImportError:
+    x509 = None
+    InvalidSignature = ValueError
+
+logger = logging.getLogger(__name__)
+
+# Signature checks need both; without them manifests are parsed but never
+# reported as verified
+AVAILABLE = cbor2 is not None and x509 is not None
+
+# Verified certificate chains kept (repeat signers skip the chain checks)
+CHAIN_CACHE_SIZE = int(os.getenv("C2PA_CHAIN_CACHE_SIZE", 256))
+
+# COSE header labels (RFC 9052 / RFC 9360) and the COSE_Sign1 CBOR tag
+HEADER_ALG = 1
+HEADER_X5CHAIN = 33
+COSE_SIGN1_TAG = 18
+
+# Header labels of the RFC 3161 time-stamps C2PA attaches to a signature
+# (2.x first, then 1.x)
+HEADER_TIMESTAMPS = ("sigTst2", "sigTst")
+
+# DER tags read from time-stamp tokens
+DER_OCTET_STRING = 0x04
+DER_OID = 0x06
+DER_GENERALIZED_TIME = 0x18
+DER_SEQUENCE = 0x30
+DER_SET = 0x31
+DER_CONTEXT_0 = 0xA0
+
+# CMS (RFC 5652) and RFC 3161 object identifiers
+CMS_SIGNED_DATA = "1.2.840.113549.1.7.2"
+CMS_TST_INFO = "1.2.840.113549.1.9.16.1.4"
+CMS_CONTENT_TYPE = "1.2.840.113549.1.9.3"
+CMS_MESSAGE_DIGEST = "1.2.840.113549.1.9.4"
+RSASSA_PSS = "1.2.840.113549.1.1.10"
+
+# Digest algorithm OID -> hash, for token digests and message imprints
+DIGESTS = {
+    "2.16.840.1.101.3.4.2.1": "sha256",
+    "2.16.840.1.101.3.4.2.2": "sha384",
+    "2.16.840.1.101.3.4.2.3": "sha512",
+}
+
+# COSE algorithm id -> (name, scheme, hash)
+ALGORITHMS = {
+    -7: ("ES256", "ecdsa", "sha256"),
+    -35: ("ES384", "ecdsa", "sha384"),
+    -36: ("ES512", "ecdsa", "sha512"),
+    -37: ("PS256", "pss", "sha256"),
+    -38: ("PS384", "pss", "sha384"),
+    -39: ("PS512", "pss", "sha512"),
+    -8: ("Ed25519", "eddsa", None),
+}
+
+Sign1 = namedtuple("Sign1", ["protected", "headers", "payload", "signature"])
+
+# Outcome of a chain check: trusted, the leaf's public key and subject,
+# the validity window of the whole chain and a C2PA status code on failure
+Chain = namedtuple("Chain", ["trusted", "public_key", "subject", "not_before", "not_after", "status"])
+
+
+# ------------------------------------------------
+# COSE_Sign1
+# ------------------------------------------------
+
+def decode_sign1(data):
+    """
+    Sign1 of a (tagged or untagged) COSE_Sign1 message. headers merges the
+    protected and unprotected header maps, protected winning; protected
+    keeps the serialized protected header the signature covers.
+    """
+    message = cbor2.loads(bytes(data))
+
+    if isinstance(message, cbor2.CBORTag):
+        if message.tag != COSE_SIGN1_TAG:
+            raise ValueError(f"Not a COSE_Sign1 message (tag {message.tag})")
+        message = message.value
+
+    if not isinstance(message, (list, tuple)) or len(message) != 4:
+        raise ValueError("Malformed COSE_Sign1 message")
+
+    protected, unprotected, payload, signature = message
+    headers = dict(unprotected or {})
+    if protected:
+        headers.update(cbor2.loads(protected))
+
+    return Sign1(protected, headers, payload, signature)
+
+
+def x5chain(headers):
+    """DER certificates of the x5chain header, leaf first."""
+    # C2PA 1.x manifests put the chain under the text label "x5chain"
+    chain = headers.get(HEADER_X5CHAIN, headers.get("x5chain"))
+
+    if chain is None:
+        return ()
+    if isinstance(chain, bytes):
+        return (chain,)
+    return tuple(bytes(cert) for cert in chain)
+
+
+def sig_structure(sign1, payload, external_aad=b""):
+    """The bytes a COSE_Sign1 signature is computed over (RFC 9052 4.4)."""
+    return cbor2.dumps(["Signature1", sign1.protected, external_aad, bytes(payload)])
+
+
+def verify_signature(public_key, alg, message, signature):
+    """True if signature (COSE encoding) is valid for message under public_key."""
+    _, scheme, hash_name = ALGORITHMS[alg]
+    digest = getattr(hashes, hash_name.upper())() if hash_name else None
+
+    try:
+        if scheme == "ecdsa":
+            # COSE carries r || s, cryptography expects DER
+            half = len(signature) // 2
+            r, s = int.from_bytes(signature[:half], "big"), int.from_bytes(signature[half:], "big")
+            public_key.verify(encode_dss_signature(r, s), message, ec.ECDSA(digest))
+        elif scheme == "pss":
+            pss = padding.PSS(mgf=padding.MGF1(digest), salt_length=digest.digest_size)
+            public_key.verify(signature, message, pss, digest)
+        else:
+            public_key.verify(signature, message)
+    except (InvalidSignature, TypeError, ValueError):
+        return False
+
+    return True
+
+
+# ------------------------------------------------
+# Time-stamps
+# ------------------------------------------------
+# A time-stamp token (or the TimeStampResp wrapping it) is CMS SignedData
+# over a TSTInfo: the time-stamping authority (TSA) signs the hash of the
+# time-stamped bytes (messageImprint) and the time (genTime). Its time is
+# only taken once the TSA signature, the TSA chain and the imprint all
+# check out. Tokens are read with a minimal DER walk of the few RFC 3161 /
+# RFC 5652 fields needed rather than a full ASN.1 parser.
+
+def _der_items(data):
+    """(tag, content, encoding) of the DER elements laid end to end in data; stops at malformed input."""
+    pos = 0
+
+    while pos + 2 <= len(data):
+        start = pos
+        tag, length = data[pos], data[pos + 1]
+        pos += 2
+
+        if length & 0x80:
+            size = length & 0x7F
+            if not 0 < size <= 4 or pos + size > len(data):
+                return
+            length = int.from_bytes(data[pos:pos + size], "big")
+            pos += size
+
+        if pos + length > len(data):
+            return
+
+        yield tag, data[pos:pos + length], data[start:pos + length]
+        pos += length
+
+
+def _der_children(data):
+    return list(_der_items(data))
+
+
+def _der_oid(content):
+    """Dotted string of an OBJECT IDENTIFIER's content."""
+    arcs, value = [], 0
+    for byte in content:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            arcs.append(value)
+            value = 0
+
+    if not arcs:
+        return ""
+    first = min(arcs[0] // 40, 2)
+    return ".".join(map(str, [first, arcs[0] - 40 * first] + arcs[1:]))
+
+
+def _der_algorithm(content):
+    """Dotted OID of an AlgorithmIdentifier's content."""
+    items = _der_children(content)
+    return _der_oid(items[0][1]) if items and items[0][0] == DER_OID else ""
+
+
+def _parse_generalized_time(text):
+    """UTC datetime of a YYYYMMDDHHMMSS[.fff]Z GeneralizedTime, or None."""
+    try:
+        text = text.decode("ascii")
+        if not text.endswith("Z"):
+            return None
+        return datetime.strptime(text[:14], "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+    except (UnicodeDecodeError, ValueError):
+        return None
+
+
+def _digest(oid, data):
+    """Hash of data under a digest algorithm OID, or None if unsupported."""
+    name = DIGESTS.get(oid)
+    if name is None:
+        return None
+    hasher = hashes.Hash(getattr(hashes, name.upper())())
+    hasher.update(bytes(data))
+    return hasher.finalize()
+
+
+def _verify_cms_signature(public_key, digest_oid, signature_oid, message, signature):
+    """True if a CMS SignerInfo signature is valid for message under public_key."""
+    name = DIGESTS.get(digest_oid)
+    digest = getattr(hashes, name.upper())() if name else None
+
+    try:
+        if isinstance(public_key, ed25519.Ed25519PublicKey):
+            public_key.verify(signature, message)
+        elif digest is None:
+            return False
+        elif isinstance(public_key, ec.EllipticCurvePublicKey):
+            # CMS carries ECDSA signatures DER encoded already
+            public_key.verify(signature, message, ec.ECDSA(digest))
+        elif signature_oid == RSASSA_PSS:
+            public_key.verify(signature, message, padding.PSS(padding.MGF1(digest), padding.PSS.AUTO), digest)
+        else:
+            public_key.verify(signature, message, padding.PKCS1v15(), digest)
+    except (InvalidSignature, TypeError, ValueError, AttributeError):
+        return False
+
+    return True
+
+
+def _signed_data(token):
+    """Children of the SignedData of a token or TimeStampResp, or None."""
+    items = _der_children(token)
+    if len(items) != 1 or items[0][0] != DER_SEQUENCE:
+        return None
+
+    content_info = _der_children(items[0][1])
+    # TimeStampResp: status, then the token itself
+    if content_info and content_info[0][0] == DER_SEQUENCE:
+        if len(content_info) < 2:
+            return None
+        content_info = _der_children(content_info[1][1])
+
+    if len(content_info) < 2 or content_info[0][0] != DER_OID or _der_oid(content_info[0][1]) != CMS_SIGNED_DATA:
+        return None
+
+    wrapped = _der_children(content_info[1][1])
+    if content_info[1][0] != DER_CONTEXT_0 or len(wrapped) != 1 or wrapped[0][0] != DER_SEQUENCE:
+        return None
+
+    return _der_children(wrapped[0][1])
+
+
+def _tst_info(encapsulated):
+    """DER TSTInfo of the SignedData's encapsulated content, or None."""
+    items = _der_children(encapsulated)
+    if len(items) != 2 or items[0][0] != DER_OID or _der_oid(items[0][1]) != CMS_TST_INFO:
+        return None
+
+    wrapped = _der_children(items[1][1])
+    if items[1][0] != DER_CONTEXT_0 or len(wrapped) != 1 or wrapped[0][0] != DER_OCTET_STRING:
+        return None
+
+    return bytes(wrapped[0][1])
+
+
+def _signer_certificate(signer_info, tst_info, certificates):
+    """
+    Certificate whose key signed the SignerInfo's signed attributes, once
+    they bind to tst_info (contentType TSTInfo, messageDigest its hash),
+    or None.
+    """
+    items = _der_children(signer_info)
+    if len(items) < 6 or items[3][0] != DER_CONTEXT_0:
+        return None
+
+    digest_oid, signature_oid = _der_algorithm(items[2][1]), _der_algorithm(items[4][1])
+    attributes = {}
+    for tag, content, _ in _der_children(items[3][1]):
+        attribute = _der_children(content)
+        if tag == DER_SEQUENCE and len(attribute) == 2 and attribute[0][0] == DER_OID:
+            values = _der_children(attribute[1][1])
+            attributes[_der_oid(attribute[0][1])] = values[0] if len(values) == 1 else None
+
+    content_type, message_digest = attributes.get(CMS_CONTENT_TYPE), attributes.get(CMS_MESSAGE_DIGEST)
+    if content_type is None or content_type[0] != DER_OID or _der_oid(content_type[1]) != CMS_TST_INFO:
+        return None
+    if message_digest is None or message_digest[0] != DER_OCTET_STRING:
+        return None
+
+    expected = _digest(digest_oid, tst_info)
+    if expected is None or bytes(message_digest[1]) != expected:
+        return None
+
+    # The signature covers the attributes with their SET OF tag, not [0]
+    signed = bytes([DER_SET]) + bytes(items[3][2][1:])
+    signature = bytes(items[5][1])
+
+    for certificate in certificates:
+        if _verify_cms_signature(certificate.public_key(), digest_oid, signature_oid, signed, signature):
+            return certificate
+
+    return None
+
+
+def _issuer_path(leaf, certificates):
+    """leaf followed by its issuers among certificates, as far as they go."""
+    path = [leaf]
+
+    while len(path) <= len(certificates):
+        current = path[-1]
+        if current.issuer == current.subject:
+            break
+        issuer = next((c for c in certificates if c not in path and c.subject == current.issuer and _issued_by(current, c)), None)
+        if issuer is None:
+            break
+        path.append(issuer)
+
+    return path
+
+
+def verify_timestamp(token, messages, anchors_path):
+    """
+    genTime of an RFC 3161 time-stamp token (or TimeStampResp), or None
+    unless all of these hold: the TSA signature over the TSTInfo verifies,
+    the TSA certificate is a time-stamping certificate whose chain (from the
+    certificates in the token) leads to a trust anchor at anchors_path and
+    is valid at genTime, and the messageImprint is the hash of one of
+    messages.
+    """
+    signed_data = _signed_data(bytes(token))
+    if not signed_data or len(signed_data) < 4:
+        return None
+
+    tst_info = _tst_info(signed_data[2][1])
+    if tst_info is None:
+        return None
+
+    certificates = []
+    for tag, content, _ in signed_data[3:]:
+        if tag != DER_CONTEXT_0:
+            continue
+        for cert_tag, _, encoding in _der_children(content):
+            if cert_tag == DER_SEQUENCE:
+                try:
+                    certificates.append(x509.load_der_x509_certificate(bytes(encoding)))
+                except ValueError:
+                    pass
+
+    signer_infos = signed_data[-1]
+    if signer_infos[0] != DER_SET:
+        return None
+
+    signer = None
+    for tag, content, _ in _der_children(signer_infos[1]):
+        if tag == DER_SEQUENCE:
+            signer = _signer_certificate(content, tst_info, certificates)
+        if signer is not None:
+            break
+    if signer is None:
+        return None
+
+    # TSTInfo: version, policy, messageImprint, serialNumber, genTime, ...
+    items = _der_children(tst_info)
+    fields = _der_children(items[0][1]) if len(items) == 1 and items[0][0] == DER_SEQUENCE else []
+    if len(fields) < 5 or fields[2][0] != DER_SEQUENCE or fields[4][0] != DER_GENERALIZED_TIME:
+        return None
+
+    imprint = _der_children(fields[2][1])
+    if len(imprint) != 2 or imprint[1][0] != DER_OCTET_STRING:
+        return None
+
+    hash_oid, hashed = _der_algorithm(imprint[0][1]), bytes(imprint[1][1])
+    if not any(_digest(hash_oid, message) == hashed for message in messages):
+        return None
+
+    when = _parse_generalized_time(bytes(fields[4][1]))
+    if when is None:
+        return None
+
+    der = tuple(c.public_bytes(serialization.Encoding.DER) for c in _issuer_path(signer, certificates))
+    chain = verify_chain(der, anchors_path, TSA_EKUS)
+    if not chain.trusted or not chain_valid_at(chain, when):
+        return None
+
+    return when
+
+
+def timestamp_messages(sign1, payload):
+    """
+    Bytes a C2PA time-stamp may cover: the COSE signature value (C2PA 2.x
+    sigTst2) or the RFC 9052 countersignature structure over the signed
+    payload (C2PA 1.x sigTst). Either binds the time to this signature.
+    """
+    countersigned = cbor2.dumps(["CounterSignature", sign1.protected, b"", b"", bytes(payload)])
+    return bytes(sign1.signature), countersigned
+
+
+def signing_time(sign1, payload, anchors_path):
+    """
+    Time of the signature's first RFC 3161 time-stamp (sigTst2 / sigTst
+    header) that verify_timestamp accepts for this signature, or None. The
+    headers are unprotected, so an unverified token is ignored rather than
+    trusted.
+    """
+    messages = timestamp_messages(sign1, payload)
+
+    for label in HEADER_TIMESTAMPS:
+        timestamps = sign1.headers.get(label)
+        tokens = timestamps.get("tstTokens") if isinstance(timestamps, dict) else None
+
+        for token in tokens or []:
+            value = token.get("val") if isinstance(token, dict) else None
+            if not isinstance(value, bytes):
+                continue
+            when = verify_timestamp(value, messages, anchors_path)
+            if when is not None:
+                return when
+
+    return None
+
+
+# ------------------------------------------------
+# Certificate chains
+# ------------------------------------------------
+
+# Extended key usages a C2PA claim signer may carry: email protection and
+# document signing (C2PA 1.x), C2PA claim signing and Microsoft's C2PA
+# signing purpose. anyExtendedKeyUsage is deliberately not accepted.
+SIGNER_EKUS = (
+    "1.3.6.1.5.5.7.3.4",
+    "1.3.6.1.5.5.7.3.36",
+    "1.3.6.1.4.1.62558.2.1",
+    "1.3.6.1.4.1.311.76.59.1.9",
+)
+
+# The only purpose an RFC 3161 time-stamping authority signs tokens under
+TSA_EKUS = ("1.3.6.1.5.5.7.3.8",)
+
+
+def _anchors_stamp(path):
+    """(mtime, size) of the anchors file, so a rewritten bundle is read again."""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@lru_cache(maxsize=8)
+def _load_trust_anchors(path, stamp):
+    anchors = {}
+
+    if not path:
+        return anchors
+
+    try:
+        with open(path, "rb") as f:
+            certificates = x509.load_pem_x509_certificates(f.read())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not load C2PA trust anchors from {path}: {e}")
+        return anchors
+
+    for certificate in certificates:
+        anchors.setdefault(certificate.subject, []).append(certificate)
+
+    return anchors
+
+
+def load_trust_anchors(path):
+    """
+    Trust anchors of a PEM bundle, keyed by subject (empty without a path).
+    Cached per file modification time and size, so an updated bundle is
+    picked up on the next call.
+    """
+    return _load_trust_anchors(path, _anchors_stamp(path) if path else None)
+
+
+def _extension(certificate, oid):
+    try:
+        return certificate.extensions.get_extension_for_oid(oid).value
+    except x509.ExtensionNotFound:
+        return None
+
+
+def _issued_by(certificate, issuer):
+    try:
+        certificate.verify_directly_issued_by(issuer)
+    except (InvalidSignature, TypeError, ValueError):
+        return False
+    return True
+
+
+def _can_issue(issuer, below):
+    """
+    True if issuer may sign certificates: basicConstraints cA set, a path
+    length allowing the below intermediate CAs under it, and keyCertSign
+    when it restricts its key usage.
+    """
+    constraints = _extension(issuer, x509.oid.ExtensionOID.BASIC_CONSTRAINTS)
+    if constraints is None or not constraints.ca:
+        return False
+    if constraints.path_length is not None and below > constraints.path_length:
+        return False
+
+    usage = _extension(issuer, x509.oid.ExtensionOID.KEY_USAGE)
+    return usage is None or usage.key_cert_sign
+
+
+def _can_sign(leaf, purposes):
+    """
+    True if leaf carries keyUsage digitalSignature and an extended key usage
+    among purposes (C2PA certificate profile, RFC 3161 for time-stamping).
+    """
+    usage = _extension(leaf, x509.oid.ExtensionOID.KEY_USAGE)
+    if usage is None or not usage.digital_signature:
+        return False
+
+    extended = _extension(leaf, x509.oid.ExtensionOID.EXTENDED_KEY_USAGE)
+    return extended is not None and any(oid.dotted_string in purposes for oid in extended)
+
+
+def verify_chain(chain, anchors_path, purposes=SIGNER_EKUS):
+    """
+    Chain of a DER certificate chain (leaf first) against the trust anchors
+    at anchors_path: the leaf must be a signing certificate for one of
+    purposes, every certificate must be issued by the next one, every
+    issuer must be a CA, and the last one must be, or be issued by, a trust
+    anchor. Cached, so a signer seen before costs a dictionary lookup;
+    validity dates are left to chain_valid_at, since the time they are
+    checked at differs per signature.
+    """
+    stamp = _anchors_stamp(anchors_path) if anchors_path else None
+    return _verify_chain(tuple(chain), anchors_path, stamp, tuple(purposes))
+
+
+@lru_cache(maxsize=CHAIN_CACHE_SIZE)
+def _verify_chain(chain, anchors_path, stamp, purposes):
+    try:
+        certificates = [x509.load_der_x509_certificate(der) for der in chain]
+    except ValueError:
+        return Chain(False, None, None, None, None, "signingCredential.invalid")
+
+    if not certificates:
+        return Chain(False, None, None, None, None, "signingCredential.invalid")
+
+    leaf = certificates[0]
+    not_before = max(c.not_valid_before_utc for c in certificates)
+    not_after = min(c.not_valid_after_utc for c in certificates)
+    untrusted = lambda status: Chain(False, leaf.public_key(), leaf.subject.rfc4514_string(), not_before, not_after, status)
+
+    if not _can_sign(leaf, purposes):
+        return untrusted("signingCredential.invalid")
+
+    # certificates[i + 1] issues certificates[i] and has i intermediate CAs below it
+    for below, (certificate, issuer) in enumerate(zip(certificates, certificates[1:])):
+        if not _issued_by(certificate, issuer) or not _can_issue(issuer, below):
+            return untrusted("signingCredential.invalid")
+
+    anchors = _load_trust_anchors(anchors_path, stamp)
+    top = certificates[-1]
+    below = len(certificates) - 1
+
+    trusted = top in anchors.get(top.subject, []) or any(
+        _can_issue(anchor, below) and _issued_by(top, anchor) for anchor in anchors.get(top.issuer, [])
+    )
+
+    if not trusted:
+        return untrusted("signingCredential.untrusted")
+
+    return Chain(True, leaf.public_key(), leaf.subject.rfc4514_string(), not_before, not_after, None)
+
+
+def chain_valid_at(chain, when=None):
+    """
+    True if every certificate of the chain is valid at when: the signing
+    time (see signing_time) where the signature is time-stamped, else now.
+    """
+    when = when or datetime.now(timezone.utc)
+    return chain.not_before <= when <= chain.not_after
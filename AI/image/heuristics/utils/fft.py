@@ -0,0 +1,152 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "auto" picks pyFFTW, then scipy.fft, then numpy.fft
+FFT_BACKEND = os.getenv("FFT_BACKEND", "auto")
+FFT_WORKERS = int(os.getenv("FFT_WORKERS", os.cpu_count() or 1))
+
+
+# ------------------------------------------------
+# Backends
+# ------------------------------------------------
+# All transforms here take real input, so only the rfft family (and its
+# inverse) is exposed.
+# Each backend keeps its own plan cache keyed by shape/dtype/axes: scipy.fft
+# and numpy.fft cache pocketfft plans internally, pyFFTW's interfaces cache
+# is switched on below. float32 input stays single precision everywhere.
+
+def _numpy_backend():
+    return {
+        "rfft": lambda x, axis: np.fft.rfft(x, axis=axis),
+        "rfft2": lambda x, axes: np.fft.rfft2(x, axes=axes),
+        "irfft2": lambda x, s, axes: np.fft.irfft2(x, s=s, axes=axes),
+    }
+
+
+def _scipy_backend(workers):
+    import scipy.fft
+
+    return {
+        "rfft": lambda x, axis: scipy.fft.rfft(x, axis=axis, workers=workers),
+        "rfft2": lambda x, axes: scipy.fft.rfft2(x, axes=axes, workers=workers),
+        "irfft2": lambda x, s, axes: scipy.fft.irfft2(x, s=s, axes=axes, workers=workers),
+    }
+
+
+def _pyfftw_backend(workers):
+    import pyfftw
+    import pyfftw.interfaces.numpy_fft as fftw
+
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+
+    return {
+        "rfft": lambda x, axis: fftw.rfft(x, axis=axis, threads=workers),
+        "rfft2": lambda x, axes: fftw.rfft2(x, axes=axes, threads=workers),
+        "irfft2": lambda x, s, axes: fftw.irfft2(x, s=s, axes=axes, threads=workers),
+    }
+
+
+BACKENDS = {
+    "pyfftw": _pyfftw_backend,
+    "scipy": _scipy_backend,
+    "numpy": lambda workers: _numpy_backend(),
+}
+
+
+def load_backend(name=FFT_BACKEND, workers=FFT_WORKERS):
+    """Returns (backend_name, transforms) for the requested or first available backend."""
+    candidates = ["pyfftw", "scipy", "numpy"] if name == "auto" else [name, "numpy"]
+
+    for candidate in candidates:
+        if candidate not in BACKENDS:
+            logger.warning(f"Unknown FFT backend '{candidate}', falling back")
+            continue
+        try:
+            return candidate, BACKENDS[candidate](max(1, workers))
+        except ImportError:
+            continue
+
+    return "numpy", _numpy_backend()
+
+
+BACKEND, _TRANSFORMS = load_backend()
+
+
+def rfft(x, axis=-1):
+    """Real-input 1-D FFT, non-negative frequencies only."""
+    return _TRANSFORMS["rfft"](x, axis)
+
+
+def rfft2(x, axes=(-2, -1)):
+    """Real-input 2-D FFT; the last transformed axis keeps n // 2 + 1 bins."""
+    return _TRANSFORMS["rfft2"](x, axes)
+
+
+def irfft2(x, s, axes=(-2, -1)):
+    """Inverse of rfft2 back to real (..., *s) output."""
+    return _TRANSFORMS["irfft2"](x, s, axes)
+
+
+# ------------------------------------------------
+# Half plane -> full plane
+# ------------------------------------------------
+
+def full_plane(half, width):
+    """
+    Full (..., H, width) transform from an rfft2 half plane of real input,
+    using F(-ky, -kx) = conj(F(ky, kx)). Works on complex values and on
+    magnitudes alike.
+    """
+    missing = width - half.shape[-1]
+    if missing <= 0:
+        return half
+
+    rows = (-np.arange(half.shape[-2])) % half.shape[-2]
+    mirrored = half[..., rows, 1:missing + 1][..., ::-1]
+
+    if np.iscomplexobj(mirrored):
+        mirrored = np.conj(mirrored)
+
+    return np.concatenate([half, mirrored], axis=-1)
+
+
+def centered_magnitude(image):
+    """|fftshift(fft2(image))|, computed through the real-input transform."""
+    half = np.abs(rfft2(image))
+    return np.fft.fftshift(full_plane(half, image.shape[-1]), axes=(-2, -1))
+
+
+# ------------------------------------------------
+# Full-plane statistics on the half plane
+# ------------------------------------------------
+
+def half_plane_weights(n):
+    """
+    How often each of the n // 2 + 1 rfft bins appears in the full n-point
+    spectrum of a real signal; weighting by it gives exact full-plane sums
+    for any function of |F|.
+    """
+    weights = np.full(n // 2 + 1, 2.0)
+    weights[0] = 1.0
+    if n % 2 == 0:
+        weights[-1] = 1.0
+    return weights
+
+
+def half_plane_stats(values, n, axes=(-2, -1)):
+    """
+    Full-plane (mean, var) of values computed on an rfft half plane whose
+    last axis came from an n-point transform, reduced over axes.
+    """
+    weights = half_plane_weights(n)
+    total = np.sum(np.broadcast_to(weights, values.shape), axis=axes)
+
+    mean = np.sum(values * weights, axis=axes, dtype=np.float64) / total
+    centered = values - np.expand_dims(mean, axes).astype(values.dtype)
+    var = np.sum(centered * centered * weights, axis=axes, dtype=np.float64) / total
+
+    return mean, var
@@ -0,0 +1,305 @@
+import logging
+import threading
+import cv2
+import numpy as np
+import pywt
+from PIL import Image
+from io import BytesIO
+from .blocks import block_stats
+from .block_dct import block_dct
+from .jpeg_coefficients import read_jpeg_coefficients
+from .container import parse_container
+from . import fft
+from .pyramid import pyramid_level, downsample
+from .tiling import should_tile
+
+logger = logging.getLogger(__name__)
+
+
+# Named inputs a heuristic module can declare in its REQUIRES list, mapped to
+# the inputs each one is derived from. The scheduler uses this graph to warm
+# shared inputs once before the modules that need them start.
+INPUT_DEPENDENCIES = {
+    "rgb": (),
+    "bgr": ("rgb",),
+    "gray": (),
+    "gray_f32": ("gray",),
+    "rfft2": ("gray_f32",),
+    "magnitude": ("rfft2",),
+    "spectrum": ("magnitude",),
+    "yuv": ("rgb",),
+    "dwt2_haar": ("gray_f32",),
+    "dwt2_haar_u": ("yuv",),
+    "wavedec2_db4": ("gray_f32",),
+    "block_dct": ("gray_f32",),
+    "jpeg_coefficients": (),
+    "container": (),
+}
+
+
+class ImageContext:
+    """
+    Decode-once view of a pipeline image shared by every heuristic module.
+
+    Derived representations (gray, RGB, BGR, spectra, wavelet decompositions)
+    are computed lazily on first access and memoized for the rest of the job.
+    Memoization is thread-safe: concurrent modules asking for the same input
+    wait for a single computation instead of repeating it.
+    Arrays handed out are shared between modules and must be treated as
+    read-only; copy before modifying in place.
+
+    level(k) / level_for(max_pixels) return contexts for the octaves of an
+    area-averaged image pyramid built on demand; they share the source bytes
+    and metadata, carry their own input cache and record their scale.
+
+    tiled is set when the estimated full-frame working set of this image
+    exceeds the tiling threshold (utils.tiling); modules that support it
+    then process row bands instead of full-frame copies. It selects a mode,
+    it does not cap the job's memory.
+    """
+
+    def __init__(self, image_bytes, pil_image, image_format=None, exif=None, gray=None, tiling_threshold_mb=None):
+        self.bytes = image_bytes
+        self.pil = pil_image if pil_image.mode == "RGB" else pil_image.convert("RGB")
+        self.format = (image_format or "").lower()
+        self.exif = exif
+        self.width, self.height = self.pil.size
+
+        # Pyramid position; the native image is level 0 at scale 1
+        self.level_index = 0
+        self.scale = 1.0
+
+        self.tiling_threshold_mb = tiling_threshold_mb
+        self.tiled = should_tile(self.width, self.height, tiling_threshold_mb)
+
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+        if gray is not None:
+            self._cache["gray_f32"] = np.asarray(gray, dtype=np.float32)
+
+    @classmethod
+    def from_pipeline_image(cls, img, tiling_threshold_mb=None):
+        """Wraps the dict produced by downloader.prepare_pipeline_image."""
+        return cls(
+            image_bytes=img["bytes"],
+            pil_image=img["pil_image"],
+            image_format=img.get("format"),
+            exif=img.get("exif"),
+            gray=img.get("pixels_gray"),
+            tiling_threshold_mb=tiling_threshold_mb,
+        )
+
+    @classmethod
+    def from_bytes(cls, image_bytes):
+        image = Image.open(BytesIO(image_bytes))
+        return cls(image_bytes, image.convert("RGB"), image.format, image.getexif())
+
+    def __getstate__(self):
+        # Only the decoded source crosses process boundaries; derived arrays
+        # are cheaper to recompute than to pickle.
+        return {
+            "bytes": self.bytes,
+            "pil": self.pil,
+            "format": self.format,
+            "exif": dict(self.exif) if self.exif else None,
+            "tiling_threshold_mb": self.tiling_threshold_mb,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state["bytes"], state["pil"], state["format"], state["exif"],
+                      tiling_threshold_mb=state["tiling_threshold_mb"])
+
+    # ------------------------------------------------
+    # Memoization
+    # ------------------------------------------------
+
+    def memo(self, key, factory):
+        """Returns the cached value for key, computing it with factory() once."""
+        if key in self._cache:
+            return self._cache[key]
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            if key not in self._cache:
+                self._cache[key] = factory()
+            return self._cache[key]
+
+    def prepare(self, name):
+        """Computes the named input from INPUT_DEPENDENCIES."""
+        if name == "dwt2_haar":
+            return self.dwt2("haar")
+        if name == "dwt2_haar_u":
+            return self.dwt2("haar", plane="u")
+        if name == "wavedec2_db4":
+            return self.wavedec2("db4", level=4)
+        if name not in INPUT_DEPENDENCIES:
+            raise ValueError(f"Unknown image input: {name}")
+        return getattr(self, name)
+
+    # ------------------------------------------------
+    # Pyramid
+    # ------------------------------------------------
+
+    def level(self, k):
+        """Context for octave k of the image pyramid (0 is this image)."""
+        if k <= 0:
+            return self
+        return self.memo(("level", k), lambda: self._build_level(k))
+
+    def level_for(self, max_pixels):
+        """Largest pyramid level with at most max_pixels pixels (None = native)."""
+        return self.level(pyramid_level(self.width, self.height, max_pixels))
+
+    def _build_level(self, k):
+        parent = self.level(k - 1)
+
+        # Both planes are averaged from the parent level, never from a
+        # full-resolution float copy
+        rgb_f32 = downsample(parent._level_rgb())
+        gray_f32 = downsample(parent.gray_f32)
+        rgb = np.clip(np.rint(rgb_f32), 0, 255).astype(np.uint8)
+
+        child = ImageContext(self.bytes, Image.fromarray(rgb), self.format, self.exif, gray=gray_f32,
+                             tiling_threshold_mb=self.tiling_threshold_mb)
+        child.level_index = k
+        child.scale = child.width / self.width
+        child._cache["rgb_f32"] = rgb_f32
+
+        return child
+
+    def level_tiled(self, k):
+        """Whether level k is tiled, without building it (octaves floor both sides)."""
+        if k <= 0:
+            return self.tiled
+        return should_tile(self.width >> k, self.height >> k, self.tiling_threshold_mb)
+
+    def _level_rgb(self):
+        # Un-rounded float32 RGB for pyramid levels, uint8 RGB at native
+        return self._cache.get("rgb_f32", self.rgb)
+
+    # ------------------------------------------------
+    # Pixel representations
+    # ------------------------------------------------
+
+    @property
+    def rgb(self):
+        """uint8 (H, W, 3) RGB array."""
+        return self.memo("rgb", lambda: np.asarray(self.pil))
+
+    @property
+    def bgr(self):
+        """uint8 (H, W, 3) BGR array in OpenCV channel order."""
+        return self.memo("bgr", lambda: np.ascontiguousarray(self.rgb[..., ::-1]))
+
+    @property
+    def gray(self):
+        """uint8 (H, W) luma, identical to PIL's convert("L")."""
+        seeded = self._cache.get("gray_f32")
+        if seeded is not None:
+            return self.memo("gray", lambda: np.clip(np.rint(seeded), 0, 255).astype(np.uint8))
+        return self.memo("gray", lambda: np.asarray(self.pil.convert("L")))
+
+    @property
+    def gray_f32(self):
+        """float32 (H, W) luma in the 0-255 range."""
+        return self.memo("gray_f32", lambda: self.gray.astype(np.float32))
+
+    @property
+    def yuv(self):
+        """uint8 (H, W, 3) YUV as OpenCV's COLOR_BGR2YUV (what watermark embedders use)."""
+        return self.memo("yuv", lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2YUV))
+
+    def plane(self, name):
+        """float32 (H, W) plane: "gray", or the "y", "u" or "v" channel of yuv."""
+        if name == "gray":
+            return self.gray_f32
+        return self.memo(("plane", name), lambda: self.yuv[..., "yuv".index(name)].astype(np.float32))
+
+    # ------------------------------------------------
+    # Frequency representations
+    # ------------------------------------------------
+
+    @property
+    def rfft2(self):
+        """complex64 (H, W // 2 + 1) real-input FFT half plane of gray_f32."""
+        return self.memo("rfft2", lambda: fft.rfft2(self.gray_f32))
+
+    @property
+    def magnitude(self):
+        """
+        Centered full-plane FFT magnitude of the float32 gray image, mirrored
+        from the rfft2 half plane on first use.
+        """
+        return self.memo(
+            "magnitude",
+            lambda: np.fft.fftshift(fft.full_plane(np.abs(self.rfft2), self.width))
+        )
+
+    @property
+    def spectrum(self):
+        """Centered FFT log-spectrum, log(1 + |F|)."""
+        return self.memo("spectrum", lambda: np.log1p(self.magnitude))
+
+    @property
+    def block_dct(self):
+        """
+        (N, 8, 8) float32 DCT-II coefficients of every full 8x8 gray block,
+        level-shifted by 128 as in JPEG (see utils.block_dct.DC_OFFSET).
+        """
+        return self.memo("block_dct", lambda: block_dct(self.gray_f32))
+
+    @property
+    def jpeg_coefficients(self):
+        """
+        Quantized luma DCT coefficients and table stored in a JPEG bitstream
+        (utils.jpeg_coefficients), or None when the image is not a JPEG or
+        the optional reader is unavailable.
+        """
+        return self.memo("jpeg_coefficients", self._read_jpeg_coefficients)
+
+    @property
+    def container(self):
+        """
+        Single-pass index of the file's container (utils.container): format,
+        stored size and the metadata segments as memoryviews into bytes.
+        """
+        return self.memo("container", lambda: parse_container(self.bytes))
+
+    def _read_jpeg_coefficients(self):
+        if self.format != "jpeg":
+            return None
+
+        try:
+            return read_jpeg_coefficients(self.bytes)
+        except OSError as e:
+            logger.warning(f"JPEG coefficient reader failed, using pixel DCT: {e}")
+            return None
+
+    def dwt2(self, wavelet="haar", plane="gray"):
+        """Single-level 2D DWT of a float32 plane (see plane()): LL, (LH, HL, HH)."""
+        return self.memo(
+            ("dwt2", wavelet, plane),
+            lambda: pywt.dwt2(self.plane(plane), wavelet)
+        )
+
+    def wavedec2(self, wavelet="db4", level=4):
+        """Multi-level 2D wavelet decomposition of the float32 gray image."""
+        return self.memo(
+            ("wavedec2", wavelet, level),
+            lambda: pywt.wavedec2(self.gray_f32, wavelet, level=level)
+        )
+
+    # ------------------------------------------------
+    # Tile maps
+    # ------------------------------------------------
+
+    def tile_stats(self, block, stop=None):
+        """Per-tile float64 mean/variance maps of the gray image (utils.blocks)."""
+        return self.memo(
+            ("tile_stats", block, stop),
+            lambda: block_stats(self.gray_f32, block, stop)
+        )
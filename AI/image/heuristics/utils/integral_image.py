@@ -0,0 +1,133 @@
+import numpy as np
+
+
+# ------------------------------------------------
+# Summed-area tables
+# ------------------------------------------------
+
+def integral_image(image):
+    """
+    (H+1, W+1) summed-area table with a leading zero row and column, so the
+    sum of image[y:y+h, x:x+w] is
+    sat[y+h, x+w] - sat[y, x+w] - sat[y+h, x] + sat[y, x].
+    Integer images accumulate exactly in int64, everything else in float64.
+    """
+    dtype = np.int64 if np.issubdtype(image.dtype, np.integer) else np.float64
+
+    sat = np.zeros((image.shape[0] + 1, image.shape[1] + 1), dtype=dtype)
+    np.cumsum(image, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+
+    return sat
+
+
+def window_grid(shape, window, stride=1, stop=None):
+    """
+    Number of window origins along each axis.
+    Origins are range(0, stop, stride) per axis; stop defaults to the last
+    position where the window still fits (size - window + 1).
+    """
+    h, w = shape
+    wh, ww = window
+
+    stop_y, stop_x = stop if stop is not None else (h - wh + 1, w - ww + 1)
+    stop_y = min(stop_y, h - wh + 1)
+    stop_x = min(stop_x, w - ww + 1)
+
+    ny = len(range(0, max(stop_y, 0), stride))
+    nx = len(range(0, max(stop_x, 0), stride))
+
+    return ny, nx
+
+
+def window_sums(sat, window, stride=1, stop=None):
+    """(ny, nx) window sums read from a summed-area table in O(1) per window."""
+    wh, ww = window
+    ny, nx = window_grid((sat.shape[0] - 1, sat.shape[1] - 1), window, stride, stop)
+
+    y0 = slice(0, ny * stride, stride)
+    x0 = slice(0, nx * stride, stride)
+    y1 = slice(wh, wh + ny * stride, stride)
+    x1 = slice(ww, ww + nx * stride, stride)
+
+    return sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+
+
+# ------------------------------------------------
+# Windowed moments
+# ------------------------------------------------
+
+def window_raw_moments(image, window, stride=1, stop=None, max_order=2):
+    """
+    Raw moments E[(x - c)^k] for k = 1..max_order over every window, plus c.
+
+    Float images are shifted by their global mean c before accumulation so
+    the float64 tables don't lose the small per-window variances to
+    cancellation; integer images use c = 0 and exact int64 tables.
+    """
+    if isinstance(window, int):
+        window = (window, window)
+
+    if np.issubdtype(image.dtype, np.integer):
+        shift = 0.0
+        base = image.astype(np.int64)
+    else:
+        shift = float(np.mean(image, dtype=np.float64))
+        base = image.astype(np.float64) - shift
+
+    count = window[0] * window[1]
+    moments = []
+    power = base
+
+    for order in range(1, max_order + 1):
+        if order > 1:
+            power = power * base
+        sums = window_sums(integral_image(power), window, stride, stop)
+        moments.append(sums / count)
+
+    return moments, shift
+
+
+def central_moments(raw, shift):
+    """Converts raw moments about shift into (mean, m2, m3, m4) central moments."""
+    d = raw[0]
+    mean = d + shift
+
+    central = [mean]
+
+    if len(raw) >= 2:
+        central.append(np.maximum(raw[1] - d ** 2, 0.0))
+    if len(raw) >= 3:
+        central.append(raw[2] - 3 * d * raw[1] + 2 * d ** 3)
+    if len(raw) >= 4:
+        central.append(raw[3] - 4 * d * raw[2] + 6 * d ** 2 * raw[1] - 3 * d ** 4)
+
+    return central
+
+
+def window_mean_var(image, window, stride=1, stop=None):
+    """Per-window mean and population variance, each shaped (ny, nx)."""
+    raw, shift = window_raw_moments(image, window, stride, stop, max_order=2)
+    mean, var = central_moments(raw, shift)
+    return mean, var
+
+
+def window_stats(image, window, stride=1, stop=None):
+    """
+    Per-window mean, variance, std, skewness and (non-excess) kurtosis.
+    Flat windows get skewness 0 and kurtosis 0.
+    """
+    raw, shift = window_raw_moments(image, window, stride, stop, max_order=4)
+    mean, m2, m3, m4 = central_moments(raw, shift)
+
+    std = np.sqrt(m2)
+    flat = m2 <= 0
+    safe = np.where(flat, 1.0, m2)
+
+    return {
+        "mean": mean,
+        "variance": m2,
+        "std": std,
+        "skewness": np.where(flat, 0.0, m3 / safe ** 1.5),
+        "kurtosis": np.where(flat, 0.0, m4 / safe ** 2),
+    }
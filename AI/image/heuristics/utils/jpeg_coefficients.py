@@ -0,0 +1,52 @@
+import tempfile
+import numpy as np
+
+# libjpeg's coefficient reader through the optional jpeglib binding. Without
+# it, modules fall back to the block DCT of the decoded pixels.
+try:
+    import jpeglib
+except ImportError:
+    jpeglib = None
+
+
+def read_jpeg_coefficients(data):
+    """
+    Quantized luma DCT coefficients stored in a JPEG (baseline or
+    progressive), read with libjpeg's jpeg_read_coefficients, so the
+    entropy-coded data is decoded but never inverse transformed.
+
+    Returns {"luma": (rows, cols, 8, 8) int16, "luma_table": (8, 8) uint16}
+    with the blocks cropped to the full 8x8 blocks of the image, as
+    utils.block_dct does, or None when jpeglib isn't installed. Raises
+    OSError on streams libjpeg rejects.
+    """
+    if jpeglib is None:
+        return None
+
+    # jpeglib only reads from a path
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as f:
+        f.write(data)
+        f.flush()
+
+        jpeg = jpeglib.read_dct(f.name)
+        luma, tables, table_numbers = jpeg.Y, jpeg.qt, jpeg.quant_tbl_no
+
+    rows, cols = jpeg.height // 8, jpeg.width // 8
+
+    return {
+        "luma": np.ascontiguousarray(luma[:rows, :cols]),
+        "luma_table": tables[table_numbers[0]],
+    }
+
+
+def quantized_luma(jpeg):
+    """(N, 8, 8) int16 quantized luma coefficients in raster block order."""
+    return jpeg["luma"].reshape(-1, 8, 8)
+
+
+def dequantized_luma(jpeg):
+    """
+    (N, 8, 8) int32 dequantized luma coefficients in raster block order, in
+    the same level-shifted convention as utils.block_dct.
+    """
+    return quantized_luma(jpeg) * jpeg["luma_table"].astype(np.int32)
@@ -0,0 +1,74 @@
+import struct
+import numpy as np
+
+# JPEG quantization tables from the DQT segments the container index
+# (utils.container) collects ahead of the first scan
+
+# Natural (row-major) index of the k-th coefficient in zigzag order
+ZIGZAG = np.array([
+    0,  1,  8, 16,  9,  2,  3, 10,
+    17, 24, 32, 25, 18, 11,  4,  5,
+    12, 19, 26, 33, 40, 48, 41, 34,
+    27, 20, 13,  6,  7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36,
+    29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46,
+    53, 60, 61, 54, 47, 55, 62, 63,
+])
+
+# IJG reference luminance table (natural order), quality 50
+STANDARD_LUMA_TABLE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+]).reshape(8, 8)
+
+
+def parse_dqt(payload):
+    """{table_id: (8, 8) natural-order quantization table} of one DQT segment."""
+    tables = {}
+    i = 0
+
+    while i < len(payload):
+        precision, table_id = payload[i] >> 4, payload[i] & 0x0F
+        i += 1
+
+        if precision:
+            values = struct.unpack(">64H", payload[i:i + 128])
+            i += 128
+        else:
+            values = payload[i:i + 64]
+            i += 64
+
+        table = np.zeros(64, dtype=np.uint16)
+        table[ZIGZAG] = list(values)
+        tables[table_id] = table.reshape(8, 8)
+
+    return tables
+
+
+def read_quantization_tables(container):
+    """All DQT tables of a JPEG container index, later tables replacing earlier ones."""
+    tables = {}
+
+    for payload in container.tables:
+        tables.update(parse_dqt(payload))
+
+    return tables
+
+
+def estimate_quality(luma_table):
+    """Closest IJG quality factor (1-100) for a luminance quantization table."""
+    scale = np.mean(luma_table / STANDARD_LUMA_TABLE) * 100
+
+    if scale <= 100:
+        quality = (200 - scale) / 2
+    else:
+        quality = 5000 / scale
+
+    return float(np.clip(quality, 1, 100))
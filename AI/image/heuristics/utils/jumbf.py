@@ -0,0 +1,161 @@
+from collections import namedtuple
+
+# A box (ISO/IEC 19566-5 / ISO BMFF): type is the 4-char type, offset the
+# offset of the box header within the scanned buffer, data the payload
+# (after the header) as a memoryview
+Box = namedtuple("Box", ["type", "offset", "data"])
+
+# JPEG APP11 JUMBF segments: "JP", box instance number (2 bytes), packet
+# sequence number (4 bytes), then the box; continuation packets repeat the
+# box header before their slice of the payload
+JPEG_JUMBF_HEADER = 8
+
+
+# ------------------------------------------------
+# Boxes
+# ------------------------------------------------
+
+def iter_boxes(view, start=0, end=None):
+    """
+    Lazily yields the Boxes in view[start:end]. Only headers are read;
+    payloads are memoryview slices, so stepping over a large box (an
+    embedded thumbnail) costs nothing. Stops at the first malformed header.
+    """
+    end = len(view) if end is None else end
+    i = start
+
+    while i + 8 <= end:
+        length = int.from_bytes(view[i:i + 4], "big")
+        box_type = bytes(view[i + 4:i + 8]).decode("latin1")
+        header = 8
+
+        if length == 1:
+            if i + 16 > end:
+                return
+            length = int.from_bytes(view[i + 8:i + 16], "big")
+            header = 16
+        elif length == 0:
+            length = end - i
+
+        if length < header or i + length > end:
+            return
+
+        yield Box(box_type, i, view[i + header:i + length])
+        i += length
+
+
+class Superbox:
+    """
+    A JUMBF superbox ("jumb"): its description box ("jumd": type UUID,
+    toggles, optional label) and its child boxes, parsed on first access.
+    box_data is the full serialized superbox payload (after the header),
+    which is what C2PA hashes for hashed URIs.
+    """
+
+    def __init__(self, box):
+        self.offset = box.offset
+        self.box_data = box.data
+        self.uuid = None
+        self.label = None
+        self._children = None
+
+        description = next(iter_boxes(box.data), None)
+        if description is None or description.type != "jumd" or len(description.data) < 17:
+            return
+
+        self.uuid = bytes(description.data[:16])
+        toggles = description.data[16]
+
+        # Toggle bit 1: a null-terminated UTF-8 label follows
+        if toggles & 0x02:
+            label = bytes(description.data[17:]).split(b"\x00", 1)[0]
+            self.label = label.decode("utf-8", errors="replace")
+
+    @property
+    def children(self):
+        """Child boxes after the description box (superboxes wrapped)."""
+        if self._children is None:
+            boxes = list(iter_boxes(self.box_data))[1:]
+            self._children = [Superbox(b) if b.type == "jumb" else b for b in boxes]
+        return self._children
+
+    def child(self, label):
+        """First child superbox with the given label, or None."""
+        for child in self.children:
+            if isinstance(child, Superbox) and child.label == label:
+                return child
+        return None
+
+    def superboxes(self):
+        return [child for child in self.children if isinstance(child, Superbox)]
+
+    def content(self, box_type=None):
+        """Payload of the first content box (of box_type), or None."""
+        for child in self.children:
+            if not isinstance(child, Superbox) and (box_type is None or child.type == box_type):
+                return child.data
+        return None
+
+    def resolve(self, path):
+        """Descendant superbox at a "/"-separated label path, or None."""
+        node = self
+        for label in path.strip("/").split("/"):
+            node = node.child(label) if node is not None else None
+        return node
+
+
+# ------------------------------------------------
+# Containers
+# ------------------------------------------------
+
+def jpeg_jumbf(segments):
+    """
+    JUMBF boxes carried in JPEG APP11 segments, as buffers holding one
+    complete box each. A box split over several packets is reassembled
+    (the only copy made); a single-packet box stays a view of the file.
+    """
+    packets = {}
+
+    for segment in segments:
+        data = segment.data
+        if len(data) < JPEG_JUMBF_HEADER + 8 or bytes(data[:2]) != b"JP":
+            continue
+
+        instance = int.from_bytes(data[2:4], "big")
+        sequence = int.from_bytes(data[4:8], "big")
+        packets.setdefault(instance, []).append((sequence, data[JPEG_JUMBF_HEADER:]))
+
+    boxes = []
+    for instance, parts in sorted(packets.items()):
+        parts.sort(key=lambda part: part[0])
+
+        if len(parts) == 1:
+            boxes.append(parts[0][1])
+            continue
+
+        # Continuation packets repeat the (possibly extended) box header
+        header = 16 if int.from_bytes(parts[0][1][:4], "big") == 1 else 8
+        boxes.append(memoryview(b"".join([parts[0][1]] + [part[header:] for _, part in parts[1:]])))
+
+    return boxes
+
+
+def container_jumbf(container):
+    """
+    [(segment name, JUMBF superbox)] of a container index: JPEG APP11,
+    PNG caBX and WebP C2PA all carry the serialized superbox.
+    """
+    segments = container.find("jumbf")
+
+    if container.format == "jpeg":
+        buffers = [("APP11", view) for view in jpeg_jumbf(segments)]
+    else:
+        buffers = [(segment.name, segment.data) for segment in segments]
+
+    found = []
+    for name, view in buffers:
+        box = next(iter_boxes(view), None)
+        if box is not None and box.type == "jumb":
+            found.append((name, Superbox(box)))
+
+    return found
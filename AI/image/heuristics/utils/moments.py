@@ -0,0 +1,288 @@
+from math import comb
+import numpy as np
+from .integral_image import central_moments
+
+# Rows processed per step; keeps the float64 temporaries of a pass small
+CHUNK = 1 << 18
+
+LEVELS = 256
+
+
+# ------------------------------------------------
+# uint8 pixels
+# ------------------------------------------------
+
+def histogram_moments(hist, max_order=4):
+    """
+    (mean, m2, ..., m_max_order) central moments of the data behind
+    256-bin integer histograms, one value per histogram row.
+    """
+    values = np.arange(hist.shape[-1], dtype=np.float64)
+    count = np.maximum(hist.sum(axis=-1), 1)
+
+    mean = hist @ values / count
+    d = values - mean[..., None]
+
+    central = [mean]
+    power = d
+
+    for _ in range(2, max_order + 1):
+        power = power * d
+        central.append(np.sum(hist * power, axis=-1) / count)
+
+    return central
+
+
+class PixelStatistics:
+    """
+    Mergeable accumulator behind pixel_statistics: per-channel bincount
+    histograms and the Gram matrix of uint8 pixels. Parts of an image (row
+    bands, tiles) can be added or merged in any order; result() is exactly
+    pixel_statistics of the whole.
+    """
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.count = 0
+        self.hist = np.zeros(LEVELS * channels, dtype=np.int64)
+        self.gram = np.zeros((channels, channels))
+
+    def add(self, pixels, chunk=CHUNK):
+        """Accumulates (H, W) or (H, W, C) uint8 pixels in chunks."""
+        if pixels.dtype != np.uint8:
+            raise ValueError(f"pixel_statistics expects uint8 pixels, got {pixels.dtype}")
+
+        flat = pixels.reshape(-1, self.channels)
+        offsets = np.arange(self.channels, dtype=np.intp) * LEVELS
+
+        for start in range(0, len(flat), chunk):
+            block = flat[start:start + chunk]
+
+            self.hist += np.bincount((block + offsets).ravel(), minlength=LEVELS * self.channels)
+
+            values = block.astype(np.float64)
+            self.gram += values.T @ values
+
+        self.count += len(flat)
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.hist += other.hist
+        self.gram += other.gram
+        return self
+
+    def result(self):
+        """
+        Per-channel histograms (C, 256), the central moments (mean, m2, m3,
+        m4) derived exactly from them, per-channel min/max and the C x C
+        covariance matrix from the accumulated cross-moments.
+        """
+        hist = self.hist.reshape(self.channels, LEVELS)
+        central = histogram_moments(hist)
+        mean = central[0]
+
+        present = hist > 0
+        levels = np.arange(LEVELS)
+
+        return {
+            "count": self.count,
+            "histograms": hist,
+            "central": central,
+            "min": np.array([levels[p].min() if p.any() else 0 for p in present]),
+            "max": np.array([levels[p].max() if p.any() else 0 for p in present]),
+            "covariance": self.gram / max(self.count, 1) - np.outer(mean, mean),
+        }
+
+
+def pixel_statistics(pixels, chunk=CHUNK):
+    """
+    One chunked pass over (H, W) or (H, W, C) uint8 pixels, see
+    PixelStatistics.result.
+    """
+    channels = pixels.shape[2] if pixels.ndim == 3 else 1
+    return PixelStatistics(channels).add(pixels, chunk).result()
+
+
+def histogram_entropy(hist, value_range=255.0):
+    """
+    Entropy of integer histograms exactly as
+    np.histogram(x, bins=256, range=(0, value_range), density=True) would
+    weigh them (for 0-255 integers every value falls in its own bin).
+    """
+    count = np.maximum(hist.sum(axis=-1, keepdims=True), 1)
+    density = hist / (count * value_range / hist.shape[-1]) + 1e-12
+    return -np.sum(density * np.log2(density), axis=-1)
+
+
+# ------------------------------------------------
+# Arbitrary values
+# ------------------------------------------------
+
+def value_moments(values, max_order=4, chunk=CHUNK * 4, shift=None):
+    """
+    Raw moments E[(x - c)^k], k = 1..max_order, of any numeric array in one
+    chunked pass, plus the shift c (by default the mean of the first chunk,
+    which keeps the float64 power sums from cancelling).
+    """
+    flat = np.asarray(values).reshape(-1)
+
+    if not flat.size:
+        return [0.0] * max_order, shift or 0.0
+
+    if shift is None:
+        shift = float(np.mean(flat[:chunk], dtype=np.float64))
+    sums = np.zeros(max_order)
+
+    for start in range(0, flat.size, chunk):
+        d = flat[start:start + chunk].astype(np.float64)
+        d -= shift
+        power = d.copy()
+        sums[0] += power.sum()
+
+        for order in range(1, max_order):
+            power *= d
+            sums[order] += power.sum()
+
+    return list(sums / flat.size), shift
+
+
+def describe(central):
+    """
+    Mean, variance, std, skewness and (non-excess) kurtosis from
+    (mean, m2, m3, m4) central moments; flat data gets skewness and
+    kurtosis 0.
+    """
+    mean, m2, m3, m4 = central
+
+    std = np.sqrt(m2)
+    flat = m2 <= 0
+    safe = np.where(flat, 1.0, m2)
+
+    return {
+        "mean": mean,
+        "variance": m2,
+        "std": std,
+        "skewness": np.where(flat, 0.0, m3 / safe ** 1.5),
+        "kurtosis": np.where(flat, 0.0, m4 / safe ** 2),
+    }
+
+
+def value_central_moments(values, max_order=4):
+    """(mean, m2, ..., m_max_order) of an arbitrary array in a single pass."""
+    raw, shift = value_moments(values, max_order)
+    return central_moments(raw, shift)
+
+
+# ------------------------------------------------
+# Mergeable accumulators
+# ------------------------------------------------
+# Running statistics of a stream of arrays (row bands, tiles): adding every
+# part, or merging accumulators filled separately, gives the statistics of
+# the whole without holding it in memory.
+
+class RunningMoments:
+    """Count, power sums about a fixed shift, min and max of any values."""
+
+    def __init__(self, max_order=2):
+        self.max_order = max_order
+        self.count = 0
+        self.shift = 0.0
+        self.sums = np.zeros(max_order)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        flat = np.asarray(values).reshape(-1)
+        if not flat.size:
+            return self
+
+        # The first part fixes the shift every later part is summed about
+        raw, self.shift = value_moments(flat, self.max_order, shift=self.shift if self.count else None)
+
+        self.sums += np.asarray(raw) * flat.size
+        self.count += flat.size
+        self.min = min(self.min, float(flat.min()))
+        self.max = max(self.max, float(flat.max()))
+        return self
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.shift = other.shift
+
+        # Re-center the other power sums: (x - a)^k = ((x - b) + (b - a))^k
+        delta = other.shift - self.shift
+        power_sums = [other.count, *other.sums]
+
+        for k in range(1, self.max_order + 1):
+            self.sums[k - 1] += sum(comb(k, j) * power_sums[j] * delta ** (k - j) for j in range(k + 1))
+
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def central(self):
+        """(mean, m2, ...) central moments up to max_order (at most 4)."""
+        return central_moments(list(self.sums / max(self.count, 1)), self.shift)
+
+
+class RunningCovariance:
+    """Pearson correlation of paired values (a[i], b[i]) accumulated in parts."""
+
+    def __init__(self):
+        self.count = 0
+        self.shift = (0.0, 0.0)
+        # sum a, sum b, sum a^2, sum b^2, sum ab, all about the shift
+        self.sums = np.zeros(5)
+
+    def add(self, a, b):
+        a = np.asarray(a, dtype=np.float64).reshape(-1)
+        b = np.asarray(b, dtype=np.float64).reshape(-1)
+        if not a.size:
+            return self
+
+        if not self.count:
+            self.shift = (float(a.mean()), float(b.mean()))
+
+        a = a - self.shift[0]
+        b = b - self.shift[1]
+
+        self.sums += [a.sum(), b.sum(), a @ a, b @ b, a @ b]
+        self.count += a.size
+        return self
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        if not self.count:
+            self.shift = other.shift
+
+        da = other.shift[0] - self.shift[0]
+        db = other.shift[1] - self.shift[1]
+        n = other.count
+        sa, sb, saa, sbb, sab = other.sums
+
+        self.sums += [
+            sa + n * da,
+            sb + n * db,
+            saa + 2 * da * sa + n * da * da,
+            sbb + 2 * db * sb + n * db * db,
+            sab + db * sa + da * sb + n * da * db,
+        ]
+        self.count += n
+        return self
+
+    def covariance(self):
+        """(var a, var b, cov(a, b)) population (co)variances."""
+        n = max(self.count, 1)
+        ma, mb, maa, mbb, mab = self.sums / n
+        return maa - ma * ma, mbb - mb * mb, mab - ma * mb
+
+    def correlation(self, flat=np.nan):
+        """Pearson correlation; flat is returned when either side is constant."""
+        var_a, var_b, cov = self.covariance()
+        denominator = np.sqrt(var_a * var_b)
+        return float(cov / denominator) if denominator > 0 else flat
@@ -0,0 +1,127 @@
+import re
+from collections import namedtuple
+
+# One pattern occurrence: category and pattern as registered, [start, end)
+# the span in the scanned text
+Hit = namedtuple("Hit", ["category", "pattern", "start", "end"])
+
+
+# ------------------------------------------------
+# Compilation
+# ------------------------------------------------
+
+def trie_regex(words):
+    """
+    Regex matching any of words, with common prefixes factored out
+    ("stable diffusion", "stable cascade" -> "stable (?:diffusion|cascade)").
+    At each text position the engine only follows the branch of the next
+    character instead of trying every word, so matching cost grows with
+    the text, not with the number of words. The longest word wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def _prefixes(words):
+    """word -> the other words it starts with (hidden by the longest-match trie)."""
+    return {word: [other for other in words if other != word and word.startswith(other)] for word in words}
+
+
+class PatternMatcher:
+    """
+    Literal and regex patterns compiled once into a single alternation and
+    matched in one pass over the text.
+
+    patterns is a list of (category, pattern, is_regex). Literals go into a
+    prefix trie (trie_regex) and the regexes (no capturing groups) become
+    further alternatives. The alternation sits in a lookahead, so matches
+    at every position are seen, overlapping ones included. It only says
+    where something matched: the few matching positions are then resolved
+    by anchoring each regex and the trie there, and the literals a matched
+    literal starts with are precomputed. The hits are exactly what scanning
+    the text for every pattern separately would find. (Named groups per
+    alternative would resolve the pattern directly, but make every
+    position of the scan several times slower.)
+    """
+
+    def __init__(self, patterns):
+        self.literals = {}
+        self.regexes = []
+
+        for category, pattern, is_regex in patterns:
+            if is_regex:
+                compiled = re.compile(pattern)
+                if compiled.groups:
+                    raise ValueError(f"Pattern must not contain capturing groups: {pattern}")
+                self.regexes.append((category, pattern, compiled))
+            else:
+                self.literals.setdefault(pattern, []).append(category)
+
+        words = sorted(self.literals, key=len, reverse=True)
+        self._literal = re.compile(trie_regex(words)) if words else None
+        self._prefixes = _prefixes(words)
+
+        alternatives = [f"(?:{pattern})" for _, pattern, _ in self.regexes]
+        if words:
+            alternatives.append(self._literal.pattern)
+
+        self._combined = re.compile("(?=(?:" + "|".join(alternatives) + "))") if alternatives else None
+
+    def __len__(self):
+        return sum(len(c) for c in self.literals.values()) + len(self.regexes)
+
+    def _literal_hits(self, word, start):
+        for category in self.literals[word]:
+            yield Hit(category, word, start, start + len(word))
+
+        for prefix in self._prefixes[word]:
+            for category in self.literals[prefix]:
+                yield Hit(category, prefix, start, start + len(prefix))
+
+    def finditer(self, text):
+        """Every Hit in text, in order of position (overlapping hits included)."""
+        if self._combined is None:
+            return
+
+        for match in self._combined.finditer(text):
+            start = match.start()
+
+            for category, pattern, compiled in self.regexes:
+                found = compiled.match(text, start)
+                if found:
+                    yield Hit(category, pattern, start, found.end())
+
+            if self._literal is not None:
+                found = self._literal.match(text, start)
+                if found:
+                    yield from self._literal_hits(found.group(), start)
+
+    def search(self, text):
+        """
+        [{"category", "pattern", "count", "first"}] for every pattern found,
+        in order of first occurrence, which starts at first.
+        """
+        found = {}
+
+        for hit in self.finditer(text):
+            key = (hit.category, hit.pattern)
+            if key in found:
+                found[key]["count"] += 1
+            else:
+                found[key] = {"category": hit.category, "pattern": hit.pattern, "count": 1, "first": hit.start}
+
+        return list(found.values())
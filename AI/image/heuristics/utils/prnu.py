@@ -0,0 +1,261 @@
+import os
+import json
+import logging
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from . import fft
+
+logger = logging.getLogger(__name__)
+
+# Candidate fingerprints correlated per query (see FingerprintStore.candidates)
+PRNU_TOP_K = int(os.getenv("PRNU_TOP_K", 4))
+
+# Peak-to-correlation energy above which a fingerprint counts as matched
+# (the threshold commonly used for camera identification)
+PRNU_PCE_THRESHOLD = float(os.getenv("PRNU_PCE_THRESHOLD", 60))
+
+# Side of the centered square fingerprints are stored and matched on
+DEFAULT_CROP = 512
+
+# Pixels at or above this level are clipped, carry no PRNU and are masked
+SATURATION = 250
+
+# Neighborhood around the correlation peak left out of the PCE energy
+PEAK_NEIGHBORHOOD = 11
+
+INDEX_FILE = "index.json"
+
+# PIL EXIF tags naming the camera
+EXIF_MAKE = 0x010F
+EXIF_MODEL = 0x0110
+EXIF_IFD = 0x8769
+EXIF_BODY_SERIAL = 0xA431
+
+# One stored fingerprint: its row in the resolution's array and the camera
+# it was estimated for
+Fingerprint = namedtuple("Fingerprint", ["row", "camera", "make", "model", "images"])
+
+
+# ------------------------------------------------
+# Fingerprints
+# ------------------------------------------------
+
+def exif_camera(exif):
+    """(make, model) of a PIL EXIF mapping, None where missing."""
+    if not exif:
+        return None, None
+
+    def clean(value):
+        return str(value).strip("\x00 ") or None if value is not None else None
+
+    return clean(exif.get(EXIF_MAKE)), clean(exif.get(EXIF_MODEL))
+
+
+def crop_origin(height, width, size):
+    """(top, left) of the centered size x size crop, or None if the image is smaller."""
+    if height < size or width < size:
+        return None
+    return (height - size) // 2, (width - size) // 2
+
+
+def zero_mean(noise):
+    """Removes row and column means: the linear patterns every camera of a model shares."""
+    noise = noise - np.mean(noise, axis=-1, keepdims=True)
+    return noise - np.mean(noise, axis=-2, keepdims=True)
+
+
+def intensity(gray):
+    """Normalized intensity the PRNU term scales with; saturated pixels are zeroed."""
+    gray = np.asarray(gray, dtype=np.float32)
+    return np.where(gray >= SATURATION, 0, gray / 255).astype(np.float32)
+
+
+class FingerprintAccumulator:
+    """
+    Maximum-likelihood PRNU estimate K = sum(W I) / sum(I^2) over the noise
+    residuals W and intensities I of images from one camera (Chen et al.).
+    Images are added one at a time, so building a store keeps two crops in
+    memory per camera.
+    """
+
+    def __init__(self, size):
+        self.count = 0
+        self.numerator = np.zeros((size, size))
+        self.denominator = np.zeros((size, size))
+
+    def add(self, residual, gray):
+        level = intensity(gray)
+        self.numerator += residual * level
+        self.denominator += level * level
+        self.count += 1
+
+    def fingerprint(self):
+        """Zero-mean, unit-variance float32 fingerprint."""
+        k = zero_mean(self.numerator / np.maximum(self.denominator, 1e-6))
+        return (k / (np.std(k) + 1e-12)).astype(np.float32)
+
+
+def pce(xcorr, neighborhood=PEAK_NEIGHBORHOOD):
+    """
+    (pce, peak value, (dy, dx) peak shift) of (N, H, W) circular
+    cross-correlations: the squared peak over the mean squared correlation
+    outside a neighborhood of the peak.
+    """
+    n, height, width = xcorr.shape
+    flat = xcorr.reshape(n, -1)
+
+    index = np.argmax(flat, axis=1)
+    peak = flat[np.arange(n), index]
+    py, px = np.unravel_index(index, (height, width))
+
+    energy = np.einsum("ij,ij->i", flat, flat, dtype=np.float64)
+
+    half = neighborhood // 2
+    offsets = np.arange(-half, half + 1)
+    rows = (py[:, None, None] + offsets[None, :, None]) % height
+    cols = (px[:, None, None] + offsets[None, None, :]) % width
+    near = xcorr[np.arange(n)[:, None, None], rows, cols]
+    energy -= np.einsum("ijk,ijk->i", near, near, dtype=np.float64)
+
+    outside = height * width - neighborhood * neighborhood
+    values = peak.astype(np.float64) ** 2 * np.sign(peak) / np.maximum(energy / outside, 1e-30)
+
+    # Circular shifts past half the size are negative
+    shift = np.stack([(py + height // 2) % height - height // 2, (px + width // 2) % width - width // 2], axis=1)
+
+    return values, peak, shift
+
+
+# ------------------------------------------------
+# Store
+# ------------------------------------------------
+# A directory holding index.json (the crop size and, per "HxW" resolution,
+# the cameras in row order) and one "HxW.npy" float16 (N, crop, crop) array
+# per resolution, memory-mapped so only the rows a query touches are read.
+
+def resolution_key(height, width):
+    return f"{height}x{width}"
+
+
+class FingerprintStore:
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.crop = index.get("crop", DEFAULT_CROP)
+        self.fingerprints = {
+            key: [Fingerprint(row, e.get("camera"), e.get("make"), e.get("model"), e.get("images", 0))
+                  for row, e in enumerate(entries)]
+            for key, entries in index.get("resolutions", {}).items()
+        }
+        self._arrays = {}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.fingerprints.values())
+
+    def array(self, key):
+        """Memory-mapped (N, crop, crop) float16 fingerprints of a resolution."""
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.path, f"{key}.npy"), mmap_mode="r")
+        return self._arrays[key]
+
+    def candidates(self, height, width, model=None, top_k=PRNU_TOP_K):
+        """
+        Up to top_k Fingerprints to correlate against: those of the image's
+        resolution, the EXIF model's first, each group best estimated (most
+        images) first.
+        """
+        entries = self.fingerprints.get(resolution_key(height, width), [])
+        model = (model or "").strip().lower()
+
+        ranked = sorted(entries, key=lambda e: (not model or (e.model or "").strip().lower() != model, -e.images))
+        return ranked[:top_k]
+
+    def match(self, residual, gray, height, width, model=None, top_k=PRNU_TOP_K):
+        """
+        Matches the centered crop of a noise residual (and of the gray image
+        it came from) against the store. Each candidate K is correlated as
+        I K with the residual, all of them in one batched FFT; the result is
+        the best candidate by PCE with its normalized cross-correlation.
+        """
+        level = intensity(gray)
+        residual = zero_mean(np.asarray(residual, dtype=np.float32))
+
+        candidates = self.candidates(height, width, model, top_k)
+        if not candidates:
+            return {"matched": False, "candidates": 0, "reason": "no fingerprints for this resolution"}
+
+        key = resolution_key(height, width)
+        rows = np.array([e.row for e in candidates])
+        order = np.argsort(rows)
+
+        references = np.empty((len(rows), self.crop, self.crop), dtype=np.float32)
+        references[order] = self.array(key)[rows[order]]
+        references *= level
+        references = zero_mean(references)
+
+        shape = (self.crop, self.crop)
+        xcorr = fft.irfft2(fft.rfft2(references) * np.conj(fft.rfft2(residual)), shape)
+
+        values, peaks, shifts = pce(xcorr)
+
+        norms = np.sqrt(np.einsum("ijk,ijk->i", references, references, dtype=np.float64))
+        ncc = peaks / np.maximum(norms * np.linalg.norm(residual), 1e-12)
+
+        best = int(np.argmax(values))
+        entry = candidates[best]
+
+        return {
+            "matched": bool(values[best] >= PRNU_PCE_THRESHOLD),
+            "camera": entry.camera,
+            "make": entry.make,
+            "model": entry.model,
+            "pce": float(values[best]),
+            "ncc": float(ncc[best]),
+            "shift": [int(s) for s in shifts[best]],
+            "candidates": len(candidates),
+        }
+
+
+@lru_cache(maxsize=None)
+def load_store(path):
+    """FingerprintStore at path, opened once per process; None if unreadable."""
+    try:
+        return FingerprintStore(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not open PRNU fingerprint store at {path}: {e}")
+        return None
+
+
+def write_store(path, cameras, crop=DEFAULT_CROP):
+    """
+    Writes a store from cameras: dicts with camera, make, model, images,
+    height, width and a (crop, crop) fingerprint. Replaces any store at path.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    by_resolution = {}
+    for camera in cameras:
+        by_resolution.setdefault(resolution_key(camera["height"], camera["width"]), []).append(camera)
+
+    index = {"crop": crop, "resolutions": {}}
+
+    for key, group in sorted(by_resolution.items()):
+        array = np.lib.format.open_memmap(
+            os.path.join(path, f"{key}.npy"), mode="w+", dtype=np.float16, shape=(len(group), crop, crop)
+        )
+        for row, camera in enumerate(group):
+            array[row] = camera["fingerprint"]
+        array.flush()
+        del array
+
+        index["resolutions"][key] = [
+            {field: camera.get(field) for field in ("camera", "make", "model", "images")} for camera in group
+        ]
+
+    with open(os.path.join(path, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=1)
@@ -0,0 +1,36 @@
+import numpy as np
+
+# Analysis resolutions heuristic modules declare through MAX_PIXELS.
+# NATIVE modules see the decoded image untouched (sensor noise, JPEG grids,
+# ELA); the others get the largest pyramid level within their budget.
+NATIVE = None
+GLOBAL_MAX_PIXELS = 2_000_000    # global spectra, geometry, texture layout
+
+
+def pyramid_level(width, height, max_pixels):
+    """Index of the first octave level with at most max_pixels pixels (0 = native)."""
+    level = 0
+
+    if max_pixels is None:
+        return level
+
+    while (width >> level) * (height >> level) > max_pixels and min(width, height) >> (level + 1) > 0:
+        level += 1
+
+    return level
+
+
+def downsample(image):
+    """
+    Next octave of a (H, W[, C]) image: float32 mean of every 2x2 cell
+    (exact area averaging). An odd last row/column is dropped.
+    """
+    h, w = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+
+    out = image[0:h:2, 0:w:2].astype(np.float32)
+    out += image[1:h:2, 0:w:2]
+    out += image[0:h:2, 1:w:2]
+    out += image[1:h:2, 1:w:2]
+    out *= 0.25
+
+    return out
@@ -0,0 +1,356 @@
+import os
+import time
+import importlib
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from .image_context import INPUT_DEPENDENCIES
+from .pyramid import pyramid_level
+from .telemetry import measure, partial_result, timeout_record, HEURISTIC_TIME_BUDGET
+
+logger = logging.getLogger(__name__)
+
+HEURISTIC_WORKERS = int(os.getenv("HEURISTIC_WORKERS", os.cpu_count() or 1))
+HEURISTIC_EXECUTOR = os.getenv("HEURISTIC_EXECUTOR", "thread")
+
+# module_level default: the module's own MAX_PIXELS declaration
+DECLARED = object()
+
+# How often running tasks are checked against the time budget (seconds)
+BUDGET_POLL_INTERVAL = 0.05
+
+NATIVE_THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+]
+
+
+# ------------------------------------------------
+# Native thread limits
+# ------------------------------------------------
+
+def native_threads_per_worker(workers):
+    """Splits the cores between pool workers so BLAS/OpenCV don't oversubscribe."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def limit_native_threads(threads):
+    """
+    Caps the thread pools of OpenCV and the BLAS backing NumPy.
+    Environment variables only affect libraries loaded afterwards (e.g. in
+    spawned worker processes); already loaded pools are capped at runtime
+    when threadpoolctl is installed. The caps are process-wide, so this is
+    meant for process start (see configure_native_threads).
+    """
+    for var in NATIVE_THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads)
+    except ImportError:
+        pass
+
+
+_native_threads = None
+_native_threads_lock = threading.Lock()
+
+
+def configure_native_threads(workers=None):
+    """
+    Caps native threads once per process for a pool of workers
+    (HEURISTIC_WORKERS by default) and returns the cap. Concurrent jobs and
+    single-module runs share the process, so later calls keep the first cap
+    instead of overwriting each other's.
+    """
+    global _native_threads
+
+    with _native_threads_lock:
+        if _native_threads is None:
+            _native_threads = native_threads_per_worker(workers or HEURISTIC_WORKERS)
+            limit_native_threads(_native_threads)
+
+    return _native_threads
+
+
+# ------------------------------------------------
+# Task graph
+# ------------------------------------------------
+
+def input_closure(names):
+    """Returns the declared inputs plus everything they are derived from."""
+    closure = set()
+    stack = list(names)
+
+    while stack:
+        name = stack.pop()
+        if name in closure:
+            continue
+        if name not in INPUT_DEPENDENCIES:
+            raise ValueError(f"Unknown image input: {name}")
+        closure.add(name)
+        stack.extend(INPUT_DEPENDENCIES[name])
+
+    return closure
+
+
+def supports_tiling(module):
+    """Modules with a row-band mode declare the inputs it needs as TILED_REQUIRES."""
+    return hasattr(module, "TILED_REQUIRES")
+
+
+def module_requires(module, tiled=False):
+    """Inputs a module declares: TILED_REQUIRES on tiled levels, else REQUIRES."""
+    if tiled and supports_tiling(module):
+        return module.TILED_REQUIRES
+    return getattr(module, "REQUIRES", ())
+
+
+def module_level(module, ctx, max_pixels=DECLARED):
+    """
+    Pyramid level matching max_pixels, by default the module's declared
+    MAX_PIXELS (unset = native).
+    """
+    if max_pixels is DECLARED:
+        max_pixels = getattr(module, "MAX_PIXELS", None)
+    return pyramid_level(ctx.width, ctx.height, max_pixels)
+
+
+def module_levels(modules, ctx, resolutions=None):
+    """{result_key: pyramid level}; resolutions overrides MAX_PIXELS per key."""
+    resolutions = resolutions or {}
+    return {
+        key: module_level(module, ctx, resolutions.get(key, DECLARED))
+        for key, module in modules
+    }
+
+
+def build_tasks(modules, ctx, levels):
+    """
+    Builds {task_key: (fn, deps)} for the shared inputs and the modules.
+    Input tasks are keyed "input:<name>@<level>" and are shared by every
+    module analysing that pyramid level; module tasks by their result key.
+    Every task returns (result, telemetry record), see telemetry.measure.
+    """
+    tasks = {}
+
+    for level in set(levels.values()):
+        tiled = ctx.level_tiled(level)
+        required = input_closure(
+            name for key, module in modules if levels[key] == level
+            for name in module_requires(module, tiled)
+        )
+
+        for name in required:
+            key = f"input:{name}@{level}"
+            deps = [f"input:{d}@{level}" for d in INPUT_DEPENDENCIES[name]]
+            tasks[key] = (lambda key=key, n=name, k=level: measure(key, lambda: ctx.level(k).prepare(n)), deps)
+
+    for key, module in modules:
+        level = levels[key]
+        deps = [f"input:{d}@{level}" for d in module_requires(module, ctx.level_tiled(level))]
+        tasks[key] = (lambda key=key, m=module, k=level: measure(key, lambda: m.process(ctx.level(k))), deps)
+
+    return tasks
+
+
+def record_scales(ctx, modules, levels, telemetry):
+    """Adds the analysis scale and size each module ran at, and tiling, to telemetry."""
+    for key, module in modules:
+        level = levels[key]
+        # Every octave halves (flooring) both sides, so no level is built here
+        width, height = ctx.width >> level, ctx.height >> level
+        telemetry.setdefault(key, {}).update({
+            "scale": width / ctx.width,
+            "width": width,
+            "height": height,
+            "tiled": ctx.level_tiled(level) and supports_tiling(module),
+        })
+
+
+def run_graph(pool, tasks, budget=None):
+    """
+    Submits every task once its dependencies are done; returns
+    {key: (result, record)}.
+
+    With a budget (seconds), a task running longer than that is given up
+    on: it gets a timeout partial result and its dependents go ahead. The
+    worker itself can't be interrupted and finishes in the background.
+    """
+    pending = dict(tasks)
+    running = {}
+    started = {}
+    results = {}
+
+    while pending or running:
+        ready = [k for k, (_, deps) in pending.items() if all(d in results for d in deps)]
+
+        for key in ready:
+            fn, _ = pending.pop(key)
+            running[pool.submit(fn)] = key
+
+        if not running:
+            raise RuntimeError(f"Unresolvable heuristic dependencies: {sorted(pending)}")
+
+        finished, _ = wait(running, timeout=BUDGET_POLL_INTERVAL if budget else None, return_when=FIRST_COMPLETED)
+
+        for future in finished:
+            key = running.pop(future)
+            results[key] = future.result()
+
+        if not budget:
+            continue
+
+        now = time.monotonic()
+        for future, key in list(running.items()):
+            # A queued task's budget starts once a worker picks it up
+            if not future.running():
+                continue
+            elapsed = now - started.setdefault(future, now)
+            if elapsed > budget:
+                logger.warning(f"Heuristic {key} exceeded its {budget:g}s budget, skipping it")
+                running.pop(future)
+                results[key] = (partial_result("timeout", f"Exceeded {budget:g}s time budget"), timeout_record(elapsed))
+
+    return results
+
+
+# ------------------------------------------------
+# Executors
+# ------------------------------------------------
+
+def run_module(module, ctx, max_pixels=DECLARED):
+    """Runs one module on its pyramid level of ctx, in the calling thread."""
+    return module.process(ctx.level(module_level(module, ctx, max_pixels)))
+
+
+def _run_module(key, module_name, ctx, level):
+    return measure(key, lambda: importlib.import_module(module_name).process(ctx.level(level)))
+
+
+def run_threaded(modules, ctx, workers, budget, levels):
+    tasks = build_tasks(modules, ctx, levels)
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="heuristic")
+    try:
+        return run_graph(pool, tasks, budget)
+    finally:
+        # Timed-out modules are not waited for
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+_process_pool = None
+_process_pool_workers = None
+_process_pool_lock = threading.Lock()
+
+
+def process_pool(workers):
+    """
+    The process pool shared by every job, created on first use and again
+    only when the worker count changes or a worker process died. Each
+    worker caps its native threads once, at start.
+    """
+    global _process_pool, _process_pool_workers
+
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=limit_native_threads,
+                initargs=(native_threads_per_worker(workers),),
+            )
+            _process_pool_workers = workers
+        return _process_pool
+
+
+def _discard_process_pool(pool):
+    global _process_pool
+
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_processes(modules, ctx, workers, budget, levels):
+    # Each process rebuilds the inputs it needs from the pickled context, so
+    # there is no input warm-up stage here.
+    tasks = {
+        key: (partial(_run_module, key, module.__name__, ctx, levels[key]), [])
+        for key, module in modules
+    }
+
+    # Timed-out modules keep their worker busy until they finish; the pool
+    # outlives the job, so it is not shut down here
+    pool = process_pool(workers)
+    try:
+        return run_graph(pool, tasks, budget)
+    except BrokenProcessPool:
+        _discard_process_pool(pool)
+        raise
+
+
+def run(modules, ctx, workers=None, executor=None, telemetry=None, budget=None, resolutions=None):
+    """
+    Runs heuristic modules concurrently against a shared ImageContext.
+
+    modules is an ordered list of (result_key, module) pairs; each module
+    exposes process(ctx), may declare a REQUIRES list of ImageContext
+    inputs (TILED_REQUIRES for its row-band mode, see ImageContext.tiled)
+    and a MAX_PIXELS analysis budget, and is handed the matching
+    pyramid level of ctx (resolutions maps result keys to a MAX_PIXELS
+    that overrides the declared one, None meaning native). Returns
+    {result_key: result} in the same order.
+
+    Every module (and shared input) runs instrumented: one that raises or
+    exceeds the time budget (seconds, HEURISTIC_TIME_BUDGET by default)
+    yields a partial result with an "error" key instead of failing the
+    run. If a telemetry dict is passed, per-module wall/CPU time, memory
+    peak, status and analysis scale are recorded in it under "modules",
+    the shared inputs under "inputs" and the total under "wall_time".
+    """
+    workers = max(1, workers or HEURISTIC_WORKERS)
+    executor = executor or HEURISTIC_EXECUTOR
+    budget = HEURISTIC_TIME_BUDGET if budget is None else budget
+
+    wall = time.perf_counter()
+    levels = module_levels(modules, ctx, resolutions)
+
+    if executor == "process":
+        results = run_processes(modules, ctx, workers, budget, levels)
+    else:
+        if executor != "thread":
+            logger.warning(f"Unknown heuristic executor '{executor}', using threads")
+
+        configure_native_threads()
+
+        results = run_threaded(modules, ctx, workers, budget, levels)
+
+    if telemetry is not None:
+        module_records = telemetry.setdefault("modules", {})
+        input_records = telemetry.setdefault("inputs", {})
+
+        for key, (_, record) in results.items():
+            if key.startswith("input:"):
+                input_records[key[len("input:"):]] = record
+            else:
+                module_records[key] = record
+
+        record_scales(ctx, modules, levels, module_records)
+        telemetry["wall_time"] = round(telemetry.get("wall_time", 0) + time.perf_counter() - wall, 6)
+
+    return {key: results[key][0] for key, _ in modules}
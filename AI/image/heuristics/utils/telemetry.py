@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+import threading
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# One JSON line per job on this logger, for log-based metrics pipelines
+metrics_logger = logging.getLogger("image.heuristics.metrics")
+
+# Seconds a single module (or shared input) may run before its result is
+# given up on; 0 disables the budget
+HEURISTIC_TIME_BUDGET = float(os.getenv("HEURISTIC_TIME_BUDGET", 30))
+
+# tracemalloc peaks per module (NumPy buffers included). Off by default:
+# every allocation is traced, which slows allocation-heavy Python code
+HEURISTIC_TRACE_MEMORY = os.getenv("HEURISTIC_TRACE_MEMORY", "0").lower() in ("1", "true", "yes")
+
+# Attach the telemetry to the verdict under "telemetry"
+HEURISTIC_TELEMETRY = os.getenv("HEURISTIC_TELEMETRY", "0").lower() in ("1", "true", "yes")
+
+
+# ------------------------------------------------
+# Partial results
+# ------------------------------------------------
+
+def partial_result(status, message):
+    """Stand-in result of a module that raised or ran out of time."""
+    return {"error": message, "status": status}
+
+
+def failed(result):
+    """True for partial results and for modules that reported their own error."""
+    return isinstance(result, dict) and "error" in result
+
+
+# ------------------------------------------------
+# Memory peaks
+# ------------------------------------------------
+
+class MemoryTracker:
+    """
+    Shares tracemalloc between concurrently measured calls.
+
+    tracemalloc keeps one process-wide peak, so it is only reset when no
+    other measured call is running; a peak measured while other modules
+    ran concurrently covers their allocations too (an upper bound). With
+    one worker, in lazy mode and in worker processes it is exact.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._owned = False
+
+    def start(self):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owned = True
+            if self._active == 0:
+                tracemalloc.reset_peak()
+            self._active += 1
+            return tracemalloc.get_traced_memory()[0]
+
+    def stop(self, base):
+        with self._lock:
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else base
+            self._active -= 1
+            if self._active == 0 and self._owned:
+                tracemalloc.stop()
+                self._owned = False
+            return max(0, peak - base)
+
+
+_memory = MemoryTracker()
+
+
+# ------------------------------------------------
+# Instrumented runner
+# ------------------------------------------------
+
+def measure(name, fn, trace_memory=None):
+    """
+    Runs fn() and returns (result, record). An exception becomes a partial
+    result instead of propagating. record holds the status ("ok", "error"),
+    wall_time and cpu_time (calling thread, seconds) and, when traced,
+    memory_peak (bytes).
+    """
+    trace_memory = HEURISTIC_TRACE_MEMORY if trace_memory is None else trace_memory
+
+    base = _memory.start() if trace_memory else None
+    wall, cpu = time.perf_counter(), time.thread_time()
+
+    try:
+        result = fn()
+    except Exception as e:
+        logger.error(f"Heuristic {name} failed: {e}", exc_info=True)
+        result = partial_result("error", str(e))
+
+    record = {
+        "status": "error" if failed(result) else "ok",
+        "wall_time": round(time.perf_counter() - wall, 6),
+        "cpu_time": round(time.thread_time() - cpu, 6),
+    }
+
+    if base is not None:
+        record["memory_peak"] = _memory.stop(base)
+
+    return result, record
+
+
+def timeout_record(elapsed):
+    return {"status": "timeout", "wall_time": round(elapsed, 6)}
+
+
+# ------------------------------------------------
+# Reporting
+# ------------------------------------------------
+
+def summary(telemetry, slowest=3):
+    """One-line overview: total time and the slowest modules."""
+    modules = telemetry.get("modules", {})
+    ranked = sorted(modules.items(), key=lambda item: item[1].get("wall_time", 0), reverse=True)
+
+    parts = [f"{key} {record.get('wall_time', 0):.2f}s" for key, record in ranked[:slowest]]
+    problems = [f"{key}={record['status']}" for key, record in modules.items() if record.get("status") not in ("ok", None)]
+
+    mode = f"{telemetry.get('profile', '-')}, tiled" if telemetry.get("tiled") else telemetry.get("profile", "-")
+    line = f"heuristics [{mode}] {telemetry.get('wall_time', 0):.2f}s, slowest: {', '.join(parts)}"
+    if problems:
+        line += f", failed: {', '.join(problems)}"
+    return line
+
+
+def report(telemetry):
+    """Emits the job telemetry to the log and the metrics logger."""
+    logger.info(summary(telemetry))
+    metrics_logger.info(json.dumps({"event": "heuristic_telemetry", **telemetry}, default=str))
@@ -0,0 +1,61 @@
+import os
+
+# Tiling threshold (MB): images whose estimated full-frame working set
+# (estimated_peak_mb) exceeds it run the modules with a row-band mode in
+# row bands. It is not a bound on a job's memory: the decoded image, the
+# memoized shared inputs and pyramid levels stay whole, and modules run
+# concurrently. 0 disables tiling. HEURISTIC_MEMORY_LIMIT_MB is the former
+# name and is still read.
+HEURISTIC_TILING_THRESHOLD_MB = float(os.getenv(
+    "HEURISTIC_TILING_THRESHOLD_MB", os.getenv("HEURISTIC_MEMORY_LIMIT_MB", 1024)
+))
+
+# Pixels per row band in tiled mode
+HEURISTIC_TILE_PIXELS = int(os.getenv("HEURISTIC_TILE_PIXELS", 1 << 20))
+
+# Peak working memory of an untiled run per source pixel, measured on the
+# benchmark images (the pixel statistics, FFT and noise planes dominate)
+FULL_FRAME_BYTES_PER_PIXEL = 80
+
+# Band starts are multiples of this: whole JPEG MCUs (16x16 with 4:2:0
+# chroma) and 8x8 blockiness grids stay inside one band
+BAND_ALIGN = 16
+
+
+# ------------------------------------------------
+# Tiling decision
+# ------------------------------------------------
+
+def estimated_peak_mb(width, height):
+    """Estimated peak working memory (MB) of analysing width x height untiled."""
+    return width * height * FULL_FRAME_BYTES_PER_PIXEL / 2 ** 20
+
+
+def should_tile(width, height, tiling_threshold_mb=None):
+    """True when the estimated untiled working set of this size exceeds the tiling threshold."""
+    threshold = HEURISTIC_TILING_THRESHOLD_MB if tiling_threshold_mb is None else tiling_threshold_mb
+    return threshold > 0 and estimated_peak_mb(width, height) > threshold
+
+
+# ------------------------------------------------
+# Row bands
+# ------------------------------------------------
+
+def band_rows(width, tile_pixels=None, align=BAND_ALIGN):
+    """Rows per band: about tile_pixels pixels, rounded to a multiple of align."""
+    tile_pixels = tile_pixels or HEURISTIC_TILE_PIXELS
+    rows = tile_pixels // max(width, 1) // align * align
+    return max(rows, align)
+
+
+def row_bands(height, rows, halo=0):
+    """
+    Yields (top, bottom, start, stop) for consecutive row bands of an image
+    with height rows. [start, stop) are the rows a band is responsible for;
+    [top, bottom) additionally holds up to halo context rows on each side,
+    clipped to the image, so neighborhood operations see the same pixels as
+    on the full frame. Every row belongs to exactly one band's [start, stop).
+    """
+    for start in range(0, height, rows):
+        stop = min(start + rows, height)
+        yield max(start - halo, 0), min(stop + halo, height), start, stop
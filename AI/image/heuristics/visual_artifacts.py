@@ -1,13 +1,13 @@
 import json
 import numpy as np
-from PIL import Image
+from .utils.pyramid import GLOBAL_MAX_PIXELS
 
+REQUIRES = ["gray", "spectrum"]
+MAX_PIXELS = GLOBAL_MAX_PIXELS
+COST = 20
 
-def fft_features(gray):
 
-    f = np.fft.fft2(gray)
-    fshift = np.fft.fftshift(f)
-    magnitude = np.log(np.abs(fshift) + 1)
+def fft_features(magnitude):
 
     h, w = magnitude.shape
 
@@ -91,22 +91,9 @@ def symmetry_features(gray):
     }
 
 
-def texture_block_features(gray):
+def texture_block_features(tile_stats):
 
-    block_size = 32
-
-    h, w = gray.shape
-
-    block_vars = []
-
-    for y in range(0, h - block_size, block_size):
-        for x in range(0, w - block_size, block_size):
-
-            block = gray[y:y+block_size, x:x+block_size]
-
-            block_vars.append(np.var(block))
-
-    block_vars = np.array(block_vars)
+    block_vars = tile_stats["var"]
 
     return {
         "block_variance_mean": float(np.mean(block_vars)),
@@ -130,18 +117,19 @@ def intensity_features(gray):
     }
 
 
-def visual_artifacts_analysis(pil_image: Image.Image):
+def visual_artifacts_analysis(ctx):
 
-    gray = np.array(pil_image.convert("L")).astype("float")
+    gray = ctx.gray.astype("float")
+    h, w = gray.shape
 
     result = {
         "visual_artifact_features": {
-            "fft": fft_features(gray),
+            "fft": fft_features(ctx.spectrum),
             "noise": noise_features(gray),
             "gradient": gradient_features(gray),
             "edges": edge_features(gray),
             "symmetry": symmetry_features(gray),
-            "texture_blocks": texture_block_features(gray),
+            "texture_blocks": texture_block_features(ctx.tile_stats(32, stop=(h - 32, w - 32))),
             "intensity": intensity_features(gray)
         }
     }
@@ -149,7 +137,7 @@ def visual_artifacts_analysis(pil_image: Image.Image):
     return result
 
 
-def process(image_bytes):
-    result = visual_artifacts_analysis(image_bytes)
+def process(ctx):
+    result = visual_artifacts_analysis(ctx)
     # return json.dumps(result, indent=2)
     return result
\ No newline at end of file
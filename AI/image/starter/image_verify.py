@@ -1,7 +1,8 @@
 import logging
 import os
 from image import downloader
-from image.heuristics import heuristic_verify
+from image.heuristics import heuristic_verify, profiles
+from image.utils import verdict_index
 from image.sightengine import sightengine_verify
 from image.truthscan import truthscan_verify
 
@@ -9,12 +10,22 @@ logger = logging.getLogger(__name__)
 
 VERIFICATION_PIPELINE = ['sightengine', 'truthscan', 'heuristic']
 
-def verify(image_source):
+def verify(image_source, profile=None, tiling_threshold_mb=None):
     try:
+        # Capped profiles let JPEGs decode at a reduced DCT scale
+        max_pixels = heuristic_verify.decode_max_pixels(profile)
+
         if os.path.exists(image_source):
-            img = downloader.process_local(image_source)
+            img = downloader.process_local(image_source, max_pixels)
         else:
-            img = downloader.process(image_source)
+            img = downloader.process(image_source, max_pixels)
+
+        # Copies of an image verified before (resized, recompressed,
+        # re-hosted) reuse its verdict instead of running the pipeline again
+        profile_name = profiles.resolve(profile)
+        code, duplicate = verdict_index.lookup(img, profile_name)
+        if duplicate:
+            return duplicate
             
         last_error_reason = ""
         
@@ -26,12 +37,13 @@ def verify(image_source):
             elif method == 'truthscan':
                 result = truthscan_verify.verify(img)
             elif method == 'heuristic':
-                result = heuristic_verify.verify(img)
+                result = heuristic_verify.verify(img, profile=profile, tiling_threshold_mb=tiling_threshold_mb)
             else:
                 logger.warning(f"Unknown verification method: {method}")
                 continue
                 
             if result.get("mark") != "ERROR":
+                verdict_index.remember(code, result, profile_name)
                 return result
                 
             logger.warning(f"Method {method} failed: {result.get('reason')}. Falling back to next method...")
@@ -51,11 +51,20 @@ def process_job_data(client, job_data, source_name):
     image_url = job_data.get("image_url")
     image_hash = job_data.get("image_hash")
     retry = job_data.get("retry")
+    # Optional heuristic profile ("fast", "balanced", "forensic")
+    profile = job_data.get("profile")
+    # Optional per-job tiling threshold (MB), see HEURISTIC_TILING_THRESHOLD_MB;
+    # "memory_limit_mb" is its former name
+    tiling_threshold_mb = job_data.get("tiling_threshold_mb", job_data.get("memory_limit_mb"))
 
     logger.info(f"[{CONSUMER_NAME} | {source_name}] Processing Job: {jobId}")
 
     try:
-        result = verify(image_url)
+        result = verify(image_url, profile=profile, tiling_threshold_mb=tiling_threshold_mb)
+
+        if result.get("near_duplicate"):
+            logger.info(f"[{CONSUMER_NAME} | {source_name}] Job {jobId} reused the verdict of a near-duplicate "
+                        f"(distance {result['near_duplicate']['distance']})")
 
         payload = {
             "jobId": jobId,
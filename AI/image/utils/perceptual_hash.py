@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+# Every hash is HASH_SIZE x HASH_SIZE = 64 bits; image_code concatenates
+# the three into one CODE_BITS-bit integer
+HASH_SIZE = 8
+CODE_BITS = 3 * HASH_SIZE * HASH_SIZE
+
+# pHash keeps the 8x8 lowest frequencies of a 32x32 DCT
+PHASH_SIZE = 32
+
+# The image is area-reduced once to this square and every hash is taken
+# from it, instead of resampling the full frame per hash
+THUMBNAIL_SIZE = 128
+
+# Luma std below which an image is too flat to hash: its bits would be
+# noise, and flat images would all look like duplicates of each other
+MIN_STD = 2.0
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def _resize(gray, width, height):
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def phash(gray):
+    """DCT hash: the 8x8 lowest frequencies against their median (DC excluded)."""
+    low = cv2.dct(_resize(gray, PHASH_SIZE, PHASH_SIZE))[:HASH_SIZE, :HASH_SIZE]
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def dhash(gray):
+    """Gradient hash: whether each of 8x9 samples is brighter than its right neighbour."""
+    small = _resize(gray, HASH_SIZE + 1, HASH_SIZE)
+    return _pack(small[:, :-1] > small[:, 1:])
+
+
+def block_mean_hash(gray):
+    """Block-mean hash: the means of an 8x8 grid of blocks against their median."""
+    means = _resize(gray, HASH_SIZE, HASH_SIZE)
+    return _pack(means > np.median(means))
+
+
+def image_code(gray):
+    """
+    pHash, dHash and block-mean hash of a (H, W) luma image as one
+    CODE_BITS-bit integer, or None for images too small or flat to hash.
+    The hashes see the image at 32x32 or below, so resizes and
+    recompressions of one image land within a few bits of each other.
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    if gray.ndim != 2 or min(gray.shape) < HASH_SIZE + 1:
+        return None
+
+    thumbnail = _resize(gray, THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    if float(np.std(thumbnail)) < MIN_STD:
+        return None
+
+    bits = HASH_SIZE * HASH_SIZE
+    return (phash(thumbnail) << 2 * bits) | (dhash(thumbnail) << bits) | block_mean_hash(thumbnail)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from itertools import combinations
+
+from .perceptual_hash import CODE_BITS, hamming, image_code
+
+logger = logging.getLogger(__name__)
+
+# Past verdicts are reused for near-duplicate uploads (resizes,
+# recompressions, re-hosted copies of the same image). Off unless enabled:
+# a false match hands one image another image's verdict, so a deployment
+# should check VERDICT_INDEX_MAX_DISTANCE on its own traffic first
+# (benchmarks/verdict_index_report.py)
+VERDICT_INDEX = os.getenv("VERDICT_INDEX", "0").lower() in ("1", "true", "yes")
+
+# Shared Redis index across workers; without it each worker keeps its own
+VERDICT_INDEX_REDIS_URL = os.getenv("VERDICT_INDEX_REDIS_URL", "")
+
+# Hamming distance (of CODE_BITS) within which an image counts as a copy.
+# Measured on the dataset images (verdict_index_report.py): resizes down to
+# 0.1x, JPEG/WebP recompression down to q40, blur and tone changes stay
+# within 6 bits and 2% border crops within 17, while 5% crops reach 22-36.
+# The closest pair of different images (crops and mirrors of the same
+# photos) is 43 bits apart and the median 92. At 18 every copy but the 5%
+# crops is found (miss rate 5/75) and no different image matched (0/595)
+VERDICT_INDEX_MAX_DISTANCE = int(os.getenv("VERDICT_INDEX_MAX_DISTANCE", 18))
+
+# Substrings the code is split into for multi-index hashing
+VERDICT_INDEX_SUBSTRINGS = int(os.getenv("VERDICT_INDEX_SUBSTRINGS", 10))
+
+# Seconds a verdict stays reusable
+VERDICT_INDEX_TTL = int(os.getenv("VERDICT_INDEX_TTL", 7 * 24 * 3600))
+
+# Entries the in-process index holds before dropping the oldest (~2 kB
+# each); the Redis backend is the one meant for millions
+VERDICT_INDEX_MAX_ENTRIES = int(os.getenv("VERDICT_INDEX_MAX_ENTRIES", 200000))
+
+REDIS_PREFIX = "verdict_index"
+
+
+# ------------------------------------------------
+# Multi-index hashing
+# ------------------------------------------------
+# The code is split into m substrings with one exact-match table each. If
+# two codes are within distance r, one of their substrings is within
+# r // m (pigeonhole), so probing every table with the keys within r // m
+# of the query's substring finds every candidate. With m = 10 and r = 18
+# that is 9 x 20 + 22 probes (the last substring is 21 bits), whatever the
+# number of entries.
+
+def _flip_masks(bits, radius):
+    """Every bits-wide mask with at most radius bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(bits), r):
+            masks.append(sum(1 << p for p in positions))
+    return masks
+
+
+class MultiIndex:
+    """
+    Table keys of codes split into count substrings (the last one takes the
+    remainder bits), and the probes that find every code within
+    max_distance.
+    """
+
+    def __init__(self, count=VERDICT_INDEX_SUBSTRINGS, max_distance=VERDICT_INDEX_MAX_DISTANCE):
+        self.count = count
+        self.max_distance = max_distance
+
+        width = CODE_BITS // count
+        self.widths = [width] * (count - 1) + [CODE_BITS - width * (count - 1)]
+        self.shifts = [width * i for i in range(count)]
+        self._masks = {bits: _flip_masks(bits, max_distance // count) for bits in set(self.widths)}
+
+    def keys(self, code):
+        """(table, substring) of every substring of code."""
+        return [(i, (code >> shift) & ((1 << bits) - 1)) for i, (shift, bits) in enumerate(zip(self.shifts, self.widths))]
+
+    def probes(self, code):
+        """(table, substring) of every slot a code within max_distance shares with code."""
+        return [(i, key ^ mask) for i, key in self.keys(code) for mask in self._masks[self.widths[i]]]
+
+
+# ------------------------------------------------
+# Backends
+# ------------------------------------------------
+# Both store, per code, its verdict record and, per substring table, the
+# codes in each slot. Codes are kept as hex strings.
+
+class LocalBackend:
+    """
+    In-process index, oldest entries dropped beyond max_entries. Records
+    are kept serialized and a slot holding a single code (most of them)
+    stores it without a container, which keeps an entry around 2 kB.
+    """
+
+    def __init__(self, max_entries=VERDICT_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.records = OrderedDict()
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def members(self, probes):
+        with self._lock:
+            found = set()
+            for table, key in probes:
+                slot = self.tables.get(table, {}).get(key)
+                if slot is None:
+                    continue
+                if isinstance(slot, str):
+                    found.add(slot)
+                else:
+                    found.update(slot)
+            return found
+
+    def get(self, code):
+        with self._lock:
+            entry = self.records.get(code)
+            if entry is None or entry[1] <= time.time():
+                return None
+            return json.loads(entry[0])
+
+    def put(self, code, keys, record, ttl):
+        with self._lock:
+            if code not in self.records:
+                for table, key in keys:
+                    slots = self.tables.setdefault(table, {})
+                    slot = slots.get(key)
+                    if slot is None:
+                        slots[key] = code
+                    elif isinstance(slot, str):
+                        slots[key] = [slot, code]
+                    else:
+                        slot.append(code)
+
+            self.records[code] = (json.dumps(record), time.time() + ttl, tuple(keys))
+            self.records.move_to_end(code)
+
+            while len(self.records) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        old, (_, _, keys) = self.records.popitem(last=False)
+
+        for table, key in keys:
+            slots = self.tables[table]
+            slot = slots[key]
+            if isinstance(slot, str):
+                del slots[key]
+            else:
+                slot.remove(old)
+                if len(slot) == 1:
+                    slots[key] = slot[0]
+
+
+class RedisBackend:
+    """
+    Index shared by every worker: one set per table slot and one string per
+    verdict, all expiring after the TTL. Slots may keep codes whose verdict
+    expired; those are skipped at lookup.
+    """
+
+    def __init__(self, url, prefix=REDIS_PREFIX):
+        import redis
+
+        self.prefix = prefix
+        self.client = redis.from_url(url, decode_responses=True, socket_connect_timeout=2, socket_timeout=2)
+
+    def _slot(self, key):
+        return f"{self.prefix}:slot:{key[0]}:{key[1]:x}"
+
+    def _record(self, code):
+        return f"{self.prefix}:record:{code}"
+
+    def members(self, probes):
+        pipe = self.client.pipeline(transaction=False)
+        for probe in probes:
+            pipe.smembers(self._slot(probe))
+        return set().union(*pipe.execute())
+
+    def get(self, code):
+        record = self.client.get(self._record(code))
+        return json.loads(record) if record else None
+
+    def put(self, code, keys, record, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._record(code), json.dumps(record), ex=ttl)
+        for key in keys:
+            pipe.sadd(self._slot(key), code)
+            pipe.expire(self._slot(key), ttl)
+        pipe.execute()
+
+
+# ------------------------------------------------
+# Index
+# ------------------------------------------------
+
+class VerdictIndex:
+    """
+    Verdicts keyed by perceptual code (utils.perceptual_hash). lookup
+    returns the stored verdict of the nearest indexed code within
+    max_distance that was reached with the same heuristic profile.
+    """
+
+    def __init__(self, backend, max_distance=VERDICT_INDEX_MAX_DISTANCE,
+                 substrings=VERDICT_INDEX_SUBSTRINGS, ttl=VERDICT_INDEX_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.multi_index = MultiIndex(substrings, max_distance)
+
+    def lookup(self, code, profile=None):
+        """(verdict record, distance) of the nearest copy of code, or None."""
+        found = []
+
+        for member in self.backend.members(self.multi_index.probes(code)):
+            distance = hamming(code, int(member, 16))
+            if distance <= self.multi_index.max_distance:
+                found.append((distance, member))
+
+        for distance, member in sorted(found):
+            record = self.backend.get(member)
+            if record and record.get("profile") == profile:
+                return record, distance
+
+        return None
+
+    def add(self, code, record):
+        self.backend.put(f"{code:x}", self.multi_index.keys(code), record, self.ttl)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide VerdictIndex (Redis when configured, else local), or None when disabled."""
+    global _index
+
+    if not VERDICT_INDEX:
+        return None
+
+    with _index_lock:
+        if _index is None:
+            backend = RedisBackend(VERDICT_INDEX_REDIS_URL) if VERDICT_INDEX_REDIS_URL else LocalBackend()
+            _index = VerdictIndex(backend)
+
+    return _index
+
+
+def lookup(img, profile=None):
+    """
+    (code, verdict) of a pipeline image: its perceptual code and the verdict
+    stored for a near-duplicate of it, or None. Index failures count as a
+    miss, so the image is simply analysed.
+    """
+    index = get_index()
+    if index is None:
+        return None, None
+
+    code = image_code(img["pixels_gray"])
+    if code is None:
+        return None, None
+
+    try:
+        hit = index.lookup(code, profile)
+    except Exception as e:
+        logger.warning(f"Verdict index lookup failed: {e}")
+        return code, None
+
+    if hit is None:
+        return code, None
+
+    record, distance = hit
+    verdict = {key: record[key] for key in ("mark", "confidence", "reason")}
+    verdict["near_duplicate"] = {"distance": distance, "indexed_at": record.get("indexed_at")}
+
+    return code, verdict
+
+
+def remember(code, verdict, profile=None):
+    """Stores a final verdict for code (from lookup); errors and reused verdicts are not stored."""
+    index = get_index()
+    if index is None or code is None or verdict.get("mark") == "ERROR" or "near_duplicate" in verdict:
+        return
+
+    record = {
+        "mark": verdict.get("mark"),
+        "confidence": verdict.get("confidence"),
+        "reason": verdict.get("reason"),
+        "profile": profile,
+        "indexed_at": int(time.time()),
+    }
+
+    try:
+        index.add(code, record)
+    except Exception as e:
+        logger.warning(f"Verdict index update failed: {e}")